@@ -0,0 +1,115 @@
+"""
+Measure the startup latency of short-lived host processes: the import time
+of modules and, if a plugin library is given, the time of each step until
+the first cook (host creation, library load, describe, instance creation,
+first cook and a second cook for comparison).
+
+Each run happens in a fresh Python process, and the median over all runs is
+reported. Thresholds may be given to fail (with exit code 1) when startup
+gets slower, for instance in continuous integration:
+
+    python benchmark_startup.py path/to/plugins.ofx --runs 10 --max-import-ms 50 --max-first-cook-ms 100
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Code run in each child process. It prints a JSON dict of durations in ms.
+child_code = r'''
+import io, json, sys, time
+from contextlib import redirect_stdout
+modules, library, plugin_index = json.loads(sys.argv[1])
+timings = {}
+for module in modules:
+    start = time.perf_counter()
+    __import__(module)
+    timings[f"import {module}"] = (time.perf_counter() - start) * 1e3
+
+if library is not None:
+    from openmfx import OfxHost, OfxPluginLibrary, OfxEffectRunner, OfxMeshInternal
+    from openmfx import constants as kOfx
+    def mesh():
+        m = OfxMeshInternal()
+        m.point_count, m.corner_count, m.face_count = 4, 4, 1
+        m.allocate()
+        m.as_array(kOfx.MeshAttribPoint, kOfx.MeshAttribPointPosition)[:] = [(0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0)]
+        m.as_array(kOfx.MeshAttribCorner, kOfx.MeshAttribCornerPoint)[:] = [0, 1, 2, 3]
+        m.as_array(kOfx.MeshAttribFace, kOfx.MeshAttribFaceSize)[:] = [4]
+        return m
+    def step(name, f):
+        start = time.perf_counter()
+        result = f()
+        timings[name] = (time.perf_counter() - start) * 1e3
+        return result
+    with redirect_stdout(io.StringIO()):
+        host = step("host", OfxHost)
+        lib = step("load library", lambda: OfxPluginLibrary(library))
+        runner = OfxEffectRunner(host, lib.OfxGetPlugin(plugin_index))
+        step("load", runner.load)
+        step("describe", runner.describe)
+        instance = step("instance", runner.createInstance)
+        inputs = instance.internal.inputs
+        inputs[kOfx.MeshMainInput].mesh = mesh()
+        step("first cook", lambda: runner.cook(instance))
+        inputs[kOfx.MeshMainOutput].mesh = OfxMeshInternal()
+        step("second cook", lambda: runner.cook(instance))
+    timings["total to first cook"] = sum(
+        timings[k] for k in ("import openmfx", "host", "load library", "load", "describe", "instance", "first cook")
+        if k in timings
+    )
+print(json.dumps(timings))
+'''
+
+def run_once(modules, library, plugin_index):
+    root = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")])))
+    result = subprocess.run(
+        [sys.executable, "-c", child_code, json.dumps([modules, library, plugin_index])],
+        capture_output=True, text=True, env=env,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Benchmark process failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time and first cook latency of fresh host processes")
+    parser.add_argument("library", nargs="?", help="Plugin library used to measure the first cook")
+    parser.add_argument("--plugin-index", type=int, default=0)
+    parser.add_argument("--runs", type=int, default=5, help="Number of fresh processes")
+    parser.add_argument("--module", action="append", help="Module whose import time is measured (default: openmfx)")
+    parser.add_argument("--max-import-ms", type=float, help="Fail if the median import time of openmfx exceeds this")
+    parser.add_argument("--max-first-cook-ms", type=float, help="Fail if the median time from startup to first cook exceeds this")
+    args = parser.parse_args()
+
+    modules = args.module or ["openmfx"]
+    # The first cook and --max-import-ms both need the import time of openmfx
+    if (args.library is not None or args.max_import_ms is not None) and "openmfx" not in modules:
+        modules.insert(0, "openmfx")
+    library = os.path.abspath(args.library) if args.library is not None else None
+    runs = [run_once(modules, library, args.plugin_index) for _ in range(args.runs)]
+
+    medians = { name: statistics.median(run[name] for run in runs) for name in runs[0] }
+    print(f"{'step':<24} {'median (ms)':>12} {'min (ms)':>10} {'max (ms)':>10}")
+    for name, median in medians.items():
+        values = [run[name] for run in runs]
+        print(f"{name:<24} {median:>12.3f} {min(values):>10.3f} {max(values):>10.3f}")
+
+    failures = []
+    if args.max_import_ms is not None and medians["import openmfx"] > args.max_import_ms:
+        failures.append(f"import openmfx takes {medians['import openmfx']:.1f} ms > {args.max_import_ms} ms")
+    if args.max_first_cook_ms is not None:
+        total = medians.get("total to first cook")
+        if total is None:
+            parser.error("--max-first-cook-ms requires a plugin library")
+        if total > args.max_first_cook_ms:
+            failures.append(f"first cook takes {total:.1f} ms > {args.max_first_cook_ms} ms")
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,416 @@
+"""
+Compliance test runner for OpenMfx plugins.
+
+Every (library, plugin, scenario) combination is run in its own subprocess,
+so that a plugin crashing, hanging or eating up all the memory only fails its
+own test. Tests are dispatched to a pool of workers and the results are
+written as JSON and/or JUnit XML.
+
+Output meshes of cooks may also be compared to references recorded in a
+golden directory (see openmfx_diff.GoldenStore). Missing references are
+recorded, and --update-golden records all of them again.
+
+Usage:
+    python compliance.py [-j JOBS] [--timeout SECONDS] [--memory-limit MB]
+                         [--scenario NAME ...] [--json FILE] [--junit FILE]
+                         [--golden DIR [--update-golden]]
+                         LIBRARY_OR_DIRECTORY [...]
+"""
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import traceback
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+
+from openmfx import (
+    OfxHost, OfxPluginLibrary, OfxEffectRunner, OfxStatusError, status_name
+)
+from openmfx import constants as kOfx
+from openmfx_diff import GoldenStore
+from openmfx_generate import add_random_attributes, degenerate_meshes, grid, ngon_soup, sphere
+from openmfx_validate import validate_mesh
+
+RESULT_MARKER = "@@compliance-result@@ "
+
+# Set in the child process when outputs are checked against references
+golden_check = None
+
+# -----------------------------------------------------------------------------
+# Scenarios (run in the child process)
+
+def set_mesh(mesh, points, corners, face_sizes):
+    mesh.point_count = len(points)
+    mesh.corner_count = len(corners)
+    mesh.face_count = len(face_sizes)
+    mesh.allocate()
+    if points:
+        mesh.attributes[kOfx.MeshAttribPoint][kOfx.MeshAttribPointPosition].py_data[:] = points
+    if corners:
+        mesh.attributes[kOfx.MeshAttribCorner][kOfx.MeshAttribCornerPoint].py_data[:] = corners
+    if face_sizes:
+        mesh.attributes[kOfx.MeshAttribFace][kOfx.MeshAttribFaceSize].py_data[:] = face_sizes
+
+def set_inputs(py_instance, points, corners, face_sizes):
+    for name, mesh_input in py_instance.inputs.items():
+        if name != kOfx.MeshMainOutput:
+            set_mesh(mesh_input.mesh, points, corners, face_sizes)
+
+def check_output(py_instance):
+    """Check the main output mesh (see openmfx_validate), failing on errors"""
+    mesh = py_instance.inputs[kOfx.MeshMainOutput].mesh
+    report = validate_mesh(mesh, check_geometry=True)
+    if not report.ok:
+        raise AssertionError(str(report))
+
+class GoldenCheck:
+    """Compare the successive outputs of a test to the references of a store"""
+    def __init__(self, store, prefix):
+        self.store = store
+        self.prefix = prefix
+        self.cook_count = 0
+
+    def __call__(self, mesh):
+        key = f"{self.prefix}/{self.cook_count}"
+        self.cook_count += 1
+        diff = self.store.check(key, mesh)
+        if not diff.equal:
+            raise AssertionError(f"Output differs from golden reference '{key}':\n{diff}")
+
+def cook(runner, points=(), corners=(), face_sizes=(), tolerate_failure=False, params=None, input_mesh=None, check=True):
+    """
+    Cook a new instance on the given geometry, or on input_mesh if given
+    (shared by all inputs), and check its output unless check is False.
+    """
+    instance = runner.createInstance()
+    py_instance = instance.internal
+    if kOfx.MeshMainOutput not in py_instance.inputs:
+        raise AssertionError("Effect has no main output")
+    if input_mesh is not None:
+        for name, mesh_input in py_instance.inputs.items():
+            if name != kOfx.MeshMainOutput:
+                mesh_input.mesh = input_mesh
+    else:
+        set_inputs(py_instance, points, corners, face_sizes)
+    for name, value in (params or {}).items():
+        py_instance.params[name].value = value
+    try:
+        runner.cook(instance)
+        if check:
+            check_output(py_instance)
+        if golden_check is not None:
+            golden_check(py_instance.inputs[kOfx.MeshMainOutput].mesh)
+    except OfxStatusError as e:
+        if not (tolerate_failure and e.status == kOfx.StatFailed):
+            raise
+    runner.destroyInstance(instance)
+
+QUAD = (
+    [(-1.0, -1.0, 0.0), (1.0, -1.0, 0.0), (1.0, 1.0, 0.0), (-1.0, 1.0, 0.0)],
+    [0, 1, 2, 2, 0, 3],
+    [3, 3],
+)
+
+def scenario_load(runner):
+    runner.load()
+    runner.unload()
+
+def scenario_describe(runner):
+    descriptor = runner.describe()
+    if kOfx.MeshMainOutput not in descriptor.inputs:
+        raise AssertionError("Effect does not define a main output")
+
+def scenario_instance(runner):
+    instance = runner.createInstance()
+    runner.destroyInstance(instance)
+
+def scenario_cook(runner):
+    cook(runner, *QUAD)
+
+def scenario_empty_mesh(runner):
+    cook(runner, [], [], [], tolerate_failure=True)
+
+def scenario_degenerate_mesh(runner):
+    points = [(0.0, 0.0, 0.0), (0.0, 0.0, 0.0), (1.0, 0.0, 0.0), (2.0, 0.0, 0.0)]
+    corners = [0, 1, 2, 0, 2, 3, 3, 3, 3]  # coincident, colinear and repeated points
+    cook(runner, points, corners, [3, 3, 3], tolerate_failure=True)
+
+def scenario_param_extremes(runner):
+    descriptor = runner.describe()
+    extremes = {
+        kOfx.ParamTypeInteger: [-2**31, -1, 0, 2**31 - 1],
+        kOfx.ParamTypeDouble: [-1e30, -1.0, 0.0, 1e30],
+        kOfx.ParamTypeBoolean: [False, True],
+        kOfx.ParamTypeChoice: [0, 1000],
+    }
+    extremes[kOfx.ParamTypeInteger2D] = extremes[kOfx.ParamTypeInteger]
+    extremes[kOfx.ParamTypeInteger3D] = extremes[kOfx.ParamTypeInteger]
+    extremes[kOfx.ParamTypeDouble2D] = extremes[kOfx.ParamTypeDouble]
+    extremes[kOfx.ParamTypeDouble3D] = extremes[kOfx.ParamTypeDouble]
+    dims = {
+        kOfx.ParamTypeInteger2D: 2, kOfx.ParamTypeDouble2D: 2,
+        kOfx.ParamTypeInteger3D: 3, kOfx.ParamTypeDouble3D: 3,
+    }
+    for param in descriptor.params.values():
+        for value in extremes.get(param.type, []):
+            params = { param.name: [value] * dims.get(param.type, 1) }
+            cook(runner, *QUAD, tolerate_failure=True, params=params)
+
+def scenario_generated_meshes(runner):
+    meshes = {
+        "grid": grid(32, 32),
+        "sphere": sphere(16, 32),
+        "ngon_soup": add_random_attributes(ngon_soup(256)),
+    }
+    for name, mesh in meshes.items():
+        try:
+            cook(runner, input_mesh=mesh, tolerate_failure=True)
+        except AssertionError as e:
+            raise AssertionError(f"On generated mesh '{name}': {e}")
+
+def scenario_degenerate_cases(runner):
+    for name, mesh in degenerate_meshes():
+        # Outputs computed from invalid inputs (e.g. NaN positions) may be
+        # invalid as well, the plugin must just not crash.
+        try:
+            cook(runner, input_mesh=mesh, tolerate_failure=True, check=validate_mesh(mesh).ok)
+        except AssertionError as e:
+            raise AssertionError(f"On degenerate mesh '{name}': {e}")
+
+scenarios = {
+    "load": scenario_load,
+    "describe": scenario_describe,
+    "instance": scenario_instance,
+    "cook": scenario_cook,
+    "empty_mesh": scenario_empty_mesh,
+    "degenerate_mesh": scenario_degenerate_mesh,
+    "param_extremes": scenario_param_extremes,
+    "generated_meshes": scenario_generated_meshes,
+    "degenerate_cases": scenario_degenerate_cases,
+}
+
+def set_memory_limit(memory_limit_mb):
+    if memory_limit_mb is None:
+        return
+    try:
+        import resource
+    except ImportError:  # Windows
+        return
+    limit = memory_limit_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+def report(result):
+    sys.stdout.flush()
+    print(RESULT_MARKER + json.dumps(result), flush=True)
+
+def child_list(library_path, memory_limit_mb):
+    set_memory_limit(memory_limit_mb)
+    lib = OfxPluginLibrary(library_path)
+    plugins = []
+    for i in range(lib.OfxGetNumberOfPlugins()):
+        plugin = lib.OfxGetPlugin(i)
+        plugins.append({
+            "index": i,
+            "identifier": plugin.pluginIdentifier.decode(),
+            "api": plugin.pluginApi.decode(),
+            "api_version": plugin.apiVersion,
+        })
+    report({ "plugins": plugins })
+
+def child_run(library_path, plugin_index, scenario, memory_limit_mb, golden_dir=None, update_golden=False):
+    global golden_check
+    set_memory_limit(memory_limit_mb)
+    try:
+        host = OfxHost()
+        lib = OfxPluginLibrary(library_path)
+        plugin = lib.OfxGetPlugin(plugin_index)
+        runner = OfxEffectRunner(host, plugin)
+        if golden_dir is not None:
+            library_name = os.path.splitext(os.path.basename(library_path))[0]
+            prefix = f"{library_name}/{plugin.pluginIdentifier.decode()}/{scenario}"
+            golden_check = GoldenCheck(GoldenStore(golden_dir, update_golden), prefix)
+        scenarios[scenario](runner)
+        report({ "outcome": "passed", "message": "" })
+    except (OfxStatusError, AssertionError) as e:
+        report({ "outcome": "failed", "message": str(e), "details": traceback.format_exc() })
+    except MemoryError:
+        report({ "outcome": "failed", "message": "Memory limit exceeded", "details": traceback.format_exc() })
+    except Exception as e:
+        report({ "outcome": "error", "message": repr(e), "details": traceback.format_exc() })
+
+# -----------------------------------------------------------------------------
+# Dispatch (run in the parent process)
+
+def describe_exit_code(returncode):
+    if returncode < 0:
+        try:
+            return f"Crashed with signal {signal.Signals(-returncode).name}"
+        except ValueError:
+            return f"Crashed with signal {-returncode}"
+    return f"Exited with code {returncode:#x}" if returncode > 255 else f"Exited with code {returncode}"
+
+def run_child(args, timeout, memory_limit_mb):
+    """Run this script in a subprocess, return (result dict or None, message, output)"""
+    command = [sys.executable, os.path.abspath(__file__)] + args
+    if memory_limit_mb is not None:
+        command += ["--memory-limit", str(memory_limit_mb)]
+    try:
+        proc = subprocess.run(
+            command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            timeout=timeout, cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+    except subprocess.TimeoutExpired as e:
+        output = (e.output or b"").decode(errors="replace")
+        return None, f"Timed out after {timeout}s", output
+    output = proc.stdout.decode(errors="replace")
+    for line in reversed(output.splitlines()):
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):]), "", output
+    return None, describe_exit_code(proc.returncode), output
+
+def run_test(library_path, plugin, scenario, timeout, memory_limit_mb, golden_args=()):
+    start = time.perf_counter()
+    result, message, output = run_child(
+        ["--run", library_path, str(plugin["index"]), scenario] + list(golden_args),
+        timeout, memory_limit_mb
+    )
+    if result is None:
+        result = { "outcome": "failed", "message": message }
+    result.update({
+        "library": library_path,
+        "plugin": plugin["identifier"],
+        "scenario": scenario,
+        "duration": time.perf_counter() - start,
+    })
+    if result["outcome"] != "passed":
+        result["output"] = output[-10000:]
+    return result
+
+def list_plugins(library_path, timeout, memory_limit_mb):
+    result, message, output = run_child(["--list", library_path], timeout, memory_limit_mb)
+    if result is None:
+        return None, {
+            "library": library_path, "plugin": "", "scenario": "list",
+            "outcome": "failed", "message": message, "output": output[-10000:],
+            "duration": 0.0,
+        }
+    return result["plugins"], None
+
+def find_libraries(paths):
+    # Paths are absolute since child processes run from the script's directory
+    libraries = []
+    for path in map(os.path.abspath, paths):
+        if os.path.isdir(path):
+            libraries += sorted(glob(os.path.join(path, "**", "*.ofx"), recursive=True))
+        else:
+            libraries.append(path)
+    return libraries
+
+def run_all(libraries, scenario_names, jobs, timeout, memory_limit_mb, golden_args=()):
+    results = []
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        listings = pool.map(lambda lib: (lib, list_plugins(lib, timeout, memory_limit_mb)), libraries)
+        futures = []
+        for library_path, (plugins, failure) in listings:
+            if failure is not None:
+                results.append(failure)
+                continue
+            for plugin in plugins:
+                if plugin["api"] != kOfx.MeshEffectPluginAPI.decode() or plugin["api_version"] != 1:
+                    results.append({
+                        "library": library_path, "plugin": plugin["identifier"],
+                        "scenario": "api", "outcome": "skipped", "duration": 0.0,
+                        "message": f"Unsupported API {plugin['api']} v{plugin['api_version']}",
+                    })
+                    continue
+                for scenario in scenario_names:
+                    futures.append(pool.submit(run_test, library_path, plugin, scenario, timeout, memory_limit_mb, golden_args))
+        for future in futures:
+            result = future.result()
+            print(f"[{result['outcome'].upper():>7}] {result['plugin']} / {result['scenario']} {result['message']}")
+            results.append(result)
+    return results
+
+def write_json(results, filename):
+    with open(filename, "w") as f:
+        json.dump({ "results": results }, f, indent=2)
+
+def write_junit(results, filename):
+    root = ET.Element("testsuites")
+    by_library = {}
+    for result in results:
+        by_library.setdefault(result["library"], []).append(result)
+    for library_path, library_results in by_library.items():
+        suite = ET.SubElement(root, "testsuite", {
+            "name": library_path,
+            "tests": str(len(library_results)),
+            "failures": str(sum(r["outcome"] == "failed" for r in library_results)),
+            "errors": str(sum(r["outcome"] == "error" for r in library_results)),
+            "skipped": str(sum(r["outcome"] == "skipped" for r in library_results)),
+            "time": f"{sum(r['duration'] for r in library_results):.3f}",
+        })
+        for result in library_results:
+            case = ET.SubElement(suite, "testcase", {
+                "classname": result["plugin"],
+                "name": result["scenario"],
+                "time": f"{result['duration']:.3f}",
+            })
+            if result["outcome"] in ("failed", "error", "skipped"):
+                tag = "failure" if result["outcome"] == "failed" else result["outcome"]
+                node = ET.SubElement(case, tag, { "message": result["message"] })
+                node.text = result.get("details", "") + result.get("output", "")
+    ET.ElementTree(root).write(filename, encoding="utf-8", xml_declaration=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run compliance tests on OpenMfx plugins")
+    parser.add_argument("libraries", nargs="*", help="ofx files or directories containing ofx files")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of parallel tests")
+    parser.add_argument("--timeout", type=float, default=30.0, help="timeout of a single test, in seconds")
+    parser.add_argument("--memory-limit", type=int, default=None, help="memory limit of a single test, in MB (not supported on Windows)")
+    parser.add_argument("--scenario", action="append", choices=list(scenarios), help="run only these scenarios")
+    parser.add_argument("--json", help="write results to this JSON file")
+    parser.add_argument("--junit", help="write results to this JUnit XML file")
+    parser.add_argument("--golden", metavar="DIR", help="compare cook outputs to the references recorded in this directory")
+    parser.add_argument("--update-golden", action="store_true", help="record cook outputs as the new references instead of comparing them")
+    parser.add_argument("--run", nargs=3, metavar=("LIBRARY", "INDEX", "SCENARIO"), help=argparse.SUPPRESS)
+    parser.add_argument("--list", metavar="LIBRARY", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run is not None:
+        library_path, index, scenario = args.run
+        child_run(library_path, int(index), scenario, args.memory_limit, args.golden, args.update_golden)
+        return
+    if args.list is not None:
+        child_list(args.list, args.memory_limit)
+        return
+
+    start = time.perf_counter()
+    libraries = find_libraries(args.libraries)
+    golden_args = []
+    if args.golden is not None:
+        golden_args = ["--golden", os.path.abspath(args.golden)]
+        if args.update_golden:
+            golden_args.append("--update-golden")
+    elif args.update_golden:
+        parser.error("--update-golden requires --golden")
+    results = run_all(libraries, args.scenario or list(scenarios), args.jobs, args.timeout, args.memory_limit, golden_args)
+    if args.json:
+        write_json(results, args.json)
+    if args.junit:
+        write_junit(results, args.junit)
+
+    counts = {}
+    for result in results:
+        counts[result["outcome"]] = counts.get(result["outcome"], 0) + 1
+    summary = ", ".join(f"{n} {outcome}" for outcome, n in sorted(counts.items()))
+    print(f"{len(results)} tests in {time.perf_counter() - start:.1f}s: {summary}")
+    sys.exit(0 if counts.get("failed", 0) + counts.get("error", 0) == 0 else 1)
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 from ctypes import byref
 from copy import deepcopy
-from openmfx import OfxHost, OfxPluginLibrary, OfxMeshEffectInternal, OfxMeshEffect
+from openmfx import OfxHost, OfxPluginLibrary, OfxMeshEffectInternal, OfxMeshEffect, cook_effect
 from openmfx import constants as kOfx
+from openmfx_diff import diff_arrays
 
 # Adapt to your ofx file
 PLUGIN_PATH = r"E:\SourceCode\MfxExamples\build\Debug\mfx_examples.ofx"
@@ -136,8 +137,10 @@ def main(ofx_filename, plugin_index):
     translation = (0.1, 0.2, 0.3)
     py_instance.params[b"translation"].value = translation
 
-    # We can now run the core cook action, which computes the effect's output
-    status = plugin.mainEntry(kOfx.MeshEffectActionCook, byref(instance), None, None)
+    # We can now run the core cook action, which computes the effect's output.
+    # cook_effect calls plugin.mainEntry(kOfx.MeshEffectActionCook, ...) and
+    # keeps track of the memory the host allocates during the cook.
+    status = cook_effect(plugin, instance, host=host)
     print(f"OfxActionCook status = {status}")
     assert(status == kOfx.StatOK)
 
@@ -148,14 +151,12 @@ def main(ofx_filename, plugin_index):
     point0_position = tuple(point_position_data[0])
     print(f"New position of point #0: {point0_position}")
 
-    # Check that the effect computed a translation by (0.1, 0.2, 0.3)
-    def is_close(a, b):
-        return abs(b - a) < 1e-5
-    input_point_position_data = mesh.attributes[kOfx.MeshAttribPoint][kOfx.MeshAttribPointPosition].py_data
-    assert(len(input_point_position_data) == len(point_position_data))
-    for i, (in_point, out_point) in enumerate(zip(input_point_position_data, point_position_data)):
-        for k in range(3):
-            assert(is_close(out_point[k], in_point[k] + translation[k]))
+    # Check that the effect computed a translation by (0.1, 0.2, 0.3), by
+    # comparing point positions to the expected ones (see openmfx_diff)
+    expected_positions = mesh.as_array(kOfx.MeshAttribPoint, kOfx.MeshAttribPointPosition) + translation
+    output_positions = output_mesh.as_array(kOfx.MeshAttribPoint, kOfx.MeshAttribPointPosition)
+    diff = diff_arrays(expected_positions, output_positions, atol=1e-5)
+    assert diff.equal, str(diff)
 
 
 main(PLUGIN_PATH, PLUGIN_INDEX)
@@ -1,10 +1,19 @@
 import ctypes.wintypes
 from ctypes import (
-    CFUNCTYPE, POINTER, CDLL, c_char_p, c_int, c_uint, c_void_p, c_double, c_float, c_bool,
+    CFUNCTYPE, POINTER, CDLL, c_char_p, c_int, c_uint, c_void_p, c_double, c_float, c_bool, c_int64,
     Structure, pointer, cast, py_object, addressof, byref, c_ubyte, sizeof
 )
-import random
+import hashlib
+import json
+import mmap
+import os
 import sys
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from collections import deque, OrderedDict
+from contextlib import contextmanager
 from copy import deepcopy
 
 to_handle = py_object
@@ -61,6 +70,7 @@ MeshPropCornerCount = b"OfxMeshPropCornerCount",
 MeshPropFaceCount = b"OfxMeshPropFaceCount",
 
 ActionLoad = b"OfxActionLoad",
+ActionUnload = b"OfxActionUnload",
 ActionDescribe = b"OfxActionDescribe",
 ActionCreateInstance = b"OfxActionCreateInstance",
 ActionDestroyInstance = b"OfxActionDestroyInstance",
@@ -88,16 +98,34 @@ ParamTypePage = b"OfxParamTypePage",
 ParamTypePushButton = b"OfxParamTypePushButton",
 
 ParamPropDefault = b"OfxParamPropDefault",
+
+PropTime = b"OfxPropTime",
 )
 
 kOfx = constants
 
+def status_name(status):
+    """Name of a status code, e.g. 'StatErrMemory'"""
+    for k, v in vars(constants).items():
+        if k.startswith("Stat") and v == status:
+            return k
+    return f"Stat({status})"
+
+class OfxStatusError(Exception):
+    """
+    Raised by the higher level helpers (e.g. OfxEffectRunner) when an action
+    does not return kOfx.StatOK.
+    """
+    def __init__(self, action, status):
+        self.action = action
+        self.status = status
+        super().__init__(f"{action.decode()} failed with status {status_name(status)}")
+
 OfxStatus = c_int
 OfxTime = c_double
 OfxPropertySet = dict
 OfxPropertySetHandle = POINTER(py_object)
 
-OfxParamSet = dict
 OfxParamSetHandle = POINTER(py_object)
 
 OfxInputSet = dict
@@ -120,109 +148,871 @@ class PyObjectWrapper(Structure):
         self.internal = py_object(internal)
 
 
+class OfxHandles:
+    """
+    Handles given to plugins on an object or on one of its members (e.g. its
+    property set). A handle is the address of a buffer that holds the address
+    of the python object, which has the same layout as PyObjectWrapper.
+    Buffers are stored here, so handles stay the same and valid as long as
+    the owner of this OfxHandles is alive, and they do not hold a reference
+    to their target so they do not delay its destruction.
+    Copies of the owner get an empty set of handles.
+    """
+    __slots__ = ("buffers",)
+
+    def __init__(self):
+        self.buffers = {}
+
+    def __deepcopy__(self, memo):
+        return OfxHandles()
+
+    def __copy__(self):
+        return OfxHandles()
+
+    def address(self, target):
+        buffer = self.buffers.get(id(target))
+        if buffer is None:
+            buffer = self.buffers.setdefault(id(target), c_void_p(id(target)))
+        return addressof(buffer)
+
+
+class OfxReleasedHandle:
+    """Target of released handles of an OfxHandleTable"""
+    def __repr__(self):
+        return "<released handle>"
+
+released_handle = OfxReleasedHandle()
+
+class OfxHandleTable:
+    """
+    Handles whose lifetime is managed explicitly, unlike those of OfxHandles:
+    a handle is acquired on a target, to which it holds a reference, until it
+    gets released. Handles are slots of the table, with the same layout as
+    PyObjectWrapper. A released slot points to released_handle, so that suite
+    functions can detect use after release, and stays in quarantine until
+    quarantine_size other slots were released. Only then may it be reused,
+    with its generation bumped, so a stale handle is detected as long as it
+    was released less than quarantine_size releases ago.
+    """
+    chunk_size = 256
+
+    def __init__(self, quarantine_size=4096):
+        self.chunks = []
+        self.entries = []  # per slot: [target, owner, generation]
+        self.indices = {}  # address -> slot index
+        self.free = deque()  # released slots, oldest first
+        self.quarantine_size = quarantine_size
+        self.live_slots = set()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<OfxHandleTable {len(self.live_slots)} live handles out of {len(self.entries)}>"
+
+    def _address(self, index):
+        chunk = self.chunks[index // self.chunk_size]
+        return addressof(chunk) + (index % self.chunk_size) * sizeof(c_void_p)
+
+    def acquire(self, target, owner=None):
+        """Return a new handle on target, owner being any related object"""
+        with self._lock:
+            if len(self.free) > self.quarantine_size:
+                index = self.free.popleft()
+            else:
+                index = len(self.entries)
+                if index % self.chunk_size == 0:
+                    self.chunks.append((c_void_p * self.chunk_size)())
+                self.entries.append([None, None, 0])
+                self.indices[self._address(index)] = index
+            entry = self.entries[index]
+            entry[0] = target
+            entry[1] = owner
+            entry[2] += 1
+            self.chunks[index // self.chunk_size][index % self.chunk_size] = id(target)
+            self.live_slots.add(index)
+            return self._address(index)
+
+    def release(self, address, generation=None):
+        """
+        Release a handle and return its (target, owner). Raise a KeyError if
+        address is not a live handle of this table, or if a generation is
+        given and the slot was reused since (see live()).
+        """
+        with self._lock:
+            index = self.indices.get(address)
+            if index is None or self.entries[index][0] is None:
+                raise KeyError(f"Not a live handle: {address or 0:#x}")
+            entry = self.entries[index]
+            if generation is not None and entry[2] != generation:
+                raise KeyError(f"Handle {address:#x} was reused since generation {generation}")
+            target, owner = entry[0], entry[1]
+            entry[0] = entry[1] = None
+            self.chunks[index // self.chunk_size][index % self.chunk_size] = id(released_handle)
+            self.free.append(index)
+            self.live_slots.discard(index)
+            return target, owner
+
+    def generation(self, address):
+        """Number of times the slot of a handle was acquired"""
+        return self.entries[self.indices[address]][2]
+
+    def live(self):
+        """List the (address, generation, target, owner) of live handles"""
+        with self._lock:
+            handles = []
+            for index in self.live_slots:
+                target, owner, generation = self.entries[index]
+                handles.append((self._address(index), generation, target, owner))
+            return handles
+
+# Handles on the meshes given to plugins by inputGetMesh
+mesh_handles = OfxHandleTable()
+
+
+# Parameter types whose keyframes are interpolated, others hold the value of
+# the previous key.
+interpolated_param_types = {
+    kOfx.ParamTypeInteger, kOfx.ParamTypeDouble, kOfx.ParamTypeRGBA,
+    kOfx.ParamTypeRGB, kOfx.ParamTypeDouble2D, kOfx.ParamTypeInteger2D,
+    kOfx.ParamTypeDouble3D, kOfx.ParamTypeInteger3D,
+}
+
+integer_param_types = {
+    kOfx.ParamTypeInteger, kOfx.ParamTypeInteger2D, kOfx.ParamTypeInteger3D,
+}
+
+# Parameter values are passed to/from plugins as C variadic arguments. Getters
+# receive one pointer per component, that we declare as fixed pointer arguments
+# (extra ones are just never read). Setters receive the components by value:
+# on x86-64 System V (and aarch64 Linux) floating point and integer varargs
+# are passed in distinct registers, so we declare both; on Windows x64
+# varargs all go through integer slots (floats being duplicated there).
+# Other ABIs pass varargs differently (e.g. on the stack on macOS arm64), so
+# values would be silently wrong: parameter value functions fail there with
+# kOfx.StatErrUnsupported instead.
+max_param_components = 4
+param_get_varargs = (c_void_p,) * max_param_components
+if sys.platform == "win32":
+    param_set_varargs = (c_int64,) * max_param_components
+    machine = os.environ.get("PROCESSOR_ARCHITECTURE", "")
+else:
+    param_set_varargs = (c_double,) * max_param_components + (c_int64,) * max_param_components
+    machine = os.uname().machine
+param_varargs_supported = machine.lower() in ("x86_64", "amd64") or (
+    sys.platform.startswith("linux") and machine.lower() in ("aarch64", "arm64")
+)
+del machine
+
+param_value_types = {
+    kOfx.ParamTypeInteger:    (c_int,    1),
+    kOfx.ParamTypeDouble:     (c_double, 1),
+    kOfx.ParamTypeBoolean:    (c_int,    1),
+    kOfx.ParamTypeChoice:     (c_int,    1),
+    kOfx.ParamTypeRGBA:       (c_double, 4),
+    kOfx.ParamTypeRGB:        (c_double, 3),
+    kOfx.ParamTypeDouble2D:   (c_double, 2),
+    kOfx.ParamTypeInteger2D:  (c_int,    2),
+    kOfx.ParamTypeDouble3D:   (c_double, 3),
+    kOfx.ParamTypeInteger3D:  (c_int,    3),
+    kOfx.ParamTypeString:     (c_char_p, 1),
+    kOfx.ParamTypeCustom:     (c_char_p, 1),
+    kOfx.ParamTypeGroup:      (c_int,    1),
+    kOfx.ParamTypePage:       (c_int,    1),
+    kOfx.ParamTypePushButton: (c_int,    1),
+}
+
+class OfxParamMarshaller:
+    """
+    Conversion of the values of one parameter type, between Python (lists of
+    components) and the pointers and varargs exchanged with plugins. The
+    conversion functions are built once per type, so that getting a value
+    from a plugin only costs a few attribute lookups.
+    """
+    def __init__(self, param_type):
+        ctype, count = param_value_types[param_type]
+        self.type = param_type
+        self.ctype = ctype
+        self.count = count
+        if param_type == kOfx.ParamTypeBoolean:
+            self.component_type = bool
+        elif ctype is c_double:
+            self.component_type = float
+        elif ctype is c_int:
+            self.component_type = int
+        else:
+            self.component_type = bytes
+        self.default = default_param_value[param_type]
+        self.write = self.makeWrite()
+        self.readVarargs = self.makeReadVarargs()
+
+    def __repr__(self):
+        return f"<OfxParamMarshaller {self.type.decode()}>"
+
+    def __deepcopy__(self, memo):
+        return self  # shared by all parameters of the same type
+
+    def __copy__(self):
+        return self
+
+    def coerce(self, value):
+        """
+        Return a new list of count components of the right Python type, from
+        a list, a tuple or a single component. Extra components (e.g. the 4
+        slots of a property) are ignored. Raise ValueError if the value does
+        not fit the type.
+        """
+        if isinstance(value, (str, bytes)):
+            value = [value]
+        try:
+            value = list(value)
+        except TypeError:
+            value = [value]
+        if len(value) < self.count:
+            raise ValueError(f"{self.type.decode()} expects {self.count} components, got {value}")
+        value = value[:self.count]
+        component_type = self.component_type
+        if component_type is bytes:
+            return [x.encode() if isinstance(x, str) else bytes(x or b"") for x in value]
+        try:
+            return [component_type(x) for x in value]
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid value for {self.type.decode()}: {value}")
+
+    def makeWrite(self):
+        """Function writing a value to the pointers given by a plugin"""
+        from_address = self.ctype.from_address
+        count = self.count
+        if not param_varargs_supported:
+            def write(value, value_ps):
+                print("Parameter values cannot be passed as varargs on this platform")
+                return kOfx.StatErrUnsupported
+        elif count == 1:
+            def write(value, value_ps):
+                if value is None:
+                    return kOfx.StatErrValue
+                p = value_ps[0]
+                if not p:
+                    return kOfx.StatErrBadHandle
+                from_address(p).value = value[0]
+                return kOfx.StatOK
+        else:
+            def write(value, value_ps):
+                if value is None:
+                    return kOfx.StatErrValue
+                for i in range(count):
+                    p = value_ps[i]
+                    if not p:
+                        return kOfx.StatErrBadHandle
+                    from_address(p).value = value[i]
+                return kOfx.StatOK
+        return write
+
+    def makeReadVarargs(self):
+        """Function decoding a value passed by value as varargs by a plugin"""
+        count = self.count
+        component_type = self.component_type
+        if sys.platform == "win32":
+            offset = 0
+        else:
+            # Floats and integers come in distinct registers
+            offset = 0 if self.ctype is c_double else max_param_components
+        if self.ctype is c_double:
+            if sys.platform == "win32":
+                return lambda args: [c_double.from_buffer(c_int64(x)).value for x in args[:count]]
+            return lambda args: list(args[:count])
+        if self.ctype is c_char_p:
+            return lambda args: [ctypes.string_at(args[offset]) if args[offset] else b""]
+        # Truncate to 32 bits, since upper bits of the slot are undefined
+        return lambda args: [component_type(((x + 0x80000000) & 0xffffffff) - 0x80000000) for x in args[offset:offset + count]]
+
+default_param_value = {
+    kOfx.ParamTypeInteger: [0],
+    kOfx.ParamTypeDouble: [0.0],
+    kOfx.ParamTypeBoolean: [False],
+    kOfx.ParamTypeChoice: [0],
+    kOfx.ParamTypeRGBA: [0.0, 0.0, 0.0, 1.0],
+    kOfx.ParamTypeRGB: [0.0, 0.0, 0.0],
+    kOfx.ParamTypeDouble2D: [0.0, 0.0],
+    kOfx.ParamTypeInteger2D: [0, 0],
+    kOfx.ParamTypeDouble3D: [0.0, 0.0, 0.0],
+    kOfx.ParamTypeInteger3D: [0, 0, 0],
+    kOfx.ParamTypeString: [b""],
+    kOfx.ParamTypeCustom: [b""],
+    kOfx.ParamTypeGroup: [0],
+    kOfx.ParamTypePage: [0],
+    kOfx.ParamTypePushButton: [0],
+}
+
+param_marshallers = { param_type: OfxParamMarshaller(param_type) for param_type in param_value_types }
+
+class OfxParamProperties(dict):
+    """
+    Property set of a parameter, which sets the value of the parameter to its
+    default, coerced to the parameter type, whenever the plugin sets
+    ParamPropDefault.
+    """
+    def __init__(self, param):
+        super().__init__()
+        self.param = param
+
+    def __deepcopy__(self, memo):
+        # Copied as is, without setting the value of the copied parameter
+        copy = memo[id(self)] = OfxParamProperties.__new__(OfxParamProperties)
+        copy.param = deepcopy(self.param, memo)
+        for name, values in self.items():
+            dict.__setitem__(copy, name, deepcopy(values, memo))
+        return copy
+
+    def __setitem__(self, name, values):
+        super().__setitem__(name, values)
+        if name == kOfx.ParamPropDefault:
+            try:
+                self.param.value = deepcopy(values)
+            except ValueError as e:
+                print(f"Invalid default for parameter '{self.param.name.decode()}': {e}")
+
 class OfxParamInternal:
+    """
+    A parameter holds either a static value or, once keyframes have been set,
+    a list of (time, value) keys sorted by time. Values are lists of components,
+    converted to the Python type of the parameter's components when set, and
+    are initialized to the default value of the type when defined.
+    """
     def __init__(self, name, type):
+        if type not in param_marshallers:
+            raise ValueError(f"Unknown parameter type '{type.decode()}'")
         self.name = name
         self.type = type
-        self.value = None
-        self.properties = OfxPropertySet()
+        self.marshaller = param_marshallers[type]
+        self._value = self.marshaller.coerce(self.marshaller.default)
+        self.keys = []
+        self.current_time = 0.0  # time used by paramGetValue
+        self.properties = OfxParamProperties(self)
+        self.handles = OfxHandles()
 
     def __repr__(self):
         return f"<OfxParam '{self.name.decode()}'>"
 
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = None if value is None else self.marshaller.coerce(value)
+
+    def resetToDefault(self):
+        """Drop keyframes and set the value back to the descriptor's default"""
+        self.keys = []
+        if kOfx.ParamPropDefault in self.properties:
+            try:
+                self.value = deepcopy(self.properties[kOfx.ParamPropDefault])
+                return
+            except ValueError:
+                pass  # reported when the plugin set it
+        self.value = deepcopy(default_param_value[self.type])
+
+    @property
+    def is_animated(self):
+        return len(self.keys) > 0
+
+    def keyIndex(self, time):
+        """Index of the first key whose time is not lower than the given time"""
+        return bisect_left(self.keys, time, key=lambda k: k[0])
+
+    def valueAtTime(self, time):
+        keys = self.keys
+        if not keys:
+            return self.value
+        i = self.keyIndex(time)
+        if i < len(keys) and keys[i][0] == time:
+            return keys[i][1]
+        if i == 0:
+            return keys[0][1]
+        if i == len(keys):
+            return keys[-1][1]
+        (t0, v0), (t1, v1) = keys[i - 1], keys[i]
+        if self.type not in interpolated_param_types:
+            return v0
+        u = (time - t0) / (t1 - t0)
+        value = [a + (b - a) * u for a, b in zip(v0, v1)]
+        if self.type in integer_param_types:
+            value = [round(x) for x in value]
+        return value
+
+    def setValueAtTime(self, time, value):
+        value = self.marshaller.coerce(value)
+        i = self.keyIndex(time)
+        if i < len(self.keys) and self.keys[i][0] == time:
+            self.keys[i] = (time, value)
+        else:
+            self.keys.insert(i, (time, value))
+
+    def deleteKey(self, time):
+        i = self.keyIndex(time)
+        if i < len(self.keys) and self.keys[i][0] == time:
+            del self.keys[i]
+            return True
+        return False
+
+    def deleteAllKeys(self):
+        if self.keys:
+            self.value = self.valueAtTime(self.current_time)
+        self.keys = []
+
+    def copyFrom(self, other, offset=0.0, frame_range=None):
+        """
+        Copy the value and the keys of another parameter of the same type,
+        shifting key times by offset. If a frame_range (min, max) is given,
+        only the keys of other in this range are copied, replacing the keys
+        of self in the shifted range.
+        """
+        if other.type != self.type:
+            raise ValueError(f"Cannot copy {other.type.decode()} parameter '{other.name.decode()}' to {self.type.decode()} parameter '{self.name.decode()}'")
+        self._value = deepcopy(other._value)
+        if frame_range is None:
+            self.keys = [(t + offset, list(v)) for t, v in other.keys]
+            return
+        t_min, t_max = frame_range
+        kept = [k for k in self.keys if not t_min + offset <= k[0] <= t_max + offset]
+        copied = [(t + offset, list(v)) for t, v in other.keys if t_min <= t <= t_max]
+        self.keys = sorted(kept + copied, key=lambda k: k[0])
+
+    def derivative(self, time):
+        """Derivative of the (piecewise linear) animation curve"""
+        keys = self.keys
+        zero = [0.0] * len(keys[0][1] if keys else self.value or [])
+        if len(keys) < 2 or self.type not in interpolated_param_types:
+            return zero
+        i = self.keyIndex(time)
+        if i < len(keys) and keys[i][0] == time:
+            i += 1  # right derivative at keys
+        if i == 0 or i == len(keys):
+            return zero
+        (t0, v0), (t1, v1) = keys[i - 1], keys[i]
+        return [(b - a) / (t1 - t0) for a, b in zip(v0, v1)]
+
+    def integral(self, time1, time2):
+        """Integral of the value between two times"""
+        if time2 < time1:
+            return [-x for x in self.integral(time2, time1)]
+        keys = self.keys
+        if not keys or self.type not in interpolated_param_types:
+            return [x * (time2 - time1) for x in self.valueAtTime(time1)]
+        # Integrate the piecewise linear curve by trapezes between breakpoints
+        times = [time1] + [t for t, _ in keys if time1 < t < time2] + [time2]
+        total = [0.0 for _ in keys[0][1]]
+        previous = self.valueAtTime(times[0])
+        for t0, t1 in zip(times[:-1], times[1:]):
+            current = self.valueAtTime(t1)
+            total = [acc + (a + b) * (t1 - t0) / 2 for acc, a, b in zip(total, previous, current)]
+            previous = current
+        return total
+
+class OfxParamSet(dict):
+    """
+    Parameters of an effect by name, with the property set of the parameter
+    set and the state of the edit blocks opened by paramEditBegin. Once an
+    edit block is closed, its name and the names of the parameters it
+    changed are appended to edit_history.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.properties = OfxPropertySet()
+        self.handles = OfxHandles()
+        self.edit_name = None
+        self.edit_snapshot = None
+        self.edit_history = []
+
+    def __repr__(self):
+        return f"<OfxParamSet {list(self.keys())}>"
+
+    def snapshot(self):
+        return { name: (deepcopy(param.value), deepcopy(param.keys)) for name, param in self.items() }
+
+    def editBegin(self, name):
+        if self.edit_name is not None:
+            raise ValueError(f"Edit block '{self.edit_name.decode()}' is already open")
+        self.edit_name = name
+        self.edit_snapshot = self.snapshot()
+
+    def editEnd(self):
+        if self.edit_name is None:
+            raise ValueError("No edit block is open")
+        after = self.snapshot()
+        changed = [name for name, state in after.items() if self.edit_snapshot.get(name) != state]
+        self.edit_history.append((self.edit_name, changed))
+        self.edit_name = None
+        self.edit_snapshot = None
+
 class OfxParam(PyObjectWrapper):
     _internal_type_ = OfxParamInternal
 
 OfxParamHandle = POINTER(OfxParam)
 
-class OfxAttribute(OfxPropertySet):
+attribute_ctypes = {
+    kOfx.MeshAttribTypeFloat: c_float,
+    kOfx.MeshAttribTypeInt: c_int,
+    kOfx.MeshAttribTypeUByte: c_ubyte,
+}
+
+attribute_numpy_types = {
+    kOfx.MeshAttribTypeFloat: "float32",
+    kOfx.MeshAttribTypeInt: "int32",
+    kOfx.MeshAttribTypeUByte: "uint8",
+}
+
+# Attribute buffers of at least this many bytes get their own memory mapping
+mapped_buffer_threshold = 1 << 20
+
+digest_block_size = 1 << 22
+digest_pool = None
+
+def buffer_digest(data):
+    """
+    Digest of a contiguous buffer, hashed by blocks of digest_block_size bytes
+    (in parallel for large buffers since hashlib releases the GIL) whose
+    digests are then hashed together.
+    """
+    global digest_pool
+    view = memoryview(data).cast("B")
+    def block_digest(start):
+        return hashlib.blake2b(view[start:start + digest_block_size], digest_size=16).digest()
+    starts = range(0, len(view), digest_block_size)
+    if len(starts) > 1:
+        if digest_pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            digest_pool = ThreadPoolExecutor(os.cpu_count())
+        digests = digest_pool.map(block_digest, starts)
+    else:
+        digests = map(block_digest, starts)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(b"%d" % len(view))
+    for d in digests:
+        h.update(d)
+    return h.digest()
+
+class OfxMemoryBudgetError(MemoryError):
+    """Raised when an allocation would exceed the budget of a memory account"""
+    def __init__(self, account, requested):
+        self.account = account
+        self.requested = requested
+        super().__init__(
+            f"Allocating {requested} bytes would exceed the memory budget of '{account.name}' "
+            f"({account.current} of {account.budget} bytes in use)"
+        )
+
+class OfxMemoryAccount:
+    """
+    Bytes of attribute buffers allocated by the host, with their peak and an
+    optional budget. Accounts form a tree: charging an account also charges
+    its parents, and an allocation fails if it exceeds the budget of any of
+    them. The root account is process_memory, and each effect instance has
+    its own account (see OfxMeshEffectInternal), charged for the allocations
+    made while the instance cooks (see memory_scope).
+    """
+    def __init__(self, name, budget=None, parent=None):
+        self.name = name
+        self.budget = budget  # in bytes, None for no limit
+        self.parent = parent
+        self.current = 0
+        self.peak = 0
+        self.allocation_count = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<OfxMemoryAccount '{self.name}' {self.current} bytes (peak {self.peak})>"
+
+    def __deepcopy__(self, memo):
+        # Instances are deep copies of their descriptor, but get a fresh account
+        return OfxMemoryAccount(self.name, self.budget, self.parent)
+
+    def accounts(self):
+        """This account and its ancestors"""
+        account = self
+        while account is not None:
+            yield account
+            account = account.parent
+
+    def checkBudget(self, size):
+        """Raise an OfxMemoryBudgetError if size more bytes do not fit"""
+        for account in self.accounts():
+            if account.budget is not None and account.current + size > account.budget:
+                raise OfxMemoryBudgetError(account, size)
+
+    def charge(self, size, buffer_count=1):
+        """Charge size bytes, for buffer_count attribute buffers"""
+        with process_memory_lock:
+            self.checkBudget(size)
+            for account in self.accounts():
+                account.current += size
+                account.allocation_count += buffer_count
+                if account.current > account.peak:
+                    account.peak = account.current
+
+    def release(self, size):
+        with process_memory_lock:
+            for account in self.accounts():
+                account.current -= size
+
+    def resetPeak(self):
+        self.peak = self.current
+
+    def as_dict(self):
+        return {
+            "current": self.current,
+            "peak": self.peak,
+            "budget": self.budget,
+            "allocations": self.allocation_count,
+        }
+
+# Charging walks up the account tree, so a single lock guards all accounts.
+process_memory_lock = threading.Lock()
+process_memory = OfxMemoryAccount("process")
+memory_scopes = threading.local()
+
+def current_memory_account():
+    """Account charged for the allocations of the current thread"""
+    return getattr(memory_scopes, "account", None) or process_memory
+
+@contextmanager
+def memory_scope(account):
+    """Charge the allocations of the current thread to the given account"""
+    previous = getattr(memory_scopes, "account", None)
+    memory_scopes.account = account
+    try:
+        yield account
+    finally:
+        memory_scopes.account = previous
+
+class OfxPropertyFields:
+    """
+    Base class for compact objects that store their OFX properties in slots
+    rather than in a dict of lists. Subclasses map property names to slot
+    names in _property_fields_, and this class provides the dict-like view of
+    an OfxPropertySet used by the property suite, where field properties have
+    a single component. Other properties are kept in an extra dict that is
+    only allocated if a plugin sets one.
+    """
+    __slots__ = ("_extra", "_handles")
+    _property_fields_ = {}
+
+    @property
+    def handles(self):
+        """Handles given to plugins on this object (see OfxHandles)"""
+        handles = getattr(self, "_handles", None)
+        if handles is None:
+            handles = self._handles = OfxHandles()
+        return handles
+
+    def __contains__(self, name):
+        if name in self._property_fields_:
+            return True
+        extra = getattr(self, "_extra", None)
+        return extra is not None and name in extra
+
+    def __getitem__(self, name):
+        field = self._property_fields_.get(name)
+        if field is not None:
+            return [getattr(self, field)]
+        extra = getattr(self, "_extra", None)
+        if extra is None:
+            raise KeyError(name)
+        return extra[name]
+
+    def __setitem__(self, name, values):
+        field = self._property_fields_.get(name)
+        if field is not None:
+            setattr(self, field, values[0])
+            return
+        extra = getattr(self, "_extra", None)
+        if extra is None:
+            extra = self._extra = OfxPropertySet()
+        extra[name] = values
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def keys(self):
+        extra = getattr(self, "_extra", None)
+        return list(self._property_fields_) + (list(extra) if extra is not None else [])
+
+
+class OfxAttribute(OfxPropertyFields):
+    __slots__ = (
+        "name", "attachment", "py_data", "keepalive", "generation", "_digest", "_digest_key",
+        "data", "is_owner", "stride", "component_count", "attribute_type", "semantic",
+    )
+    _property_fields_ = {
+        kOfx.MeshAttribPropData: "data",
+        kOfx.MeshAttribPropIsOwner: "is_owner",
+        kOfx.MeshAttribPropStride: "stride",
+        kOfx.MeshAttribPropComponentCount: "component_count",
+        kOfx.MeshAttribPropType: "attribute_type",
+        kOfx.MeshAttribPropSemantic: "semantic",
+    }
+
     def __init__(self, name, attachment, component_count, attribute_type):
         self.name = name
         self.attachment = attachment
         self.py_data = None  # python reference to the data buffer, to have the GC manage it
+        self.keepalive = None  # buffer of another attribute that data points into, see keep_borrowed_buffers()
+        self.generation = 0  # bumped whenever the content of the buffer changes (see touch())
+        self._digest = None
+        self._digest_key = None
+
+        self.data = None
+        self.is_owner = True
+        self.stride = -1
+        self.component_count = component_count
+        self.attribute_type = attribute_type
+        self.semantic = None
 
-        self[kOfx.MeshAttribPropData] = [None]
-        self[kOfx.MeshAttribPropIsOwner] = [True]
-        self[kOfx.MeshAttribPropStride] = [-1]
-        self[kOfx.MeshAttribPropComponentCount] = [component_count]
-        self[kOfx.MeshAttribPropType] = [attribute_type]
-        self[kOfx.MeshAttribPropSemantic] = [None]
-
-    def allocate(self, item_count):
+    def __repr__(self):
+        return f"<OfxAttribute '{self.name.decode()}'>"
+
+    def allocate(self, item_count, reserved_by=None):
+        """
+        Allocate the data buffer. It is charged to the current memory account,
+        unless reserved_by is the account that was already charged for it
+        (see OfxMeshInternal.allocate).
+        """
         if not self.is_owner:
             return
 
         if self.py_data is not None:
             raise Exception("Attribute already allocated")
 
-        component_type = {
-            kOfx.MeshAttribTypeFloat: c_float,
-            kOfx.MeshAttribTypeInt: c_int,
-            kOfx.MeshAttribTypeUByte: c_ubyte,
-        }[self.attribute_type]
-
-        byte_stride = self.component_count * sizeof(component_type)
-
-        self.stride = byte_stride
-        if self.component_count > 1:
-            full_type = component_type * self.component_count
+        tracer = active_tracer
+        if tracer is not None:
+            with tracer.span(f"allocate {self.name.decode()}", "alloc", item_count=item_count):
+                self._allocate(item_count, reserved_by)
         else:
-            full_type = component_type
-        self.py_data = (full_type * item_count)()
-        self.data = cast(self.py_data, c_void_p)
+            self._allocate(item_count, reserved_by)
 
-    @property
-    def data(self):
-        return self[kOfx.MeshAttribPropData][0]
+    def _allocate(self, item_count, reserved_by):
+        component_type = attribute_ctypes[self.attribute_type]
 
-    @data.setter
-    def data(self, value):
-        self[kOfx.MeshAttribPropData] = [value]
-
-    @property
-    def is_owner(self):
-        return self[kOfx.MeshAttribPropIsOwner][0]
-
-    @is_owner.setter
-    def is_owner(self, value):
-        self[kOfx.MeshAttribPropIsOwner] = [value]
+        byte_stride = self.component_count * sizeof(component_type)
+        size = item_count * byte_stride
+
+        # Charge the buffer before allocating it, and release it when it gets
+        # freed, so that over-budget allocations fail before using memory.
+        account = reserved_by
+        if account is None:
+            account = current_memory_account()
+            account.charge(size)
+        try:
+            if self.component_count > 1:
+                full_type = component_type * self.component_count
+            else:
+                full_type = component_type
+            buffer_type = full_type * item_count
+            if size >= mapped_buffer_threshold:
+                # Anonymous mappings are zeroed lazily by the system, page by
+                # page when first written, while ctypes clears the whole
+                # buffer upfront.
+                py_data = buffer_type.from_buffer(mmap.mmap(-1, size))
+            else:
+                py_data = buffer_type()
+        except MemoryError:
+            if reserved_by is None:
+                account.release(size)
+            raise
+        weakref.finalize(py_data, account.release, size)
 
-    @property
-    def stride(self):
-        return self[kOfx.MeshAttribPropStride][0]
+        self.stride = byte_stride
+        self.py_data = py_data
+        # Not cast(), that makes a reference cycle and delays the release of the buffer to the GC
+        self.data = c_void_p(addressof(self.py_data))
+        self.touch()
 
-    @stride.setter
-    def stride(self, value):
-        self[kOfx.MeshAttribPropStride] = [value]
+    def allocationSize(self, item_count):
+        """Bytes that allocate(item_count) would charge (0 if there is nothing to allocate)"""
+        if not self.is_owner or self.py_data is not None:
+            return 0
+        return item_count * self.component_count * sizeof(attribute_ctypes[self.attribute_type])
 
     @property
-    def component_count(self):
-        return self[kOfx.MeshAttribPropComponentCount][0]
-
-    @component_count.setter
-    def component_count(self, value):
-        self[kOfx.MeshAttribPropComponentCount] = [value]
+    def allocated_bytes(self):
+        """Size of the buffer owned by the attribute (0 if not allocated)"""
+        return sizeof(self.py_data) if self.py_data is not None else 0
+
+    def touch(self):
+        """Notify that the data buffer was modified, invalidating its digest"""
+        self.generation += 1
+
+    def digest(self, item_count=None):
+        """
+        Content digest (16 bytes) of the attribute, covering its name, type,
+        component count and data. It is cached until the buffer gets
+        reallocated or touch() is called.
+        """
+        if item_count is None:
+            item_count = len(self.py_data) if self.py_data is not None else 0
+        key = (self.address, item_count, self.stride, self.generation)
+        if self._digest_key != key:
+            itemsize = sizeof(attribute_ctypes[self.attribute_type]) * self.component_count
+            h = hashlib.blake2b(digest_size=16)
+            h.update(self.name)
+            h.update(self.attribute_type)
+            h.update(b"%d %d" % (self.component_count, item_count))
+            if item_count == 0 or not self.address:
+                data = b""
+            elif self.stride == itemsize:
+                data = (c_ubyte * (item_count * itemsize)).from_address(self.address)
+            else:  # interleaved data must be compacted first
+                data = self.as_array(item_count).tobytes()
+            h.update(buffer_digest(data))
+            self._digest = h.digest()
+            self._digest_key = key
+        return self._digest
 
     @property
-    def attribute_type(self):
-        return self[kOfx.MeshAttribPropType][0]
-
-    @attribute_type.setter
-    def attribute_type(self, value):
-        self[kOfx.MeshAttribPropType] = [value]
+    def address(self):
+        """Address of the data buffer as an integer (0 if not set)"""
+        data = self.data
+        if isinstance(data, c_void_p):
+            data = data.value
+        return data or 0
+
+    def as_array(self, item_count=None):
+        """
+        Return a numpy view (without copy) on the attribute's data, of shape
+        (item_count, component_count), or (item_count,) for single component
+        attributes. The item count is only needed for attributes that do not
+        own their data.
+        """
+        import numpy as np
+        dtype = attribute_numpy_types[self.attribute_type]
+        count = self.component_count
+        if self.py_data is not None and item_count in (None, len(self.py_data)):
+            array = np.ctypeslib.as_array(self.py_data).view(dtype)
+        else:
+            itemsize = np.dtype(dtype).itemsize
+            if item_count is None:
+                raise ValueError("Item count is required for attributes that do not own their data")
+            if item_count == 0 or not self.address:
+                array = np.empty((item_count, count), dtype=dtype)
+            else:
+                size = self.stride * (item_count - 1) + itemsize * count
+                buffer = (c_ubyte * size).from_address(self.address)
+                array = np.ndarray((item_count, count), dtype, buffer, strides=(self.stride, itemsize))
+        return array.reshape(-1) if count == 1 else array.reshape(-1, count)
 
-    @property
-    def semantic(self):
-        return self[kOfx.MeshAttribPropSemantic][0]
 
-    @semantic.setter
-    def semantic(self, value):
-        self[kOfx.MeshAttribPropSemantic] = [value]
-    
+class OfxMeshInternal(OfxPropertyFields):
+    """
+    A mesh is its own property set: element counts are stored in slots and
+    exposed to plugins as the MeshProp*Count properties.
+    """
+    __slots__ = ("point_count", "corner_count", "face_count", "attributes", "transient", "fetch_count", "released")
+    _property_fields_ = {
+        kOfx.MeshPropPointCount: "point_count",
+        kOfx.MeshPropCornerCount: "corner_count",
+        kOfx.MeshPropFaceCount: "face_count",
+    }
 
-class OfxMeshInternal:
     def __init__(self):
-        self.properties = OfxPropertySet()
         self.attributes = {
             kOfx.MeshAttribPoint: {
                 kOfx.MeshAttribPointPosition: OfxAttribute(kOfx.MeshAttribPointPosition, kOfx.MeshAttribPoint, 3, kOfx.MeshAttribTypeFloat)
@@ -237,65 +1027,229 @@ class OfxMeshInternal:
         self.point_count = 0
         self.corner_count = 0
         self.face_count = 0
+        # A transient mesh is handed over to a plugin for a single cook: its
+        # buffers are freed at the end of the cook action (see cook_effect),
+        # rather than when the last reference to the mesh goes away.
+        self.transient = False
+        self.fetch_count = 0  # number of live handles on the mesh
+        self.released = False  # True once buffers of a transient mesh were freed
+
+    @property
+    def properties(self):
+        return self
 
     def __repr__(self):
         return f"<OfxMesh data at {'{:#018x}'.format(id(self))}>"
 
     def allocate(self):
-        type_to_count = {
-            kOfx.MeshAttribPoint: kOfx.MeshPropPointCount,
-            kOfx.MeshAttribCorner: kOfx.MeshPropCornerCount,
-            kOfx.MeshAttribFace: kOfx.MeshPropFaceCount,
-        }
-        for item_type, attr_per_item in self.attributes.items():
-            item_count = self.properties[type_to_count[item_type]][0]
-            for attr in attr_per_item.values():
-                attr.allocate(item_count)
-
-    @property
-    def point_count(self):
-        return self.properties[kOfx.MeshPropPointCount][0]
-
-    @point_count.setter
-    def point_count(self, value):
-        self.properties[kOfx.MeshPropPointCount] = [value]
+        # Charge all buffers at once rather than failing halfway, and so that
+        # concurrent allocations cannot exceed the budget together.
+        pending = [
+            (attr, self.itemCount(item_type))
+            for item_type, attr_per_item in self.attributes.items()
+            for attr in attr_per_item.values()
+        ]
+        account = current_memory_account()
+        reserved = sum(attr.allocationSize(item_count) for attr, item_count in pending)
+        buffer_count = sum(1 for attr, _ in pending if attr.is_owner and attr.py_data is None)
+        account.charge(reserved, buffer_count)
+        try:
+            for attr, item_count in pending:
+                size = attr.allocationSize(item_count)
+                attr.allocate(item_count, reserved_by=account)
+                reserved -= size
+        finally:
+            # Buffers that could not be allocated
+            if reserved:
+                account.release(reserved)
 
     @property
-    def corner_count(self):
-        return self.properties[kOfx.MeshPropCornerCount][0]
-
-    @corner_count.setter
-    def corner_count(self, value):
-        self.properties[kOfx.MeshPropCornerCount] = [value]
-
-    @property
-    def face_count(self):
-        return self.properties[kOfx.MeshPropFaceCount][0]
+    def allocated_bytes(self):
+        """Total size of the attribute buffers owned by the mesh"""
+        return sum(
+            attr.allocated_bytes
+            for attr_per_item in self.attributes.values()
+            for attr in attr_per_item.values()
+        )
+
+    def itemCount(self, attachment):
+        return {
+            kOfx.MeshAttribPoint: self.point_count,
+            kOfx.MeshAttribCorner: self.corner_count,
+            kOfx.MeshAttribFace: self.face_count,
+            kOfx.MeshAttribMesh: 1,
+        }[attachment]
+
+    def as_array(self, attachment, name):
+        """Numpy view on the data of an attribute (see OfxAttribute.as_array)"""
+        if self.released:
+            raise ValueError("Mesh buffers were released")
+        return self.attributes[attachment][name].as_array(self.itemCount(attachment))
+
+    def releaseBuffers(self):
+        """
+        Free the buffers owned by the mesh, but those still used by other
+        meshes (see keep_borrowed_buffers). Attributes keep their layout but
+        no longer have data.
+        """
+        for attr_per_item in self.attributes.values():
+            for attr in attr_per_item.values():
+                attr.keepalive = None
+                if attr.is_owner:
+                    attr.py_data = None
+                    attr.data = None
+                    attr.touch()
+        self.released = True
+
+    def touch(self):
+        """Notify that attribute buffers were modified in place"""
+        for attr_per_item in self.attributes.values():
+            for attr in attr_per_item.values():
+                attr.touch()
+
+    def digest(self):
+        """
+        Content digest of the whole mesh, combining the element counts and the
+        (cached) digests of all its attributes. Two meshes with the same digest
+        have the same attributes and data.
+        """
+        h = hashlib.blake2b(digest_size=16)
+        h.update(b"%d %d %d" % (self.point_count, self.corner_count, self.face_count))
+        for attachment in sorted(self.attributes):
+            for name, attr in sorted(self.attributes[attachment].items()):
+                h.update(attachment)
+                h.update(attr.digest(self.itemCount(attachment)))
+        return h.digest()
 
-    @face_count.setter
-    def face_count(self, value):
-        self.properties[kOfx.MeshPropFaceCount] = [value]
-        
 
 class OfxMesh(PyObjectWrapper):
     _internal_type_ = OfxMeshInternal
 
 OfxMeshHandle = POINTER(OfxMesh)
 
+def keep_borrowed_buffers(borrower, lender):
+    """
+    Plugins may forward data from a mesh to another one through attributes
+    that do not own their data. Make such attributes of the borrower mesh
+    keep alive the buffers of the lender mesh they point into.
+    """
+    buffers = [
+        (attr.address, attr.address + attr.allocated_bytes, attr.py_data)
+        for attr_per_item in lender.attributes.values()
+        for attr in attr_per_item.values()
+        if attr.is_owner and attr.py_data is not None
+    ]
+    if not buffers or borrower is lender:
+        return
+    for attr_per_item in borrower.attributes.values():
+        for attr in attr_per_item.values():
+            if attr.is_owner:
+                continue
+            address = attr.address
+            for start, end, py_data in buffers:
+                if start <= address < end:
+                    attr.keepalive = py_data
+
+def release_mesh_handle(address, generation=None):
+    """
+    Release a handle of mesh_handles and return its (mesh, mesh input).
+    Raise a KeyError if address is not a live mesh handle (see
+    OfxHandleTable.release).
+    """
+    mesh, mesh_input = mesh_handles.release(address, generation)
+    mesh.fetch_count -= 1
+    return mesh, mesh_input
+
+def release_instance_meshes(py_instance):
+    """
+    End the cook of an effect instance: release the mesh handles of its
+    inputs that the plugin did not release, then free the buffers of its
+    transient meshes, but those that other meshes of the instance borrow.
+    """
+    inputs = set(map(id, py_instance.inputs.values()))
+    for address, generation, mesh, mesh_input in mesh_handles.live():
+        if id(mesh_input) in inputs:
+            print(f"Warning: mesh of input '{mesh_input.name.decode()}' was not released by the plugin")
+            try:
+                release_mesh_handle(address, generation)
+            except KeyError:
+                pass  # released concurrently
+
+    meshes = []
+    for mesh_input in py_instance.inputs.values():
+        if mesh_input._mesh is not None:
+            meshes.append(mesh_input._mesh)
+        meshes += [mesh for _, mesh in mesh_input.time_samples]
+    transient = [mesh for mesh in meshes if mesh.transient and not mesh.released and mesh.fetch_count == 0]
+    for mesh in transient:
+        for other in meshes:
+            keep_borrowed_buffers(other, mesh)
+    for mesh in transient:
+        mesh.releaseBuffers()
+
 class OfxMeshInputInternal:
+    """
+    An input (or output) of a mesh effect. Besides the static mesh, an input
+    may hold time samples, namely a list of (time, mesh) sorted by time. The
+    mesh returned at a given time is the one of the last sample before it.
+    The property set and the static mesh are only created when first used.
+    """
+    __slots__ = ("name", "_properties", "_mesh", "time_samples", "requested_attributes", "handles")
+
     def __init__(self, name):
         self.name = name
-        self.properties = OfxPropertySet()
-        self.mesh = OfxMeshInternal()
+        self.handles = OfxHandles()
+        self._properties = None
+        self._mesh = None
+        self.time_samples = []
         self.requested_attributes = {
             kOfx.MeshAttribPoint: {},
             kOfx.MeshAttribCorner: {},
             kOfx.MeshAttribFace: {}
         }
 
+    @property
+    def properties(self):
+        if self._properties is None:
+            self._properties = OfxPropertySet()
+        return self._properties
+
+    @property
+    def mesh(self):
+        if self._mesh is None:
+            self._mesh = OfxMeshInternal()
+        return self._mesh
+
+    @mesh.setter
+    def mesh(self, value):
+        self._mesh = value
+
     def __repr__(self):
         return f"<OfxMeshInput '{self.name.decode()}'>"
 
+    def setMeshAtTime(self, time, mesh):
+        i = bisect_left(self.time_samples, time, key=lambda s: s[0])
+        if i < len(self.time_samples) and self.time_samples[i][0] == time:
+            self.time_samples[i] = (time, mesh)
+        else:
+            self.time_samples.insert(i, (time, mesh))
+
+    def touch(self):
+        """Notify that the meshes of the input were modified in place"""
+        if self._mesh is not None:
+            self._mesh.touch()
+        for _, mesh in self.time_samples:
+            mesh.touch()
+
+    def meshAtTime(self, time):
+        samples = self.time_samples
+        if not samples:
+            return self.mesh
+        i = bisect_left(samples, time, key=lambda s: s[0])
+        if i < len(samples) and samples[i][0] == time:
+            return samples[i][1]
+        return samples[max(i - 1, 0)][1]
+
 class OfxMeshInput(PyObjectWrapper):
     _internal_type_ = OfxMeshInputInternal
 
@@ -305,6 +1259,8 @@ class OfxMeshEffectInternal:
     def __init__(self):
         self.params = OfxParamSet()
         self.inputs = OfxInputSet()
+        self.handles = OfxHandles()
+        self.memory = OfxMemoryAccount("instance", parent=process_memory)
 
     def __repr__(self):
         return f"<OfxMeshEffect data at {'{:#018x}'.format(id(self))}>"
@@ -314,6 +1270,291 @@ class OfxMeshEffect(PyObjectWrapper):
 
 OfxMeshEffectHandle = POINTER(OfxMeshEffect)
 
+class OfxCallStats:
+    """
+    Call count, cumulative time and latency histogram of a suite function or
+    of an action. Bucket i of the histogram counts calls that lasted less than
+    2^i nanoseconds (and at least 2^(i-1)).
+    """
+    bucket_count = 40
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.histogram = [0] * self.bucket_count
+        # Only used for actions: time and calls spent in host callbacks
+        self.callback_ns = 0
+        self.callback_counts = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<OfxCallStats '{self.name}' x{self.count}>"
+
+    def record(self, duration_ns):
+        bucket = min(duration_ns.bit_length(), self.bucket_count - 1)
+        with self._lock:
+            self.count += 1
+            self.total_ns += duration_ns
+            if duration_ns > self.max_ns:
+                self.max_ns = duration_ns
+            self.histogram[bucket] += 1
+
+    def record_callback(self, name, duration_ns):
+        with self._lock:
+            self.callback_ns += duration_ns
+            self.callback_counts[name] = self.callback_counts.get(name, 0) + 1
+
+    def percentile_ns(self, p):
+        """Upper bound of the latency below which p percents of calls fall"""
+        threshold = self.count * p / 100
+        acc = 0
+        for i, n in enumerate(self.histogram):
+            acc += n
+            if n > 0 and acc >= threshold:
+                return 1 << i
+        return 0
+
+    def as_dict(self):
+        d = {
+            "count": self.count,
+            "total_ns": self.total_ns,
+            "mean_ns": self.total_ns // self.count if self.count > 0 else 0,
+            "max_ns": self.max_ns,
+            "p50_ns": self.percentile_ns(50),
+            "p99_ns": self.percentile_ns(99),
+            "histogram": self.histogram[:],
+        }
+        if self.callback_counts:
+            d["callback_ns"] = self.callback_ns
+            d["callback_counts"] = dict(self.callback_counts)
+        return d
+
+
+class OfxProfiler:
+    """
+    Optional instrumentation of the host. When given to OfxHost, every suite
+    function is wrapped to record its call count and latency. Actions are
+    recorded when they are run through OfxProfiler.mainEntry, which also
+    measures how much of the action is spent in host callbacks rather than
+    in the plugin code.
+    """
+    def __init__(self):
+        self.functions = {}
+        self.actions = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stats(self, table, name):
+        stats = table.get(name)
+        if stats is None:
+            with self._lock:
+                stats = table.setdefault(name, OfxCallStats(name))
+        return stats
+
+    def _action_stack(self):
+        stack = getattr(self._local, "actions", None)
+        if stack is None:
+            stack = self._local.actions = []
+        return stack
+
+    def wrap(self, suite_name, function_name, f):
+        """Wrap a suite function before it gets turned into a C callback"""
+        name = f"{suite_name}::{function_name}"
+        stats = self._stats(self.functions, name)
+        clock = time.perf_counter_ns
+        action_stack = self._action_stack
+        def wrapper(*args):
+            start = clock()
+            try:
+                return f(*args)
+            finally:
+                duration = clock() - start
+                stats.record(duration)
+                stack = action_stack()
+                if stack:
+                    stack[-1].record_callback(name, duration)
+        return wrapper
+
+    def mainEntry(self, plugin, action, *args):
+        """Run plugin.mainEntry(action, *args) and record it"""
+        stats = self._stats(self.actions, action.decode())
+        stack = self._action_stack()
+        stack.append(stats)
+        start = time.perf_counter_ns()
+        try:
+            return plugin.mainEntry(action, *args)
+        finally:
+            stats.record(time.perf_counter_ns() - start)
+            stack.pop()
+
+    def reset(self):
+        with self._lock:
+            self.functions = {}
+            self.actions = {}
+
+    def as_dict(self):
+        return {
+            "actions": { name: s.as_dict() for name, s in self.actions.items() },
+            "functions": { name: s.as_dict() for name, s in self.functions.items() },
+        }
+
+    def to_json(self, indent=2):
+        return json.dumps(self.as_dict(), indent=indent)
+
+    def report(self):
+        """Human readable summary, sorted by cumulative time"""
+        def fmt(ns):
+            if ns >= 1e9:
+                return f"{ns / 1e9:.2f}s"
+            if ns >= 1e6:
+                return f"{ns / 1e6:.2f}ms"
+            return f"{ns / 1e3:.1f}us"
+
+        lines = []
+        lines.append("Actions:")
+        lines.append(f"  {'name':<40} {'calls':>10} {'total':>10} {'in plugin':>10} {'in host':>10}")
+        for s in sorted(self.actions.values(), key=lambda s: -s.total_ns):
+            lines.append(
+                f"  {s.name:<40} {s.count:>10} {fmt(s.total_ns):>10} " +
+                f"{fmt(s.total_ns - s.callback_ns):>10} {fmt(s.callback_ns):>10}"
+            )
+            top = sorted(s.callback_counts.items(), key=lambda kv: -kv[1])[:5]
+            for name, count in top:
+                lines.append(f"      {name:<36} {count / s.count:>12.1f} calls/action")
+        lines.append("Suite functions:")
+        lines.append(f"  {'name':<40} {'calls':>10} {'total':>10} {'mean':>10} {'p99':>10}")
+        for s in sorted(self.functions.values(), key=lambda s: -s.total_ns):
+            if s.count == 0:
+                continue
+            lines.append(
+                f"  {s.name:<40} {s.count:>10} {fmt(s.total_ns):>10} " +
+                f"{fmt(s.total_ns / s.count):>10} {fmt(s.percentile_ns(99)):>10}"
+            )
+        return "\n".join(lines)
+
+
+active_tracer = None
+
+class OfxTracer:
+    """
+    Records a timeline of actions, suite callbacks and allocations that can be
+    exported to the Chrome trace event format (and opened in Perfetto or
+    chrome://tracing). Events are kept in a fixed size in-memory ring buffer
+    (the oldest ones get dropped) until flush() is called.
+    Like the profiler, the tracer is given to OfxHost to record callbacks and
+    actions are recorded when run through OfxTracer.mainEntry. Attribute
+    allocations are recorded by the tracer that is started.
+    """
+    def __init__(self, capacity=1000000):
+        self.events = deque(maxlen=capacity)
+        self.enabled = False
+        self._epoch = time.perf_counter_ns()
+
+    def start(self):
+        global active_tracer
+        active_tracer = self
+        self.enabled = True
+
+    def stop(self):
+        global active_tracer
+        if active_tracer is self:
+            active_tracer = None
+        self.enabled = False
+
+    def record(self, name, category, start_ns, duration_ns, args=None):
+        self.events.append((name, category, start_ns, duration_ns, threading.get_native_id(), args))
+
+    @contextmanager
+    def span(self, name, category="host", **args):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(name, category, start, time.perf_counter_ns() - start, args or None)
+
+    def wrap(self, suite_name, function_name, f):
+        """Wrap a suite function before it gets turned into a C callback"""
+        name = f"{suite_name}::{function_name}"
+        category = "alloc" if function_name == "meshAlloc" else "callback"
+        clock = time.perf_counter_ns
+        record = self.record
+        def wrapper(*args):
+            if not self.enabled:
+                return f(*args)
+            start = clock()
+            try:
+                return f(*args)
+            finally:
+                record(name, category, start, clock() - start)
+        return wrapper
+
+    def mainEntry(self, plugin, action, *args):
+        """Run plugin.mainEntry(action, *args) and record it"""
+        if not self.enabled:
+            return plugin.mainEntry(action, *args)
+        start = time.perf_counter_ns()
+        status = None
+        try:
+            status = plugin.mainEntry(action, *args)
+            return status
+        finally:
+            self.record(
+                action.decode(), "action", start, time.perf_counter_ns() - start,
+                { "plugin": plugin.pluginIdentifier.decode(), "status": status },
+            )
+
+    def to_chrome_trace(self, events=None):
+        if events is None:
+            events = list(self.events)
+        pid = os.getpid()
+        trace_events = []
+        for name, category, start, duration, tid, args in events:
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": (start - self._epoch) / 1000,
+                "dur": duration / 1000,
+                "pid": pid,
+                "tid": tid,
+            }
+            if args:
+                event["args"] = args
+            trace_events.append(event)
+        return { "traceEvents": trace_events, "displayTimeUnit": "ms" }
+
+    def flush(self, filename):
+        """Write buffered events to a Chrome trace JSON file and clear the buffer"""
+        events = []
+        while True:
+            try:
+                events.append(self.events.popleft())
+            except IndexError:
+                break
+        with open(filename, "w") as f:
+            json.dump(self.to_chrome_trace(events), f)
+        return len(events)
+
+
+class OfxRecordedPlugin:
+    """
+    A plugin whose actions are run through the mainEntry of a recorder (an
+    OfxProfiler or an OfxTracer), and that can itself be given to another one
+    """
+    def __init__(self, recorder, plugin):
+        self.recorder = recorder
+        self.plugin = plugin
+        self.pluginIdentifier = plugin.pluginIdentifier
+
+    def mainEntry(self, action, *args):
+        return self.recorder.mainEntry(self.plugin, action, *args)
+
+
 class OfxHost(Structure):
     """
     Represents the host software, and contain all function suites
@@ -323,19 +1564,49 @@ class OfxHost(Structure):
         ("fetchSuite", CFUNCTYPE(c_void_p, OfxPropertySetHandle, c_char_p, c_int)),
     ]
 
-    def __init__(self):
+    def __init__(self, profiler=None, tracer=None):
         self.fetchSuite = self._fetchSuite
+        self.profiler = profiler
+        self.tracer = tracer
 
         self.host_props = OfxPropertySet()
         self.host_props['host_instance'] = self
         self.host = pointer(to_handle(self.host_props))
 
+        # Suite types, that are only instantiated (which creates all of their
+        # C callbacks) when a plugin first fetches them.
         self.suites = {
-            kOfx.PropertySuite: { 1: OfxPropertySuiteV1() },
-            kOfx.ParameterSuite: { 1: OfxParameterSuiteV1() },
-            kOfx.MeshEffectSuite: { 1: OfxMeshEffectSuiteV1() },
-            kOfx.MessageSuite: { 2: OfxMessageSuiteV2() },
+            kOfx.PropertySuite: { 1: OfxPropertySuiteV1 },
+            kOfx.ParameterSuite: { 1: OfxParameterSuiteV1 },
+            kOfx.MeshEffectSuite: { 1: OfxMeshEffectSuiteV1 },
+            kOfx.MessageSuite: { 2: OfxMessageSuiteV2 },
         }
+        self.suite_instances = {}
+        self._suites_lock = threading.Lock()
+
+    def getSuite(self, suite_name, suite_version):
+        """Return the instance of a suite, creating it on first call"""
+        key = (suite_name, suite_version)
+        suite = self.suite_instances.get(key)
+        if suite is None:
+            with self._suites_lock:
+                suite = self.suite_instances.get(key)
+                if suite is None:
+                    suite_type = self.suites[suite_name][suite_version]
+                    suite = self.suite_instances[key] = suite_type(self.profiler, self.tracer)
+        return suite
+
+    def mainEntry(self, plugin, action, *args):
+        """
+        Run plugin.mainEntry(action, *args), recorded by the profiler and the
+        tracer of the host if any (the tracer's span enclosing the profiled
+        call, as for suite functions)
+        """
+        if self.profiler is not None:
+            plugin = OfxRecordedPlugin(self.profiler, plugin)
+        if self.tracer is not None:
+            plugin = OfxRecordedPlugin(self.tracer, plugin)
+        return plugin.mainEntry(action, *args)
 
     @staticmethod
     @CFUNCTYPE(c_void_p, OfxPropertySetHandle, c_char_p, c_int)
@@ -345,7 +1616,7 @@ class OfxHost(Structure):
         print(f"Fetching suite {suite_name.decode()}, version {suite_version}")
         if suite_name in self.suites:
             if suite_version in self.suites[suite_name]:
-                suite = self.suites[suite_name][suite_version]
+                suite = self.getSuite(suite_name, suite_version)
                 return cast(pointer(suite), c_void_p).value
             else:
                 print(f"Warning: Suite version not found: {suite_version} (suite '{suite_name.decode()}')")
@@ -376,14 +1647,20 @@ class OfxSuite:
     Parent class for function suites, which defines a default implementation
     for all functions 'foo' declared in _fields_ but for which no method
     _foo exists.
+    If a profiler or a tracer is provided, all functions are wrapped to record
+    their calls (see OfxProfiler and OfxTracer).
     """
-    def initFunctionPointers(self):
+    def initFunctionPointers(self, profiler=None, tracer=None):
         for attr, ctype in self._fields_:
             if hasattr(self, "_" + attr):
                 f = getattr(self, "_" + attr)
-                setattr(self, attr, ctype(f))
             else:
-                setattr(self, attr, ctype(self.makeMockMethod(attr)))
+                f = self.makeMockMethod(attr)
+            if profiler is not None:
+                f = profiler.wrap(self.__class__.__name__, attr, f)
+            if tracer is not None:
+                f = tracer.wrap(self.__class__.__name__, attr, f)
+            setattr(self, attr, ctype(f))
 
     @classmethod
     def makeMockMethod(cls, attr):
@@ -415,17 +1692,27 @@ class OfxPropertySuiteV1(Structure, OfxSuite):
         ("propGetDimension", CFUNCTYPE(OfxStatus, OfxPropertySetHandle, c_char_p, POINTER(c_int))),
     ]
 
-    def __init__(self):
-        self.initFunctionPointers()
+    def __init__(self, profiler=None, tracer=None):
+        self.initFunctionPointers(profiler, tracer)
 
     def makePropSet(default):
         @staticmethod
         def _propSet(property_set_p, name, component, value):
             print(f"Setting property {name.decode()}[{component}] to {value}")
             property_set = property_set_p.contents.value
+            if property_set is released_handle:
+                print(f"Property set used after release when setting {name.decode()}")
+                return kOfx.StatErrBadHandle
             if name not in property_set:
                 property_set[name] = [default, default, default, default]
-            property_set[name][component] = value
+            # Read-modify-write, so that compact objects (see OfxPropertyFields)
+            # get their fields updated
+            values = property_set[name]
+            if not 0 <= component < len(values):
+                print(f"Invalid index {component} of property {name.decode()} of dimension {len(values)}")
+                return kOfx.StatErrBadIndex
+            values[component] = value
+            property_set[name] = values
             return kOfx.StatOK
         return _propSet
 
@@ -441,9 +1728,16 @@ class OfxPropertySuiteV1(Structure, OfxSuite):
                 print("Null property set!")
                 return kOfx.StatErrBadHandle
             property_set = property_set_p.contents.value
+            if property_set is released_handle:
+                print(f"Property set used after release when getting {name.decode()}")
+                return kOfx.StatErrBadHandle
             if name not in property_set:
                 property_set[name] = [default, default, default, default]
-            value_p[0] = property_set[name][component]
+            values = property_set[name]
+            if not 0 <= component < len(values):
+                print(f"Invalid index {component} of property {name.decode()} of dimension {len(values)}")
+                return kOfx.StatErrBadIndex
+            value_p[0] = values[component]
             print(f"Getting property {name.decode()}[{component}] = {value_p[0]}")
             return kOfx.StatOK
         return _propGet
@@ -454,30 +1748,36 @@ class OfxPropertySuiteV1(Structure, OfxSuite):
     _propGetPointer = makePropGet(None)
 
 
+class OfxRangeD(Structure):
+    _fields_ = [
+        ("min", c_double),
+        ("max", c_double),
+    ]
+
 class OfxParameterSuiteV1(Structure, OfxSuite):
     _fields_ = [
         ("paramDefine",            CFUNCTYPE(OfxStatus, OfxParamSetHandle, c_char_p, c_char_p, POINTER(OfxPropertySetHandle))),
         ("paramGetHandle",         CFUNCTYPE(OfxStatus, OfxParamSetHandle, c_char_p, POINTER(OfxParamHandle), POINTER(OfxPropertySetHandle))),
-        ("paramSetGetPropertySet", CFUNCTYPE(OfxStatus, c_int)),
-        ("paramGetPropertySet",    CFUNCTYPE(OfxStatus, c_int)),
-        ("paramGetValue",          CFUNCTYPE(OfxStatus, OfxParamHandle, c_void_p)),
-        ("paramGetValueAtTime",    CFUNCTYPE(OfxStatus, c_int)),
-        ("paramGetDerivative",     CFUNCTYPE(OfxStatus, c_int)),
-        ("paramGetIntegral",       CFUNCTYPE(OfxStatus, c_int)),
-        ("paramSetValue",          CFUNCTYPE(OfxStatus, c_int)),
-        ("paramSetValueAtTime",    CFUNCTYPE(OfxStatus, c_int)),
-        ("paramGetNumKeys",        CFUNCTYPE(OfxStatus, c_int)),
-        ("paramGetKeyTime",        CFUNCTYPE(OfxStatus, c_int)),
-        ("paramGetKeyIndex",       CFUNCTYPE(OfxStatus, c_int)),
-        ("paramDeleteKey",         CFUNCTYPE(OfxStatus, c_int)),
-        ("paramDeleteAllKeys",     CFUNCTYPE(OfxStatus, c_int)),
-        ("paramCopy",              CFUNCTYPE(OfxStatus, c_int)),
-        ("paramEditBegin",         CFUNCTYPE(OfxStatus, c_int)),
-        ("paramEditEnd",           CFUNCTYPE(OfxStatus, c_int)),
+        ("paramSetGetPropertySet", CFUNCTYPE(OfxStatus, OfxParamSetHandle, POINTER(OfxPropertySetHandle))),
+        ("paramGetPropertySet",    CFUNCTYPE(OfxStatus, OfxParamHandle, POINTER(OfxPropertySetHandle))),
+        ("paramGetValue",          CFUNCTYPE(OfxStatus, OfxParamHandle, *param_get_varargs)),
+        ("paramGetValueAtTime",    CFUNCTYPE(OfxStatus, OfxParamHandle, OfxTime, *param_get_varargs)),
+        ("paramGetDerivative",     CFUNCTYPE(OfxStatus, OfxParamHandle, OfxTime, *param_get_varargs)),
+        ("paramGetIntegral",       CFUNCTYPE(OfxStatus, OfxParamHandle, OfxTime, OfxTime, *param_get_varargs)),
+        ("paramSetValue",          CFUNCTYPE(OfxStatus, OfxParamHandle, *param_set_varargs)),
+        ("paramSetValueAtTime",    CFUNCTYPE(OfxStatus, OfxParamHandle, OfxTime, *param_set_varargs)),
+        ("paramGetNumKeys",        CFUNCTYPE(OfxStatus, OfxParamHandle, POINTER(c_uint))),
+        ("paramGetKeyTime",        CFUNCTYPE(OfxStatus, OfxParamHandle, c_uint, POINTER(OfxTime))),
+        ("paramGetKeyIndex",       CFUNCTYPE(OfxStatus, OfxParamHandle, OfxTime, c_int, POINTER(c_int))),
+        ("paramDeleteKey",         CFUNCTYPE(OfxStatus, OfxParamHandle, OfxTime)),
+        ("paramDeleteAllKeys",     CFUNCTYPE(OfxStatus, OfxParamHandle)),
+        ("paramCopy",              CFUNCTYPE(OfxStatus, OfxParamHandle, OfxParamHandle, OfxTime, POINTER(OfxRangeD))),
+        ("paramEditBegin",         CFUNCTYPE(OfxStatus, OfxParamSetHandle, c_char_p)),
+        ("paramEditEnd",           CFUNCTYPE(OfxStatus, OfxParamSetHandle)),
     ]
 
-    def __init__(self):
-        self.initFunctionPointers()
+    def __init__(self, profiler=None, tracer=None):
+        self.initFunctionPointers(profiler, tracer)
 
     @staticmethod
     def _paramDefine(param_set_p, param_type, name, property_set_pp):
@@ -486,9 +1786,16 @@ class OfxParameterSuiteV1(Structure, OfxSuite):
             print("Invalid parameter set!")
             return kOfx.StatErrBadHandle
         param_set = param_set_p.contents.value
-        param_set[name] = OfxParamInternal(name, param_type)
+        if name in param_set:
+            print("Parameter already exists!")
+            return kOfx.StatErrExists
+        try:
+            param = param_set[name] = OfxParamInternal(name, param_type)
+        except ValueError as e:
+            print(e)
+            return kOfx.StatErrUnknown
         if property_set_pp:
-            property_set_pp.contents.contents = to_handle(param_set[name].properties)
+            cast(property_set_pp, POINTER(c_void_p))[0] = param.handles.address(param.properties)
         return kOfx.StatOK
 
     @staticmethod
@@ -504,38 +1811,165 @@ class OfxParameterSuiteV1(Structure, OfxSuite):
             print("Parameter not found!")
             return kOfx.StatErrUnknown
 
-        param_pp.contents.contents = OfxParam(param_set[name])
+        param = param_set[name]
+        cast(param_pp, POINTER(c_void_p))[0] = param.handles.address(param)
 
         if property_set_pp:
-            property_set_pp.contents.contents = to_handle(param_set[name].properties)
+            cast(property_set_pp, POINTER(c_void_p))[0] = param.handles.address(param.properties)
+        return kOfx.StatOK
+
+    @staticmethod
+    def _paramSetGetPropertySet(param_set_p, property_set_pp):
+        if not param_set_p or not property_set_pp:
+            return kOfx.StatErrBadHandle
+        param_set = param_set_p.contents.value
+        cast(property_set_pp, POINTER(c_void_p))[0] = param_set.handles.address(param_set.properties)
+        return kOfx.StatOK
+
+    @staticmethod
+    def _paramGetPropertySet(param_p, property_set_pp):
+        if not param_p or not property_set_pp:
+            return kOfx.StatErrBadHandle
+        param = param_p.contents.internal
+        cast(property_set_pp, POINTER(c_void_p))[0] = param.handles.address(param.properties)
+        return kOfx.StatOK
+
+    @staticmethod
+    def _paramGetValue(param_p, *value_ps):
+        param = param_p.contents.internal
+        value = param.valueAtTime(param.current_time)
+        print(f"Getting parameter value for '{param.name.decode()}' (= {value})")
+        return param.marshaller.write(value, value_ps)
+
+    @staticmethod
+    def _paramGetValueAtTime(param_p, time, *value_ps):
+        param = param_p.contents.internal
+        value = param.valueAtTime(time)
+        print(f"Getting parameter value for '{param.name.decode()}' at time {time} (= {value})")
+        return param.marshaller.write(value, value_ps)
+
+    @staticmethod
+    def _paramGetDerivative(param_p, time, *value_ps):
+        param = param_p.contents.internal
+        if param.type not in interpolated_param_types:
+            return kOfx.StatErrBadHandle
+        return param.marshaller.write(param.derivative(time), value_ps)
+
+    @staticmethod
+    def _paramGetIntegral(param_p, time1, time2, *value_ps):
+        param = param_p.contents.internal
+        if param.type not in interpolated_param_types:
+            return kOfx.StatErrBadHandle
+        return param.marshaller.write(param.integral(time1, time2), value_ps)
+
+    @staticmethod
+    def _paramSetValue(param_p, *args):
+        if not param_varargs_supported:
+            print("Parameter values cannot be passed as varargs on this platform")
+            return kOfx.StatErrUnsupported
+        param = param_p.contents.internal
+        value = param.marshaller.readVarargs(args)
+        print(f"Setting parameter value for '{param.name.decode()}' to {value}")
+        if param.is_animated:
+            # Like hosts do in animation mode, setting the value of an
+            # animated parameter sets a key at the current time.
+            param.setValueAtTime(param.current_time, value)
+        else:
+            param.value = value
+        return kOfx.StatOK
+
+    @staticmethod
+    def _paramSetValueAtTime(param_p, time, *args):
+        if not param_varargs_supported:
+            print("Parameter values cannot be passed as varargs on this platform")
+            return kOfx.StatErrUnsupported
+        param = param_p.contents.internal
+        value = param.marshaller.readVarargs(args)
+        print(f"Setting parameter value for '{param.name.decode()}' at time {time} to {value}")
+        param.setValueAtTime(time, value)
+        return kOfx.StatOK
+
+    @staticmethod
+    def _paramGetNumKeys(param_p, number_of_keys_p):
+        param = param_p.contents.internal
+        number_of_keys_p[0] = len(param.keys)
+        return kOfx.StatOK
+
+    @staticmethod
+    def _paramGetKeyTime(param_p, nth_key, time_p):
+        param = param_p.contents.internal
+        if nth_key >= len(param.keys):
+            return kOfx.StatErrBadIndex
+        time_p[0] = param.keys[nth_key][0]
+        return kOfx.StatOK
+
+    @staticmethod
+    def _paramGetKeyIndex(param_p, time, direction, index_p):
+        param = param_p.contents.internal
+        keys = param.keys
+        i = param.keyIndex(time)
+        exact = i < len(keys) and keys[i][0] == time
+        if direction == 0:
+            index = i if exact else -1
+        elif direction < 0:
+            index = i - 1
+        else:
+            index = i + 1 if exact else i
+        if not 0 <= index < len(keys):
+            return kOfx.StatFailed
+        index_p[0] = index
+        return kOfx.StatOK
+
+    @staticmethod
+    def _paramDeleteKey(param_p, time):
+        param = param_p.contents.internal
+        if not param.deleteKey(time):
+            return kOfx.StatErrBadIndex
         return kOfx.StatOK
 
     @staticmethod
-    def _paramGetValue(param_p, value_p):
+    def _paramDeleteAllKeys(param_p):
         param = param_p.contents.internal
-        print(f"Getting parameter value for '{param.name.decode()}' (= {param.value})")
-        target_type, target_count = {
-            kOfx.ParamTypeInteger:    (c_int,    1),
-            kOfx.ParamTypeDouble:     (c_double, 1),
-            kOfx.ParamTypeBoolean:    (c_bool,   1),
-            kOfx.ParamTypeChoice:     (c_int,    1),
-            kOfx.ParamTypeRGBA:       (c_double, 4),
-            kOfx.ParamTypeRGB:        (c_double, 3),
-            kOfx.ParamTypeDouble2D:   (c_double, 2),
-            kOfx.ParamTypeInteger2D:  (c_int,    2),
-            kOfx.ParamTypeDouble3D:   (c_double, 3),
-            kOfx.ParamTypeInteger3D:  (c_double, 3),
-            kOfx.ParamTypeString:     (c_char_p, 1),
-            kOfx.ParamTypeCustom:     (c_int,    1),
-            kOfx.ParamTypeGroup:      (c_int,    1),
-            kOfx.ParamTypePage:       (c_int,    1),
-            kOfx.ParamTypePushButton: (c_int,    1),
-        }[param.type]
-        typed_value_p = cast(value_p, POINTER(target_type))
-
-        for i in range(target_count):
-            typed_value_p[i] = param.value[i]
+        param.deleteAllKeys()
+        return kOfx.StatOK
+
+    @staticmethod
+    def _paramCopy(param_to_p, param_from_p, dst_offset, frame_range_p):
+        if not param_to_p or not param_from_p:
+            return kOfx.StatErrBadHandle
+        param_to = param_to_p.contents.internal
+        param_from = param_from_p.contents.internal
+        frame_range = None
+        if frame_range_p:
+            frame_range = (frame_range_p.contents.min, frame_range_p.contents.max)
+        print(f"Copying parameter '{param_from.name.decode()}' to '{param_to.name.decode()}'")
+        try:
+            param_to.copyFrom(param_from, dst_offset, frame_range)
+        except ValueError as e:
+            print(e)
+            return kOfx.StatErrValue
+        return kOfx.StatOK
+
+    @staticmethod
+    def _paramEditBegin(param_set_p, name):
+        if not param_set_p:
+            return kOfx.StatErrBadHandle
+        try:
+            param_set_p.contents.value.editBegin(name)
+        except ValueError as e:
+            print(e)
+            return kOfx.StatFailed
+        return kOfx.StatOK
 
+    @staticmethod
+    def _paramEditEnd(param_set_p):
+        if not param_set_p:
+            return kOfx.StatErrBadHandle
+        try:
+            param_set_p.contents.value.editEnd()
+        except ValueError as e:
+            print(e)
+            return kOfx.StatFailed
         return kOfx.StatOK
 
 class OfxMeshEffectSuiteV1(Structure, OfxSuite):
@@ -556,15 +1990,14 @@ class OfxMeshEffectSuiteV1(Structure, OfxSuite):
         ("abort",                   CFUNCTYPE(OfxStatus, c_int)),
     ]
 
-    def __init__(self):
-        self.initFunctionPointers()
+    def __init__(self, profiler=None, tracer=None):
+        self.initFunctionPointers(profiler, tracer)
 
     @staticmethod
     def _getParamSet(mesh_effect_p, param_set_pp):
         mesh_effect = mesh_effect_p.contents.internal
         print(f"Getting parameter set from mesh {mesh_effect}")
-        cast(param_set_pp, c_void_p)  # for some reason this line is required
-        param_set_pp.contents.contents = to_handle(mesh_effect.params)
+        cast(param_set_pp, POINTER(c_void_p))[0] = mesh_effect.handles.address(mesh_effect.params)
         return kOfx.StatOK
 
     @staticmethod
@@ -575,12 +2008,11 @@ class OfxMeshEffectSuiteV1(Structure, OfxSuite):
         mesh_input_internal = OfxMeshInputInternal(name)
         mesh_effect.inputs[name] = mesh_input_internal
 
-        cast(input_pp, c_void_p)  # for some reason this line is required
-        input_pp.contents.contents = OfxMeshInput(mesh_input_internal)
+        handles = mesh_input_internal.handles
+        cast(input_pp, POINTER(c_void_p))[0] = handles.address(mesh_input_internal)
 
         if input_props_pp:
-            cast(input_props_pp, c_void_p)  # for some reason this line is required
-            input_props_pp.contents.contents = to_handle(mesh_input_internal.properties)
+            cast(input_props_pp, POINTER(c_void_p))[0] = handles.address(mesh_input_internal.properties)
 
         return kOfx.StatOK
 
@@ -595,12 +2027,10 @@ class OfxMeshEffectSuiteV1(Structure, OfxSuite):
 
         mesh_input = mesh_effect.inputs[name]
 
-        cast(input_pp, c_void_p)  # for some reason this line is required
-        input_pp.contents.contents = to_handle(mesh_input)
+        cast(input_pp, POINTER(c_void_p))[0] = mesh_input.handles.address(mesh_input)
 
         if input_props_pp:
-            cast(input_props_pp, c_void_p)  # for some reason this line is required
-            input_props_pp.contents.contents = to_handle(mesh_input.properties)
+            cast(input_props_pp, POINTER(c_void_p))[0] = mesh_input.handles.address(mesh_input.properties)
 
         return kOfx.StatOK
 
@@ -622,53 +2052,75 @@ class OfxMeshEffectSuiteV1(Structure, OfxSuite):
         print(f"Getting input mesh at time {time}")
         mesh_input = mesh_input_p.contents.internal
 
-        mesh = mesh_input.mesh
+        mesh = mesh_input.meshAtTime(time)
+        if mesh.released:
+            print(f"Mesh of input '{mesh_input.name.decode()}' was released and its buffers freed")
+            return kOfx.StatFailed
 
-        cast(mesh_pp, c_void_p)  # for some reason this line is required
-        mesh_pp.contents.contents = OfxMesh(mesh)
+        handle = mesh_handles.acquire(mesh, mesh_input)
+        mesh.fetch_count += 1
+        cast(mesh_pp, POINTER(c_void_p))[0] = handle
 
         if mesh_props_pp:
-            cast(mesh_props_pp, c_void_p)  # for some reason this line is required
-            mesh_props_pp.contents.contents = to_handle(mesh.properties)
+            cast(mesh_props_pp, POINTER(c_void_p))[0] = handle
 
         return kOfx.StatOK
 
     @staticmethod
     def _inputReleaseMesh(mesh_p):
-        print(f"Releasing mesh")
-        # The GC will de the job anyways
+        try:
+            mesh, mesh_input = release_mesh_handle(cast(mesh_p, c_void_p).value)
+        except KeyError as e:
+            print(f"Cannot release mesh: {e.args[0]} (released twice?)")
+            return kOfx.StatErrBadHandle
+        print(f"Releasing mesh of input '{mesh_input.name.decode()}'")
         return kOfx.StatOK
 
+    @staticmethod
+    def liveMesh(mesh_p):
+        """Mesh of a handle, or None (with a log) if the handle was released"""
+        mesh = mesh_p.contents.internal if mesh_p else None
+        if mesh is None or mesh is released_handle:
+            print("Mesh handle used after release")
+            return None
+        return mesh
+
     @staticmethod
     def _meshGetAttribute(mesh_p, attachment, name, attribute_pp):
         print(f"Getting {attachment.decode()} attribute '{name.decode()}'")
-        mesh = mesh_p.contents.internal
+        mesh = OfxMeshEffectSuiteV1.liveMesh(mesh_p)
+        if mesh is None:
+            return kOfx.StatErrBadHandle
         attribute = mesh.attributes.get(attachment, {}).get(name)
         if attribute is None:
             print(f"Attribute does not exist: {attachment.decode()}/{name.decode()}")
             return kOfx.StatErrBadIndex
 
-        cast(attribute_pp, c_void_p)  # for some reason this line is required
-        attribute_pp.contents.contents = to_handle(attribute)
+        cast(attribute_pp, POINTER(c_void_p))[0] = attribute.handles.address(attribute)
         return kOfx.StatOK
 
     @staticmethod
     def _meshGetPropertySet(mesh_p, mesh_props_pp):
-        mesh = mesh_p.contents.internal
+        mesh = OfxMeshEffectSuiteV1.liveMesh(mesh_p)
 
-        if not mesh_props_pp:
-            return kOfx.kOfxStatErrBadHandle
+        if mesh is None or not mesh_props_pp:
+            return kOfx.StatErrBadHandle
 
-        cast(mesh_props_pp, c_void_p)  # for some reason this line is required
-        mesh_props_pp.contents.contents = to_handle(mesh.properties)
-        #mesh_props_pp.contents = OfxPropertySetHandle(to_handle(mesh.properties))
+        # A mesh is its own property set
+        cast(mesh_props_pp, POINTER(c_void_p))[0] = cast(mesh_p, c_void_p).value
         return kOfx.StatOK
 
     @staticmethod
     def _meshAlloc(mesh_p):
-        mesh = mesh_p.contents.internal
+        mesh = OfxMeshEffectSuiteV1.liveMesh(mesh_p)
+        if mesh is None:
+            return kOfx.StatErrBadHandle
         print(f"Allocating mesh data for {mesh.point_count} points, {mesh.corner_count} corners and {mesh.face_count} faces")
-        mesh.allocate()
+        try:
+            mesh.allocate()
+        except MemoryError as e:
+            print(f"Could not allocate mesh data: {e}")
+            return kOfx.StatErrMemory
         return kOfx.StatOK
 
 class OfxMessageSuiteV2(Structure, OfxSuite):
@@ -678,12 +2130,138 @@ class OfxMessageSuiteV2(Structure, OfxSuite):
         ("clearPersistentMessage", CFUNCTYPE(OfxStatus, c_int)),
     ]
 
+    def __init__(self, profiler=None, tracer=None):
+        self.initFunctionPointers(profiler, tracer)
+
+def free_library(handle):
+    """Unload a dynamic library from its raw handle"""
+    if sys.platform == "win32":
+        kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        kernel32.FreeLibrary.argtypes = [ctypes.wintypes.HMODULE]
+        kernel32.FreeLibrary(handle)
+    else:
+        # dlclose is part of the libc since glibc 2.34 (and libdl.so is often
+        # not installed), but it is always exposed to the current process.
+        dlclose = CDLL(None).dlclose
+        dlclose.argtypes = [c_void_p]
+        dlclose(handle)
+
+
+class OfxLibraryEntry:
+    """
+    A dynamic library loaded once and shared by all the OfxPluginLibrary
+    objects, plugins and effect instances that use it. It is only unloaded
+    when its reference count drops to zero.
+    """
+    def __init__(self, path, load_path, stamp, temp_dir=None):
+        self.path = path
+        self.load_path = load_path  # differs from path when hot reloading
+        self.stamp = stamp
+        self.temp_dir = temp_dir
+        self.key = None
+        self.refcount = 0
+        self.dll = CDLL(load_path)
+
+    def __repr__(self):
+        return f"<OfxLibraryEntry '{self.load_path}' refcount={self.refcount}>"
+
+
+class OfxLibraryRegistry:
+    """
+    Process-wide registry of loaded plugin libraries. Opening the same file
+    several times shares a single handle.
+    In hot reload mode, the library file is first copied to a versioned
+    temporary path, so that the original file can be rebuilt while loaded and
+    that the new build gets loaded instead of the cached handle.
+    """
     def __init__(self):
-        self.initFunctionPointers()
+        self.entries = {}
+        self._lock = threading.RLock()
+        self._versions = {}
+
+    @staticmethod
+    def file_stamp(path):
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def acquire(self, filename, hot_reload=False):
+        path = os.path.realpath(filename)
+        stamp = self.file_stamp(path) if hot_reload or os.path.exists(path) else None
+        key = (path, stamp) if hot_reload else path
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                if hot_reload:
+                    entry = self._load_copy(path, stamp)
+                else:
+                    entry = OfxLibraryEntry(path, filename, stamp)
+                self.entries[key] = entry
+                entry.key = key
+            entry.refcount += 1
+            return entry
+
+    def _load_copy(self, path, stamp):
+        import shutil
+        import tempfile
+        version = self._versions.get(path, 0) + 1
+        self._versions[path] = version
+        temp_dir = tempfile.mkdtemp(prefix="openmfx-")
+        stem, ext = os.path.splitext(os.path.basename(path))
+        load_path = os.path.join(temp_dir, f"{stem}.v{version}{ext}")
+        try:
+            shutil.copy2(path, load_path)
+            return OfxLibraryEntry(path, load_path, stamp, temp_dir)
+        except BaseException:
+            # e.g. a broken build being hot reloaded
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+
+    def add_ref(self, entry):
+        with self._lock:
+            entry.refcount += 1
+
+    def release(self, entry):
+        with self._lock:
+            entry.refcount -= 1
+            if entry.refcount > 0:
+                return
+            del self.entries[entry.key]
+        free_library(entry.dll._handle)
+        entry.dll = None
+        if entry.temp_dir is not None:
+            import shutil
+            shutil.rmtree(entry.temp_dir, ignore_errors=True)
+
+    def has_changed(self, entry):
+        try:
+            return self.file_stamp(entry.path) != entry.stamp
+        except FileNotFoundError:  # e.g. while being rebuilt
+            return False
+
+library_registry = OfxLibraryRegistry()
+
 
 class OfxPluginLibrary:
-    def __init__(self, dll_filename):
-        self._hll = CDLL(dll_filename)
+    """
+    A plugin library (.ofx file). The underlying dynamic library is shared
+    through library_registry and remains loaded as long as this object is not
+    closed or any of the plugins returned by OfxGetPlugin or their instances
+    created by an OfxEffectRunner are still alive.
+    When hot_reload is True, reload() loads the new version of the file if it
+    changed on disk.
+    """
+    def __init__(self, dll_filename, hot_reload=False):
+        self.filename = dll_filename
+        self.hot_reload = hot_reload
+        self._entry = None
+        self._bind(library_registry.acquire(dll_filename, hot_reload))
+
+    def __repr__(self):
+        return f"<OfxPluginLibrary '{self.filename}'>"
+
+    def _bind(self, entry):
+        self._entry = entry
+        self._hll = entry.dll
         hllApiProto = CFUNCTYPE(c_int)
         hllApiParams = ()
         self.OfxGetNumberOfPlugins = hllApiProto(("OfxGetNumberOfPlugins", self._hll), hllApiParams)
@@ -692,17 +2270,397 @@ class OfxPluginLibrary:
         hllApiParams = ((1, "nth", 0),)
         self.OfxGetPlugin = hllApiProto(("OfxGetPlugin", self._hll), hllApiParams)
         def errcheck(result, func, args):
-            return result.contents  # dereferences pointer
+            plugin = result.contents  # dereferences pointer
+            # The plugin structure lives in the library, keep it loaded
+            library_registry.add_ref(entry)
+            plugin.library_entry = entry
+            weakref.finalize(plugin, library_registry.release, entry)
+            return plugin
         self.OfxGetPlugin.errcheck = errcheck
 
+    def has_changed(self):
+        return self._entry is not None and library_registry.has_changed(self._entry)
+
+    def reload(self):
+        """
+        Load the new version of the library if its file changed (only in hot
+        reload mode). Plugins obtained before reloading keep using the previous
+        version, which gets unloaded once they are all released.
+        Return True if the library was reloaded.
+        """
+        if not self.hot_reload or not self.has_changed():
+            return False
+        previous = self._entry
+        self._bind(library_registry.acquire(self.filename, True))
+        library_registry.release(previous)
+        return True
+
     def close(self):
-        handle = self._hll._handle
-        if sys.platform == "win32":
-            kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
-            kernel32.FreeLibrary.argtypes = [ctypes.wintypes.HMODULE]
-            kernel32.FreeLibrary(handle)
-        else:
-            libdl = ctypes.cdll.LoadLibrary('libdl.so')
-            libdl.dlclose(handle)
+        if self._entry is not None:
+            library_registry.release(self._entry)
+            self._entry = None
+            self._hll = None
         self.OfxGetNumberOfPlugins = lambda: 0
         self.OfxGetPlugin = lambda n: None
+
+
+def cook_effect(plugin, instance, in_args=None, host=None):
+    """
+    Run the cook action of a plugin on an effect instance (OfxMeshEffect)
+    and return its status. Buffers allocated during the cook are charged to
+    the memory account of the instance, meshes are released at the end of
+    the action (see release_instance_meshes) and digests of the output are
+    invalidated, so hosts should cook through this rather than through
+    plugin.mainEntry directly. If the host is given, the action is recorded
+    by its profiler and tracer (see OfxHost.mainEntry).
+    """
+    py_instance = instance.internal
+    py_instance.memory.resetPeak()
+    with memory_scope(py_instance.memory):
+        try:
+            if host is not None:
+                return host.mainEntry(plugin, kOfx.MeshEffectActionCook, byref(instance), in_args, None)
+            return plugin.mainEntry(kOfx.MeshEffectActionCook, byref(instance), in_args, None)
+        finally:
+            # The plugin wrote the output (or forwarded input buffers to it)
+            # through data pointers, that attribute digests cannot see.
+            output = py_instance.inputs.get(kOfx.MeshMainOutput)
+            if output is not None:
+                output.touch()
+            release_instance_meshes(py_instance)
+
+class OfxEffectRunner:
+    """
+    Higher level wrapper around the actions of a mesh effect plugin, running
+    the load, describe, instance creation and cook steps in the right order.
+    Actions that do not return kOfx.StatOK raise an OfxStatusError.
+    If validate is True, input meshes are checked before each cook and the
+    main output after it (see openmfx_validate), raising a
+    MeshValidationError on errors.
+    """
+    def __init__(self, host, plugin, validate=False):
+        self.host = host
+        self.plugin = plugin
+        self.loaded = False
+        self.descriptor = None
+        self.validate = validate
+        plugin.setHost(host)
+
+    def __repr__(self):
+        return f"<OfxEffectRunner {self.plugin}>"
+
+    def mainEntry(self, action, handle=None, in_args=None, out_args=None):
+        return self.host.mainEntry(self.plugin, action, handle, in_args, out_args)
+
+    def check(self, action, handle=None, in_args=None, out_args=None):
+        status = self.mainEntry(action, handle, in_args, out_args)
+        if status != kOfx.StatOK:
+            raise OfxStatusError(action, status)
+
+    def load(self):
+        if not self.loaded:
+            self.check(kOfx.ActionLoad)
+            self.loaded = True
+
+    def unload(self):
+        if self.loaded:
+            self.loaded = False
+            self.descriptor = None
+            self.check(kOfx.ActionUnload)
+
+    def describe(self):
+        """Return the OfxMeshEffectInternal describing the effect"""
+        if self.descriptor is None:
+            self.load()
+            descriptor = OfxMeshEffect(OfxMeshEffectInternal())
+            self.check(kOfx.ActionDescribe, byref(descriptor))
+            self.descriptor = descriptor.internal
+        return self.descriptor
+
+    def createInstance(self):
+        """
+        Return the handle (OfxMeshEffect) of a new instance, whose parameters
+        are set to their default values. The handle must be kept alive as long
+        as the instance is used.
+        """
+        py_instance = deepcopy(self.describe())
+        for param in py_instance.params.values():
+            param.resetToDefault()
+        instance = OfxMeshEffect(py_instance)
+        self.check(kOfx.ActionCreateInstance, byref(instance))
+        entry = getattr(self.plugin, "library_entry", None)
+        if entry is not None:
+            library_registry.add_ref(entry)
+        return instance
+
+    def destroyInstance(self, instance):
+        try:
+            self.check(kOfx.ActionDestroyInstance, byref(instance))
+        finally:
+            entry = getattr(self.plugin, "library_entry", None)
+            if entry is not None:
+                library_registry.release(entry)
+
+    def cook(self, instance, time=None):
+        """
+        Cook the instance. If a time is given, it is passed to the plugin in
+        the kOfx.PropTime property of the action's inArgs and used as the
+        current time of parameters.
+        """
+        in_args = None
+        if time is not None:
+            for param in instance.internal.params.values():
+                param.current_time = time
+            in_args = pointer(to_handle(OfxPropertySet({ kOfx.PropTime: [time] })))
+        py_instance = instance.internal
+        if self.validate:
+            from openmfx_validate import validate_inputs, validate_mesh
+            for report in validate_inputs(py_instance).values():
+                report.check()
+        status = cook_effect(self.plugin, instance, in_args, self.host)
+        if status != kOfx.StatOK:
+            raise OfxStatusError(kOfx.MeshEffectActionCook, status)
+        if self.validate:
+            validate_mesh(py_instance.inputs[kOfx.MeshMainOutput].mesh).check()
+
+    def cookFrames(self, instance, times, cache_size=8):
+        """
+        Cook the same warm instance at each of the given times and yield
+        (time, output mesh) pairs. A frame whose parameter values and input
+        meshes are the same as one of the last cache_size distinct cooked frames
+        is not cooked again but reuses its output mesh.
+        Input meshes are compared by identity, so meshes must not be modified
+        in place while cooking frames.
+        """
+        py_instance = instance.internal
+        output = py_instance.inputs[kOfx.MeshMainOutput]
+        params = list(py_instance.params.values())
+        inputs = [i for name, i in py_instance.inputs.items() if name != kOfx.MeshMainOutput]
+        cache = OrderedDict()
+        for time in times:
+            key = (
+                tuple(tuple(p.valueAtTime(time) or ()) for p in params),
+                tuple(id(i.meshAtTime(time)) for i in inputs),
+            )
+            mesh = cache.get(key)
+            if mesh is not None:
+                cache.move_to_end(key)
+            else:
+                output.mesh = OfxMeshInternal()
+                self.cook(instance, time)
+                mesh = output.mesh
+                cache[key] = mesh
+                if len(cache) > cache_size:
+                    cache.popitem(last=False)
+            yield time, mesh
+
+
+def parse_param_value(param, text):
+    """
+    Parse a parameter value given on the command line, whose components are
+    separated by commas (e.g. "1,0,0" for a Double3D).
+    """
+    if param.type in (kOfx.ParamTypeString, kOfx.ParamTypeCustom):
+        return [text.encode()]
+    components = text.split(",")
+    expected = param.marshaller.count
+    if len(components) != expected:
+        raise ValueError(f"Parameter '{param.name.decode()}' expects {expected} comma-separated components, got '{text}'")
+    if param.type == kOfx.ParamTypeBoolean:
+        value = components[0].lower()
+        if value not in ("0", "1", "true", "false", "yes", "no", "on", "off"):
+            raise ValueError(f"Invalid boolean value for parameter '{param.name.decode()}': '{text}'")
+        return [value in ("1", "true", "yes", "on")]
+    component_type = param.marshaller.component_type
+    try:
+        return [component_type(c) for c in components]
+    except ValueError:
+        raise ValueError(f"Invalid value for parameter '{param.name.decode()}' of type {param.type.decode()}: '{text}'")
+
+class OfxPhaseTimer:
+    """Cumulative time and count of the phases of a command line run"""
+    def __init__(self):
+        self.phases = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                total, count = self.phases.get(name, (0.0, 0))
+                self.phases[name] = (total + duration, count + 1)
+
+    def report(self, file=None):
+        print(f"{'phase':<14} {'count':>6} {'total (ms)':>12} {'mean (ms)':>12}", file=file)
+        for name, (total, count) in self.phases.items():
+            print(f"{name:<14} {count:>6} {total * 1e3:>12.3f} {total / count * 1e3:>12.3f}", file=file)
+
+def main(argv=None):
+    """Command line interface, see python -m openmfx --help"""
+    # Imported here to keep the import of the module itself fast
+    import argparse
+    import queue
+    from concurrent.futures import ThreadPoolExecutor
+    from openmfx_pipeline import bind_frame, read_mesh, write_mesh, mesh_readers
+
+    parser = argparse.ArgumentParser(
+        prog="python -m openmfx",
+        description="Cook a mesh effect on mesh files (.obj or .npz). If the main input is a directory, all of its mesh files are cooked in parallel into the output directory.",
+    )
+    parser.add_argument("library", help="OpenMfx plugin library (.ofx)")
+    parser.add_argument("params", nargs="*", metavar="NAME=VALUE", help="Parameter values, with comma-separated components")
+    parser.add_argument("-p", "--plugin", help="Identifier of the plugin (by default the library must contain only one)")
+    parser.add_argument("-i", "--input", action="append", default=[], metavar="[NAME=]PATH", help="Input mesh file (or directory for the main input), for the main input unless a name is given")
+    parser.add_argument("-o", "--output", help="Output mesh file, or directory if the main input is a directory")
+    parser.add_argument("-t", "--time", type=float, help="Time at which to cook")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="Number of files cooked in parallel for directory inputs")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Do not print host logs")
+    parser.add_argument("--validate", action="store_true", help="Check input and output meshes of each cook, failing on malformed meshes")
+    parser.add_argument("--memory-budget", type=float, metavar="MB", help="Fail mesh allocations beyond this total size of mesh buffers")
+    parser.add_argument("--list", action="store_true", help="List the plugins, parameters and inputs and exit")
+    args = parser.parse_args(argv)
+
+    if args.memory_budget is not None:
+        process_memory.budget = int(args.memory_budget * 1024 * 1024)
+
+    out = sys.stdout
+    if args.quiet:
+        sys.stdout = open(os.devnull, "w")
+    timer = OfxPhaseTimer()
+    try:
+        start = time.perf_counter()
+        with timer.phase("load"):
+            host = OfxHost()
+            lib = OfxPluginLibrary(args.library)
+            plugins = [lib.OfxGetPlugin(i) for i in range(lib.OfxGetNumberOfPlugins())]
+            identifiers = [p.pluginIdentifier.decode() for p in plugins]
+            if args.plugin is not None:
+                if args.plugin not in identifiers:
+                    parser.error(f"No plugin '{args.plugin}' in library, available plugins: {', '.join(identifiers)}")
+                plugin = plugins[identifiers.index(args.plugin)]
+            elif len(plugins) == 1 or args.list:
+                plugin = plugins[0] if plugins else None
+            else:
+                parser.error(f"Library has {len(plugins)} plugins, choose one with --plugin: {', '.join(identifiers)}")
+            if plugin is None:
+                parser.error("Library contains no plugin")
+            runner = OfxEffectRunner(host, plugin, validate=args.validate)
+            runner.load()
+
+        with timer.phase("describe"):
+            descriptor = runner.describe()
+
+        if args.list:
+            print(f"Plugins: {', '.join(identifiers)}", file=out)
+            print(f"Plugin '{plugin.pluginIdentifier.decode()}':", file=out)
+            for name, param in descriptor.params.items():
+                print(f"  param {name.decode()} ({param.type.decode()[12:]})", file=out)
+            for name in descriptor.inputs:
+                print(f"  input {name.decode()}", file=out)
+            return 0
+
+        values = {}
+        for assignment in args.params:
+            name, sep, text = assignment.partition("=")
+            param = descriptor.params.get(name.encode())
+            if not sep or param is None:
+                parser.error(f"Invalid parameter '{assignment}', available parameters: {', '.join(n.decode() for n in descriptor.params)}")
+            try:
+                values[param.name] = parse_param_value(param, text)
+            except ValueError as e:
+                parser.error(str(e))
+
+        input_paths = {}
+        for assignment in args.input:
+            name, sep, path = assignment.rpartition("=")
+            name = name.encode() if sep else kOfx.MeshMainInput
+            if name not in descriptor.inputs or name == kOfx.MeshMainOutput:
+                parser.error(f"Invalid input '{name.decode()}', available inputs: {', '.join(n.decode() for n in descriptor.inputs if n != kOfx.MeshMainOutput)}")
+            input_paths[name] = path
+
+        # Jobs are (main input file, output file) pairs
+        main_path = input_paths.pop(kOfx.MeshMainInput, None)
+        if main_path is not None and os.path.isdir(main_path):
+            if args.output is None:
+                parser.error("An output directory is required for directory inputs")
+            os.makedirs(args.output, exist_ok=True)
+            jobs = [
+                (os.path.join(main_path, filename), os.path.join(args.output, filename))
+                for filename in sorted(os.listdir(main_path))
+                if os.path.splitext(filename)[1].lower() in mesh_readers
+            ]
+        else:
+            jobs = [(main_path, args.output)]
+
+        # Other inputs are read once and shared by all instances
+        meshes = {}
+        for name, path in input_paths.items():
+            with timer.phase("input bind"):
+                meshes[name] = bind_frame(read_mesh(path))
+
+        instances = []
+        for _ in range(max(min(args.jobs, len(jobs)), 1)):
+            with timer.phase("instance"):
+                instance = runner.createInstance()
+                py_instance = instance.internal
+                for name, value in values.items():
+                    py_instance.params[name].value = list(value)
+                for name, mesh in meshes.items():
+                    py_instance.inputs[name].mesh = mesh
+                instances.append(instance)
+
+        available = queue.Queue()
+        for instance in instances:
+            available.put(instance)
+
+        def run(job):
+            input_path, output_path = job
+            instance = available.get()
+            try:
+                py_instance = instance.internal
+                if input_path is not None and kOfx.MeshMainInput in py_instance.inputs:
+                    with timer.phase("input bind"):
+                        mesh = bind_frame(read_mesh(input_path))
+                        mesh.transient = True
+                        py_instance.inputs[kOfx.MeshMainInput].mesh = mesh
+                output = py_instance.inputs[kOfx.MeshMainOutput]
+                with timer.phase("cook"):
+                    output.mesh = OfxMeshInternal()
+                    runner.cook(instance, args.time)
+                if output_path is not None:
+                    with timer.phase("output write"):
+                        write_mesh(output_path, output.mesh)
+            finally:
+                # Do not keep meshes of this job alive while the instance waits for the next one
+                py_instance.inputs[kOfx.MeshMainOutput].mesh = None
+                if input_path is not None and kOfx.MeshMainInput in py_instance.inputs:
+                    py_instance.inputs[kOfx.MeshMainInput].mesh = None
+                available.put(instance)
+
+        with ThreadPoolExecutor(max_workers=len(instances)) as pool:
+            list(pool.map(run, jobs))
+
+        for instance in instances:
+            runner.destroyInstance(instance)
+        runner.unload()
+        wall_time = time.perf_counter() - start
+    finally:
+        if args.quiet:
+            sys.stdout.close()
+            sys.stdout = out
+
+    timer.report(file=out)
+    print(f"Cooked {len(jobs)} mesh(es) in {wall_time * 1e3:.3f} ms with {len(instances)} instance(s)", file=out)
+    print(f"Peak mesh memory: {process_memory.peak / (1024 * 1024):.3f} MB", file=out)
+    return 0
+
+
+if __name__ == "__main__":
+    # Run from the openmfx module rather than __main__, so that types are the
+    # same as those seen by modules that import openmfx.
+    import openmfx
+    sys.exit(openmfx.main())
@@ -0,0 +1,179 @@
+"""
+Packed cooking of many small meshes (e.g. fractured pieces) in few cooks.
+
+Input meshes are concatenated into a single mesh, whose corner points are
+offset accordingly and whose faces get a source_id_attribute telling the
+index of the mesh they come from. The packed mesh is cooked once and its
+output is split back into one mesh per input.
+
+This is only valid for effects that work locally per point or per face, and
+that keep the number of points, corners and faces of their input (e.g. a
+deformer), since the output is split with the layout of the input.
+
+    from openmfx_batch import cook_packed
+
+    outputs = cook_packed(runner, instance, meshes)
+"""
+
+import numpy as np
+
+from openmfx import OfxAttribute, OfxMeshInternal
+from openmfx import constants as kOfx
+
+source_id_attribute = b"sourceId"
+
+packed_attachments = (kOfx.MeshAttribPoint, kOfx.MeshAttribCorner, kOfx.MeshAttribFace)
+
+class PackedLayout:
+    """
+    Offsets of each source mesh in a packed mesh. For each attachment, the
+    elements of mesh i are in range offsets[attachment][i:i+2].
+    """
+    def __init__(self, point_counts, corner_counts, face_counts):
+        def offsets(counts):
+            result = np.zeros(len(counts) + 1, dtype=np.int64)
+            np.cumsum(counts, out=result[1:])
+            return result
+        self.offsets = {
+            kOfx.MeshAttribPoint: offsets(point_counts),
+            kOfx.MeshAttribCorner: offsets(corner_counts),
+            kOfx.MeshAttribFace: offsets(face_counts),
+        }
+
+    def __len__(self):
+        return len(self.offsets[kOfx.MeshAttribPoint]) - 1
+
+    def counts(self, attachment):
+        return np.diff(self.offsets[attachment])
+
+    def total(self, attachment):
+        return int(self.offsets[attachment][-1])
+
+    def cornerPointOffsets(self):
+        """Point offset of the mesh of each corner of the packed mesh"""
+        return np.repeat(self.offsets[kOfx.MeshAttribPoint][:-1], self.counts(kOfx.MeshAttribCorner))
+
+
+def shared_attributes(meshes, attachment):
+    """
+    Attributes of the given attachment that are present in all meshes with the
+    same type and component count, as a dict name -> (component_count, type)
+    """
+    def layouts(mesh):
+        return {
+            name: (attr.component_count, attr.attribute_type)
+            for name, attr in mesh.attributes.get(attachment, {}).items()
+        }
+    result = layouts(meshes[0])
+    for mesh in meshes[1:]:
+        other = layouts(mesh)
+        result = { name: layout for name, layout in result.items() if other.get(name) == layout }
+    return result
+
+def pack_meshes(meshes):
+    """
+    Concatenate meshes into a single new mesh and return it together with its
+    PackedLayout. Attributes shared by all meshes are packed, and a face
+    attribute source_id_attribute holds the index of the source mesh.
+    """
+    if not meshes:
+        raise ValueError("No mesh to pack")
+    layout = PackedLayout(
+        [mesh.point_count for mesh in meshes],
+        [mesh.corner_count for mesh in meshes],
+        [mesh.face_count for mesh in meshes],
+    )
+
+    packed = OfxMeshInternal()
+    packed.point_count = layout.total(kOfx.MeshAttribPoint)
+    packed.corner_count = layout.total(kOfx.MeshAttribCorner)
+    packed.face_count = layout.total(kOfx.MeshAttribFace)
+    names = {}
+    for attachment in packed_attachments:
+        names[attachment] = shared_attributes(meshes, attachment)
+        for name, (component_count, attribute_type) in names[attachment].items():
+            if name not in packed.attributes[attachment]:
+                packed.attributes[attachment][name] = OfxAttribute(name, attachment, component_count, attribute_type)
+    faces = packed.attributes[kOfx.MeshAttribFace]
+    faces[source_id_attribute] = OfxAttribute(source_id_attribute, kOfx.MeshAttribFace, 1, kOfx.MeshAttribTypeInt)
+    packed.allocate()
+
+    for attachment in packed_attachments:
+        for name in names[attachment]:
+            parts = [mesh.as_array(attachment, name) for mesh in meshes]
+            if parts:
+                np.concatenate(parts, out=packed.as_array(attachment, name))
+
+    corner_points = packed.as_array(kOfx.MeshAttribCorner, kOfx.MeshAttribCornerPoint)
+    corner_points += layout.cornerPointOffsets().astype(corner_points.dtype)
+    source_ids = packed.as_array(kOfx.MeshAttribFace, source_id_attribute)
+    source_ids[:] = np.repeat(np.arange(len(meshes), dtype=source_ids.dtype), layout.counts(kOfx.MeshAttribFace))
+    packed.touch()
+    return packed, layout
+
+def split_mesh(mesh, layout):
+    """
+    Split a packed mesh (typically the output of a cook of a mesh returned by
+    pack_meshes) into a list of new meshes, one per source mesh. The packed
+    mesh must have the element counts of the layout.
+    """
+    counts = (mesh.point_count, mesh.corner_count, mesh.face_count)
+    expected = tuple(layout.total(attachment) for attachment in packed_attachments)
+    if counts != expected:
+        raise ValueError(
+            f"Packed mesh has {counts[0]} points, {counts[1]} corners and {counts[2]} faces "
+            f"but its layout expects {expected[0]}, {expected[1]} and {expected[2]}"
+        )
+
+    pieces = [OfxMeshInternal() for _ in range(len(layout))]
+    point_counts = layout.counts(kOfx.MeshAttribPoint).tolist()
+    corner_counts = layout.counts(kOfx.MeshAttribCorner).tolist()
+    face_counts = layout.counts(kOfx.MeshAttribFace).tolist()
+    for piece, point_count, corner_count, face_count in zip(pieces, point_counts, corner_counts, face_counts):
+        piece.point_count = point_count
+        piece.corner_count = corner_count
+        piece.face_count = face_count
+
+    arrays = {}
+    for attachment in packed_attachments:
+        for name, attr in mesh.attributes[attachment].items():
+            if name == source_id_attribute:
+                continue
+            array = mesh.as_array(attachment, name)
+            if name == kOfx.MeshAttribCornerPoint:
+                array = array - layout.cornerPointOffsets().astype(array.dtype)
+            arrays[(attachment, name)] = np.split(array, layout.offsets[attachment][1:-1])
+            for piece in pieces:
+                if name not in piece.attributes[attachment]:
+                    piece.attributes[attachment][name] = OfxAttribute(name, attachment, attr.component_count, attr.attribute_type)
+
+    for i, piece in enumerate(pieces):
+        piece.allocate()
+        for (attachment, name), parts in arrays.items():
+            piece.as_array(attachment, name)[:] = parts[i]
+    return pieces
+
+def cook_packed(runner, instance, meshes, batch_size=1024, time=None, input_name=kOfx.MeshMainInput):
+    """
+    Cook each of the meshes through the instance (see OfxEffectRunner) and
+    return the list of output meshes, packing up to batch_size meshes per cook.
+    Packed meshes are only alive during their cook, other inputs of the
+    instance are left untouched.
+    """
+    py_instance = instance.internal
+    mesh_input = py_instance.inputs[input_name]
+    output = py_instance.inputs[kOfx.MeshMainOutput]
+    outputs = []
+    for start in range(0, len(meshes), batch_size):
+        packed, layout = pack_meshes(meshes[start:start + batch_size])
+        # Buffers freed at the end of the cook action (see release_instance_meshes)
+        packed.transient = True
+        mesh_input.mesh = packed
+        output.mesh = OfxMeshInternal()
+        try:
+            runner.cook(instance, time)
+            outputs.extend(split_mesh(output.mesh, layout))
+        finally:
+            mesh_input.mesh = None
+            output.mesh = None
+    return outputs
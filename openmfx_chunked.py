@@ -0,0 +1,187 @@
+"""
+Out-of-core cooking of meshes that do not fit in memory, for effects that
+work locally per point (deformers) or per face (attribute remaps).
+
+Meshes are stored on disk as a directory of .npy files (points, corners and
+face_sizes, as in openmfx_pipeline.MeshFrame) that are memory-mapped. The
+input is cut into chunks of points or of faces that are cooked one after
+the other, and output chunks are written straight into the memory-mapped
+output, so that memory stays bounded by the given budget.
+
+The effect is not asked whether it is local, the caller is responsible for
+choosing the mode: a point-local effect must keep the number of points of
+its input and not depend on neighbors, and a face-local effect must keep
+the number of faces and corners.
+
+    from openmfx_chunked import ChunkedMesh, cook_chunked
+
+    source = ChunkedMesh.open("scan")
+    stats = cook_chunked(runner, instance, source, "scan_deformed", mode="point")
+"""
+
+import os
+import time as _time
+
+import numpy as np
+
+from openmfx import OfxMeshInternal
+from openmfx import constants as kOfx
+
+class ChunkedMesh:
+    """
+    A mesh stored as memory-mapped .npy files in a directory: point positions
+    (N x 3 floats), corner points (M ints) and face sizes (F ints).
+    """
+    def __init__(self, path, points, corners, face_sizes):
+        self.path = path
+        self.points = points
+        self.corners = corners
+        self.face_sizes = face_sizes
+
+    def __repr__(self):
+        return f"<ChunkedMesh '{self.path}' {self.counts}>"
+
+    @classmethod
+    def open(cls, path, mode="r"):
+        def load(name):
+            return np.load(os.path.join(path, name + ".npy"), mmap_mode=mode)
+        return cls(path, load("points"), load("corners"), load("face_sizes"))
+
+    @classmethod
+    def create(cls, path, point_count, corner_count, face_count):
+        os.makedirs(path, exist_ok=True)
+        def create(name, dtype, shape):
+            return np.lib.format.open_memmap(os.path.join(path, name + ".npy"), mode="w+", dtype=dtype, shape=shape)
+        return cls(
+            path,
+            create("points", np.float32, (point_count, 3)),
+            create("corners", np.int32, (corner_count,)),
+            create("face_sizes", np.int32, (face_count,)),
+        )
+
+    @classmethod
+    def from_mesh(cls, path, mesh):
+        """Write an OfxMeshInternal to a directory"""
+        chunked = cls.create(path, mesh.point_count, mesh.corner_count, mesh.face_count)
+        chunked.points[:] = mesh.as_array(kOfx.MeshAttribPoint, kOfx.MeshAttribPointPosition)
+        chunked.corners[:] = mesh.as_array(kOfx.MeshAttribCorner, kOfx.MeshAttribCornerPoint)
+        chunked.face_sizes[:] = mesh.as_array(kOfx.MeshAttribFace, kOfx.MeshAttribFaceSize)
+        chunked.flush()
+        return chunked
+
+    @property
+    def counts(self):
+        return len(self.points), len(self.corners), len(self.face_sizes)
+
+    def flush(self):
+        for array in (self.points, self.corners, self.face_sizes):
+            if isinstance(array, np.memmap):
+                array.flush()
+
+
+def borrow_array(attribute, array):
+    """
+    Point a non-owning attribute to the buffer of a contiguous numpy array,
+    which must be kept alive as long as the attribute is used.
+    """
+    attribute.is_owner = False
+    attribute.data = array.ctypes.data if len(array) > 0 else None
+    attribute.stride = array.strides[0] if array.ndim > 0 else array.itemsize
+    attribute.touch()
+
+def make_chunk(points, corners, face_sizes):
+    """
+    Input mesh whose attributes point to the given arrays (no copy), that must
+    be kept alive during the cook.
+    """
+    mesh = OfxMeshInternal()
+    mesh.point_count = len(points)
+    mesh.corner_count = len(corners)
+    mesh.face_count = len(face_sizes)
+    borrow_array(mesh.attributes[kOfx.MeshAttribPoint][kOfx.MeshAttribPointPosition], points)
+    borrow_array(mesh.attributes[kOfx.MeshAttribCorner][kOfx.MeshAttribCornerPoint], corners)
+    borrow_array(mesh.attributes[kOfx.MeshAttribFace][kOfx.MeshAttribFaceSize], face_sizes)
+    return mesh
+
+def chunk_size(memory_budget, element_bytes):
+    """Number of elements of element_bytes each that fit in the budget"""
+    return max(1, int(memory_budget // max(element_bytes, 1)))
+
+def copy_chunked(source, target, size):
+    for start in range(0, len(source), size):
+        target[start:start + size] = source[start:start + size]
+
+def cook_chunked(runner, instance, source, target_path, mode="point", memory_budget=256 << 20, time=None, input_name=kOfx.MeshMainInput):
+    """
+    Cook the ChunkedMesh source through the instance (see OfxEffectRunner)
+    chunk by chunk and write the result to a new ChunkedMesh at target_path.
+    mode is either "point", to cook chunks of points without any face, or
+    "face", to cook chunks of faces together with the points they use.
+    memory_budget (in bytes) bounds the size of chunks, accounting for input
+    and output buffers. Return statistics: number of chunks, elements per
+    chunk and wall time.
+    """
+    if mode not in ("point", "face"):
+        raise ValueError(f"Invalid chunking mode '{mode}', must be 'point' or 'face'")
+    start_time = _time.perf_counter()
+    point_count, corner_count, face_count = source.counts
+    target = ChunkedMesh.create(target_path, point_count, corner_count, face_count)
+
+    py_instance = instance.internal
+    mesh_input = py_instance.inputs[input_name]
+    output = py_instance.inputs[kOfx.MeshMainOutput]
+    def cook(chunk):
+        mesh_input.mesh = chunk
+        output.mesh = OfxMeshInternal()
+        runner.cook(instance, time)
+        mesh = output.mesh
+        expected = (chunk.point_count, chunk.corner_count, chunk.face_count)
+        if (mesh.point_count, mesh.corner_count, mesh.face_count) != expected:
+            raise ValueError(f"Effect is not {mode}-local: output counts differ from input chunk {expected}")
+        output.mesh = None
+        mesh_input.mesh = None
+        return mesh
+
+    point_bytes = source.points.itemsize * 3
+    if mode == "point":
+        # Input points are read through the mapping, output points are
+        # allocated by the plugin then copied to the target mapping.
+        size = chunk_size(memory_budget, 2 * point_bytes)
+        empty = np.empty(0, dtype=np.int32)
+        chunk_count = 0
+        for start in range(0, point_count, size):
+            points = np.ascontiguousarray(source.points[start:start + size])
+            mesh = cook(make_chunk(points, empty, empty))
+            target.points[start:start + size] = mesh.as_array(kOfx.MeshAttribPoint, kOfx.MeshAttribPointPosition)
+            chunk_count += 1
+        copy_chunked(source.corners, target.corners, chunk_size(memory_budget, 8))
+        copy_chunked(source.face_sizes, target.face_sizes, chunk_size(memory_budget, 8))
+    else:
+        # Points that are not used by any face are copied as is
+        copy_chunked(source.points, target.points, chunk_size(memory_budget, 2 * point_bytes))
+        corners_per_face = corner_count / face_count if face_count else 0
+        # Per face: its size, and per corner its point index, local index and
+        # gathered position, both for input and output.
+        face_bytes = 2 * (4 + corners_per_face * (4 + 8 + point_bytes))
+        size = chunk_size(memory_budget, face_bytes)
+        chunk_count = 0
+        corner_start = 0
+        for start in range(0, face_count, size):
+            face_sizes = np.ascontiguousarray(source.face_sizes[start:start + size])
+            corner_end = corner_start + int(face_sizes.sum())
+            point_indices, local_corners = np.unique(source.corners[corner_start:corner_end], return_inverse=True)
+            points = np.ascontiguousarray(source.points[point_indices])
+            local_corners = local_corners.astype(np.int32)
+            mesh = cook(make_chunk(points, local_corners, face_sizes))
+            target.points[point_indices] = mesh.as_array(kOfx.MeshAttribPoint, kOfx.MeshAttribPointPosition)
+            target.corners[corner_start:corner_end] = point_indices[mesh.as_array(kOfx.MeshAttribCorner, kOfx.MeshAttribCornerPoint)]
+            target.face_sizes[start:start + size] = mesh.as_array(kOfx.MeshAttribFace, kOfx.MeshAttribFaceSize)
+            corner_start = corner_end
+            chunk_count += 1
+
+    target.flush()
+    return {
+        "chunks": chunk_count,
+        "chunk_size": size,
+        "wall_time": _time.perf_counter() - start_time,
+    }
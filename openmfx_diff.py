@@ -0,0 +1,305 @@
+"""
+Comparison of meshes, for regression tests of plugin outputs.
+
+Element counts and integer attributes (among which the topology, namely
+corner points and face sizes) must match exactly, while float attributes
+are compared within an absolute and a relative tolerance, like
+numpy.isclose. Each attribute is compared in a few vectorized passes and
+the worst offending elements are reported.
+
+    from openmfx_diff import diff_meshes, GoldenStore
+
+    diff = diff_meshes(expected, actual, atol=1e-5)
+    if not diff.equal:
+        print(diff)
+
+A GoldenStore records reference meshes in a directory, as compressed .npz
+files together with their digest, so that checking an output that did not
+change does not even need to load the reference:
+
+    store = GoldenStore("golden")
+    diff = store.check("translate/quad", output_mesh)
+"""
+
+import json
+import os
+import re
+
+import numpy as np
+
+from openmfx import OfxAttribute, OfxMeshInternal
+from openmfx import constants as kOfx
+
+mesh_attachments = (kOfx.MeshAttribPoint, kOfx.MeshAttribCorner, kOfx.MeshAttribFace, kOfx.MeshAttribMesh)
+
+class AttributeDiff:
+    """
+    Comparison of the values of an attribute: mismatch_count elements are
+    out of tolerance, the largest absolute error is max_error and worst
+    lists up to a few (index, expected, actual, error) of the worst elements.
+    """
+    def __init__(self, attachment, name, mismatch_count=0, max_error=0.0, worst=None, message=None):
+        self.attachment = attachment
+        self.name = name
+        self.mismatch_count = mismatch_count
+        self.max_error = max_error
+        self.worst = worst if worst is not None else []
+        self.message = message
+
+    def __repr__(self):
+        return f"<AttributeDiff '{self.label}' {self.mismatch_count} mismatches>"
+
+    def __str__(self):
+        if self.message is not None:
+            return f"{self.label}: {self.message}"
+        lines = [f"{self.label}: {self.mismatch_count} elements differ (max error {self.max_error:.6g})"]
+        for index, expected, actual, error in self.worst:
+            lines.append(f"  #{index}: expected {expected}, got {actual} (error {error:.6g})")
+        return "\n".join(lines)
+
+    @property
+    def label(self):
+        name = self.name.decode() if isinstance(self.name, bytes) else str(self.name)
+        if self.attachment is None:
+            return name
+        return f"{self.attachment.decode()}/{name}"
+
+    @property
+    def equal(self):
+        return self.mismatch_count == 0 and self.message is None
+
+    def as_dict(self):
+        return {
+            "attachment": self.attachment.decode() if self.attachment is not None else None,
+            "name": self.name.decode() if isinstance(self.name, bytes) else self.name,
+            "mismatch_count": self.mismatch_count,
+            "max_error": self.max_error,
+            "worst": self.worst,
+            "message": self.message,
+        }
+
+
+class MeshDiff:
+    """
+    Comparison of two meshes, see diff_meshes(). Counts are the (point,
+    corner, face) counts of the expected and actual meshes, and attributes
+    the AttributeDiff of each attribute that differs.
+    """
+    def __init__(self, expected_counts, actual_counts):
+        self.expected_counts = expected_counts
+        self.actual_counts = actual_counts
+        self.attributes = []
+
+    def __repr__(self):
+        return f"<MeshDiff {'equal' if self.equal else f'{len(self.attributes)} attributes differ'}>"
+
+    def __str__(self):
+        if self.equal:
+            return "Meshes are equal"
+        lines = []
+        if self.expected_counts != self.actual_counts:
+            lines.append(
+                "Element counts differ: expected {} points, {} corners and {} faces, ".format(*self.expected_counts)
+                + "got {}, {} and {}".format(*self.actual_counts)
+            )
+        lines += [str(diff) for diff in self.attributes]
+        return "\n".join(lines)
+
+    @property
+    def equal(self):
+        return self.expected_counts == self.actual_counts and not self.attributes
+
+    @property
+    def topology_equal(self):
+        """True iff counts, corner points and face sizes match exactly"""
+        topology = {
+            (kOfx.MeshAttribCorner, kOfx.MeshAttribCornerPoint),
+            (kOfx.MeshAttribFace, kOfx.MeshAttribFaceSize),
+        }
+        return self.expected_counts == self.actual_counts and not any(
+            (diff.attachment, diff.name) in topology for diff in self.attributes
+        )
+
+    def as_dict(self):
+        return {
+            "equal": self.equal,
+            "expected_counts": list(self.expected_counts),
+            "actual_counts": list(self.actual_counts),
+            "attributes": [diff.as_dict() for diff in self.attributes],
+        }
+
+
+def diff_arrays(expected, actual, atol=1e-5, rtol=1e-5, worst=5, attachment=None, name=b"array"):
+    """
+    Compare two arrays of the same shape (one row per element) and return an
+    AttributeDiff. Floats are compared within tolerance, NaNs being equal to
+    NaNs, and other types exactly.
+    """
+    expected = np.asarray(expected)
+    actual = np.asarray(actual)
+    if expected.shape != actual.shape:
+        return AttributeDiff(attachment, name, message=f"shapes differ, expected {expected.shape}, got {actual.shape}")
+    if expected.size == 0 or np.array_equal(expected, actual):
+        return AttributeDiff(attachment, name)
+
+    is_float = expected.dtype.kind == "f" or actual.dtype.kind == "f"
+    if is_float:
+        with np.errstate(invalid="ignore", over="ignore"):
+            error = np.subtract(actual, expected)
+            np.abs(error, out=error)
+            tolerance = np.abs(expected) * rtol
+            tolerance += atol
+            bad = ~(error <= tolerance)
+        # Errors are NaN or infinite for non-finite values, that are equal if
+        # they are the same (NaN vs NaN, +inf vs +inf).
+        non_finite = ~np.isfinite(error)
+        if non_finite.any():
+            same = (expected == actual) | (np.isnan(expected) & np.isnan(actual))
+            bad = (bad & ~non_finite) | (non_finite & ~same)
+            error[non_finite & same] = 0
+            error[non_finite & ~same] = np.inf
+    else:
+        error = np.abs(np.subtract(actual, expected, dtype=np.int64))
+        bad = error != 0
+    if bad.ndim > 1:
+        # Reduce components column by column, which is faster than along a
+        # short last axis.
+        columns = bad.reshape(len(bad), -1)
+        bad = columns[:, 0].copy()
+        for i in range(1, columns.shape[1]):
+            bad |= columns[:, i]
+    indices = np.flatnonzero(bad)
+    mismatch_count = len(indices)
+    if mismatch_count == 0:
+        return AttributeDiff(attachment, name)
+
+    errors = error[indices].reshape(mismatch_count, -1).max(axis=1).astype(np.float64)
+    k = min(worst, mismatch_count)
+    order = np.argpartition(errors, mismatch_count - k)[mismatch_count - k:]
+    order = order[np.argsort(errors[order])[::-1]]
+    offenders = [
+        (int(indices[j]), expected[indices[j]].tolist(), actual[indices[j]].tolist(), float(errors[j]))
+        for j in order
+    ]
+    return AttributeDiff(attachment, name, mismatch_count, float(errors.max()), offenders)
+
+def diff_meshes(expected, actual, atol=1e-5, rtol=1e-5, worst=5, attributes=None):
+    """
+    Compare two OfxMeshInternal and return a MeshDiff. If attributes is
+    given, only these (attachment, name) pairs are compared, otherwise all
+    attributes of both meshes are. Attributes are only compared if element
+    counts match.
+    """
+    expected_counts = (expected.point_count, expected.corner_count, expected.face_count)
+    actual_counts = (actual.point_count, actual.corner_count, actual.face_count)
+    diff = MeshDiff(expected_counts, actual_counts)
+    if expected_counts != actual_counts:
+        return diff
+
+    if attributes is None:
+        attributes = []
+        for attachment in mesh_attachments:
+            names = set(expected.attributes.get(attachment, {})) | set(actual.attributes.get(attachment, {}))
+            attributes += [(attachment, name) for name in sorted(names)]
+
+    for attachment, name in attributes:
+        expected_attr = expected.attributes.get(attachment, {}).get(name)
+        actual_attr = actual.attributes.get(attachment, {}).get(name)
+        if expected_attr is None or actual_attr is None:
+            which = "actual" if actual_attr is None else "expected"
+            diff.attributes.append(AttributeDiff(attachment, name, message=f"missing from the {which} mesh"))
+            continue
+        expected_layout = (expected_attr.component_count, expected_attr.attribute_type)
+        actual_layout = (actual_attr.component_count, actual_attr.attribute_type)
+        if expected_layout != actual_layout:
+            diff.attributes.append(AttributeDiff(attachment, name, message=f"layouts differ, expected {expected_layout}, got {actual_layout}"))
+            continue
+        attribute_diff = diff_arrays(
+            expected.as_array(attachment, name), actual.as_array(attachment, name),
+            atol, rtol, worst, attachment, name,
+        )
+        if not attribute_diff.equal:
+            diff.attributes.append(attribute_diff)
+    return diff
+
+
+class GoldenStore:
+    """
+    Reference meshes stored in a directory, one compressed .npz file per key.
+    Keys are strings whose '/' separated parts become subdirectories. If
+    update is True, check() records the actual mesh instead of comparing it,
+    to regenerate references on demand.
+    """
+    def __init__(self, directory, update=False, atol=1e-5, rtol=1e-5):
+        self.directory = directory
+        self.update = update
+        self.atol = atol
+        self.rtol = rtol
+
+    def __repr__(self):
+        return f"<GoldenStore '{self.directory}'>"
+
+    def path(self, key):
+        parts = [re.sub(r"[^A-Za-z0-9._-]", "_", part) for part in key.split("/") if part]
+        return os.path.join(self.directory, *parts) + ".npz"
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    def save(self, key, mesh):
+        """Record the counts and all attributes of an OfxMeshInternal"""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        layout = []
+        arrays = {}
+        for attachment in mesh_attachments:
+            for name, attr in sorted(mesh.attributes.get(attachment, {}).items()):
+                arrays[f"a{len(layout)}"] = np.ascontiguousarray(mesh.as_array(attachment, name))
+                layout.append([attachment.decode(), name.decode(), attr.component_count, attr.attribute_type.decode()])
+        meta = {
+            "counts": [mesh.point_count, mesh.corner_count, mesh.face_count],
+            "digest": mesh.digest().hex(),
+            "attributes": layout,
+        }
+        # Write to a temporary file first so that a reference is never partial
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(tmp_path, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(tmp_path, path)
+
+    def digest(self, key):
+        """Digest of the recorded mesh, read without loading its arrays"""
+        with np.load(self.path(key)) as data:
+            return bytes.fromhex(json.loads(str(data["meta"]))["digest"])
+
+    def load(self, key):
+        """Return the recorded mesh as a new OfxMeshInternal"""
+        with np.load(self.path(key)) as data:
+            meta = json.loads(str(data["meta"]))
+            mesh = OfxMeshInternal()
+            mesh.point_count, mesh.corner_count, mesh.face_count = meta["counts"]
+            for attachment, name, component_count, attribute_type in meta["attributes"]:
+                attachment, name = attachment.encode(), name.encode()
+                attributes = mesh.attributes.setdefault(attachment, {})
+                if name not in attributes:
+                    attributes[name] = OfxAttribute(name, attachment, component_count, attribute_type.encode())
+            mesh.allocate()
+            for i, (attachment, name, _, _) in enumerate(meta["attributes"]):
+                mesh.as_array(attachment.encode(), name.encode())[...] = data[f"a{i}"]
+            mesh.touch()
+        return mesh
+
+    def check(self, key, mesh):
+        """
+        Compare a mesh to the reference recorded under key and return a
+        MeshDiff. The mesh is recorded (and considered equal) if there is no
+        reference yet or if the store is in update mode. Meshes with the same
+        digest as their reference are equal without any comparison, so a
+        mesh modified in place must have been touched (see OfxMeshInternal.touch).
+        """
+        counts = (mesh.point_count, mesh.corner_count, mesh.face_count)
+        if self.update or key not in self:
+            self.save(key, mesh)
+            return MeshDiff(counts, counts)
+        if self.digest(key) == mesh.digest():
+            return MeshDiff(counts, counts)
+        return diff_meshes(self.load(key), mesh, self.atol, self.rtol)
@@ -0,0 +1,202 @@
+"""
+Synthetic meshes for stress tests, scaling benchmarks and fuzzing plugins.
+
+Meshes are built directly in the buffers of a new OfxMeshInternal with
+vectorized numpy operations, so that even meshes of tens of millions of
+faces are generated in about a second. Random generators take a seed and
+always produce the same mesh for the same seed.
+
+    from openmfx_generate import grid, sphere, ngon_soup, add_random_attributes, degenerate_meshes
+
+    mesh = grid(1000, 1000)  # a million quads
+    mesh = add_random_attributes(ngon_soup(10000, seed=42), seed=42)
+    for name, mesh in degenerate_meshes():
+        ...
+"""
+
+import numpy as np
+
+from openmfx import OfxAttribute, OfxMeshInternal, attribute_numpy_types
+from openmfx import constants as kOfx
+
+def new_mesh(point_count, corner_count, face_count):
+    """
+    Allocate a mesh with the given element counts and return it together
+    with numpy views on its positions, corner points and face sizes.
+    """
+    mesh = OfxMeshInternal()
+    mesh.point_count = point_count
+    mesh.corner_count = corner_count
+    mesh.face_count = face_count
+    mesh.allocate()
+    return (
+        mesh,
+        mesh.as_array(kOfx.MeshAttribPoint, kOfx.MeshAttribPointPosition),
+        mesh.as_array(kOfx.MeshAttribCorner, kOfx.MeshAttribCornerPoint),
+        mesh.as_array(kOfx.MeshAttribFace, kOfx.MeshAttribFaceSize),
+    )
+
+def mesh_from_arrays(points, corners, face_sizes):
+    """Build a mesh from arrays of positions, corner points and face sizes"""
+    points = np.asarray(points, dtype=np.float32).reshape(-1, 3)
+    corners = np.asarray(corners, dtype=np.int32).reshape(-1)
+    face_sizes = np.asarray(face_sizes, dtype=np.int32).reshape(-1)
+    mesh, P, C, F = new_mesh(len(points), len(corners), len(face_sizes))
+    P[...] = points
+    C[...] = corners
+    F[...] = face_sizes
+    mesh.touch()
+    return mesh
+
+def grid(rows, columns, size=1.0, triangulate=False):
+    """
+    Flat grid of rows x columns quads (or twice as many triangles) in the XY
+    plane, centered on the origin and whose longest side is size.
+    """
+    scale = size / max(rows, columns, 1)
+    faces_per_cell = 2 if triangulate else 1
+    corners_per_cell = 6 if triangulate else 4
+    mesh, P, C, F = new_mesh((rows + 1) * (columns + 1), corners_per_cell * rows * columns, faces_per_cell * rows * columns)
+
+    P3 = P.reshape(rows + 1, columns + 1, 3)
+    P3[..., 0] = (np.arange(columns + 1, dtype=np.float32) - columns / 2) * scale
+    P3[..., 1] = (np.arange(rows + 1, dtype=np.float32)[:, None] - rows / 2) * scale
+    P3[..., 2] = 0.0
+
+    # Index of the bottom left point of each cell, then its corners in
+    # counter-clockwise order.
+    base = np.arange(rows, dtype=np.int32)[:, None] * (columns + 1) + np.arange(columns, dtype=np.int32)
+    cell = (0, 1, columns + 2, columns + 1)
+    order = (0, 1, 2, 0, 2, 3) if triangulate else (0, 1, 2, 3)
+    C3 = C.reshape(rows, columns, corners_per_cell)
+    for i, k in enumerate(order):
+        np.add(base, cell[k], out=C3[..., i])
+    F[...] = 3 if triangulate else 4
+    mesh.touch()
+    return mesh
+
+def sphere(rings, segments, radius=1.0):
+    """
+    UV sphere with the given number of rings (latitude bands, at least 2) and
+    segments (longitude bands, at least 3). Bands around the poles are made of
+    triangles and the others of quads.
+    """
+    if rings < 2 or segments < 3:
+        raise ValueError(f"A sphere needs at least 2 rings and 3 segments, got {rings} and {segments}")
+    quad_rings = rings - 2
+    point_count = 2 + (rings - 1) * segments
+    face_count = rings * segments
+    mesh, P, C, F = new_mesh(point_count, (6 + 4 * quad_rings) * segments, face_count)
+
+    theta = np.linspace(0, np.pi, rings + 1, dtype=np.float64)[1:-1, None]
+    phi = np.linspace(0, 2 * np.pi, segments, endpoint=False, dtype=np.float64)[None, :]
+    ring_points = P[1:-1].reshape(rings - 1, segments, 3)
+    ring_points[..., 0] = radius * np.sin(theta) * np.cos(phi)
+    ring_points[..., 1] = radius * np.sin(theta) * np.sin(phi)
+    ring_points[..., 2] = radius * np.cos(theta)
+    P[0] = (0, 0, radius)
+    P[-1] = (0, 0, -radius)
+
+    # Point index of segment j of ring i (rings of points start at 0)
+    j = np.arange(segments, dtype=np.int32)
+    next_j = (j + 1) % segments
+    top = C[:3 * segments].reshape(segments, 3)
+    top[:, 0] = 0
+    top[:, 1] = 1 + j
+    top[:, 2] = 1 + next_j
+    quads = C[3 * segments:3 * segments + 4 * quad_rings * segments].reshape(quad_rings, segments, 4)
+    ring = np.arange(quad_rings, dtype=np.int32)[:, None] * segments + 1
+    quads[..., 0] = ring + j
+    quads[..., 1] = ring + segments + j
+    quads[..., 2] = ring + segments + next_j
+    quads[..., 3] = ring + next_j
+    bottom = C[len(C) - 3 * segments:].reshape(segments, 3)
+    last_ring = 1 + (rings - 2) * segments
+    bottom[:, 0] = point_count - 1
+    bottom[:, 1] = last_ring + next_j
+    bottom[:, 2] = last_ring + j
+
+    F[:segments] = 3
+    F[segments:face_count - segments] = 4
+    F[face_count - segments:] = 3
+    mesh.touch()
+    return mesh
+
+def ngon_soup(face_count, min_size=3, max_size=8, seed=0):
+    """
+    Random polygons of min_size to max_size corners, whose points are not
+    shared and are uniformly distributed in the unit cube.
+    """
+    rng = np.random.default_rng(seed)
+    face_sizes = rng.integers(min_size, max_size + 1, face_count, dtype=np.int32)
+    corner_count = int(face_sizes.sum(dtype=np.int64))
+    mesh, P, C, F = new_mesh(corner_count, corner_count, face_count)
+    rng.random(out=P.reshape(-1), dtype=np.float32)
+    # By blocks, rather than through a temporary array as large as C
+    block_size = 1 << 16
+    for start in range(0, corner_count, block_size):
+        stop = min(start + block_size, corner_count)
+        C[start:stop] = np.arange(start, stop, dtype=np.int32)
+    F[...] = face_sizes
+    mesh.touch()
+    return mesh
+
+def random_values(rng, array):
+    """Fill an array with random values covering the range of its type"""
+    if array.dtype.kind == "f":
+        rng.random(out=array.reshape(-1), dtype=array.dtype)
+    else:
+        info = np.iinfo(array.dtype)
+        array[...] = rng.integers(info.min, info.max, array.shape, dtype=array.dtype, endpoint=True)
+
+def add_random_attributes(mesh, seed=0, component_counts=(1, 2, 3, 4)):
+    """
+    Add to each attachment of the mesh one attribute per type of
+    attribute_numpy_types and per component count, named e.g.
+    "randomFloat3", filled with seeded random values. Return the mesh.
+    """
+    rng = np.random.default_rng(seed)
+    for attachment in (kOfx.MeshAttribPoint, kOfx.MeshAttribCorner, kOfx.MeshAttribFace):
+        item_count = mesh.itemCount(attachment)
+        for attribute_type in attribute_numpy_types:
+            type_name = attribute_type.decode()[len("OfxMeshAttribType"):]
+            for component_count in component_counts:
+                name = f"random{type_name}{component_count}".encode()
+                attr = OfxAttribute(name, attachment, component_count, attribute_type)
+                attr.allocate(item_count)
+                mesh.attributes[attachment][name] = attr
+                random_values(rng, mesh.as_array(attachment, name))
+                attr.touch()
+    return mesh
+
+def degenerate_meshes(seed=0):
+    """
+    Yield (name, mesh) pairs of deliberately degenerate but well formed
+    meshes, that plugins must survive: empty meshes, loose points, faces of
+    0 to 2 corners, repeated and coincident points, zero area faces,
+    non-manifold edges, non-finite and huge coordinates.
+    """
+    rng = np.random.default_rng(seed)
+    quad = [(0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0)]
+    yield "empty", mesh_from_arrays([], [], [])
+    yield "points_only", mesh_from_arrays(rng.random((16, 3)), [], [])
+    yield "unused_points", mesh_from_arrays(quad + [(5, 5, 5), (6, 6, 6)], [0, 1, 2, 3], [4])
+    yield "empty_faces", mesh_from_arrays(quad, [0, 1, 2, 3], [0, 4, 0])
+    yield "single_corner_faces", mesh_from_arrays(quad, [0, 1, 2], [1, 1, 1])
+    yield "loose_edges", mesh_from_arrays(quad, [0, 1, 1, 2, 2, 3], [2, 2, 2])
+    yield "repeated_points", mesh_from_arrays(quad, [0, 1, 1, 2, 3, 3, 3, 3], [4, 4])
+    yield "coincident_points", mesh_from_arrays([(0, 0, 0), (0, 0, 0), (1, 0, 0)], [0, 1, 2], [3])
+    yield "zero_area", mesh_from_arrays([(0, 0, 0), (1, 0, 0), (2, 0, 0)], [0, 1, 2], [3])
+    yield "non_manifold_edge", mesh_from_arrays(
+        [(0, 0, 0), (1, 0, 0), (0, 1, 0), (0, -1, 0), (0, 0, 1)],
+        [0, 1, 2, 1, 0, 3, 0, 1, 4], [3, 3, 3],
+    )
+    yield "flipped_neighbors", mesh_from_arrays(quad, [0, 1, 2, 0, 3, 2], [3, 3])
+    yield "huge_coordinates", mesh_from_arrays(np.array(quad) * 1e30, [0, 1, 2, 3], [4])
+    yield "tiny_coordinates", mesh_from_arrays(np.array(quad) * 1e-30, [0, 1, 2, 3], [4])
+    yield "nan_positions", mesh_from_arrays([(np.nan, 0, 0)] + quad[1:], [0, 1, 2, 3], [4])
+    yield "infinite_positions", mesh_from_arrays([(np.inf, 0, 0)] + quad[1:], [0, 1, 2, 3], [4])
+    yield "large_face", mesh_from_arrays(
+        np.c_[np.cos(np.linspace(0, 2 * np.pi, 10000, endpoint=False)), np.sin(np.linspace(0, 2 * np.pi, 10000, endpoint=False)), np.zeros(10000)],
+        np.arange(10000), [10000],
+    )
@@ -0,0 +1,272 @@
+"""
+Graphs of chained mesh effects.
+
+Each node is an effect instance with its parameters, and edges connect the
+output of a node to a named input of another one. Output meshes are handed
+over to downstream inputs as is, without copying their buffers, and the
+result of each node is cached until its parameters or one of its upstream
+nodes change.
+
+    graph = EffectGraph()
+    a = graph.addNode(OfxEffectRunner(host, plugin_a), params={ b"translation": [1, 0, 0] })
+    b = graph.addNode(OfxEffectRunner(host, plugin_b))
+    graph.setInputMesh(a, kOfx.MeshMainInput, mesh)
+    graph.connect(a, b)
+    output_mesh = graph.evaluate(b)
+
+Independent branches can be cooked concurrently with evaluateParallel().
+"""
+
+import os
+import threading
+import time as _time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from openmfx import OfxMeshInternal
+from openmfx import constants as kOfx
+
+class EffectNode:
+    """
+    A node of an EffectGraph. The instance is created from the runner unless
+    one is provided, and params is a dict of parameter values to apply to it.
+    """
+    def __init__(self, runner, instance=None, params=None, name=None):
+        self.runner = runner
+        self.instance = instance if instance is not None else runner.createInstance()
+        self.name = name or runner.plugin.pluginIdentifier.decode()
+        self.inputs = {}  # input name -> (upstream node, output name)
+        self.input_meshes = {}  # input name -> external OfxMeshInternal
+        self.outputs = {}  # output name -> cached OfxMeshInternal
+        self.version = 0  # incremented each time the node is cooked
+        self.cache_key = None
+        for name, value in (params or {}).items():
+            self.setParam(name, value)
+
+    def __repr__(self):
+        return f"<EffectNode '{self.name}' v{self.version}>"
+
+    @property
+    def py_instance(self):
+        return self.instance.internal
+
+    def setParam(self, name, value):
+        self.py_instance.params[name].value = list(value) if isinstance(value, (list, tuple)) else [value]
+
+    def upstream(self):
+        return [node for node, _ in self.inputs.values()]
+
+    def stateKey(self, time):
+        """
+        Everything the output of the node depends on. Parameters are compared
+        by value, upstream nodes by version and external meshes by identity.
+        """
+        params = tuple(
+            (name, tuple(p.value or ()), tuple((t, tuple(v)) for t, v in p.keys))
+            for name, p in self.py_instance.params.items()
+        )
+        upstream = tuple(
+            (name, id(node), node.version, output_name)
+            for name, (node, output_name) in sorted(self.inputs.items())
+        )
+        external = tuple((name, id(mesh)) for name, mesh in sorted(self.input_meshes.items()))
+        return (time, params, upstream, external)
+
+    def bindInputs(self):
+        """Hand upstream outputs over to the inputs of this node (no copy)"""
+        py_instance = self.py_instance
+        for name, mesh in self.input_meshes.items():
+            py_instance.inputs[name].mesh = mesh
+        for name, (node, output_name) in self.inputs.items():
+            py_instance.inputs[name].mesh = node.outputs[output_name]
+
+    def cook(self, time=None):
+        py_instance = self.py_instance
+        self.bindInputs()
+        output = py_instance.inputs[kOfx.MeshMainOutput]
+        output.mesh = OfxMeshInternal()
+        self.runner.cook(self.instance, time)
+        # Ownership of the output is transferred to the node's cache, the
+        # output slot gets a fresh mesh at next cook.
+        self.outputs = { kOfx.MeshMainOutput: output.mesh }
+        self.version += 1
+
+
+class EffectGraph:
+    """
+    A directed acyclic graph of EffectNode. Upstream outputs become downstream
+    inputs without copy: plugins must treat input meshes as read-only, and
+    cached outputs stay alive as long as the graph does since outputs may
+    point to the buffers of their inputs.
+    """
+    def __init__(self):
+        self.nodes = []
+
+    def addNode(self, runner, instance=None, params=None, name=None):
+        node = EffectNode(runner, instance, params, name)
+        self.nodes.append(node)
+        return node
+
+    def connect(self, source, target, input_name=kOfx.MeshMainInput, output_name=kOfx.MeshMainOutput):
+        if input_name not in target.py_instance.inputs:
+            raise KeyError(f"Node {target.name} has no input '{input_name.decode()}'")
+        previous = target.inputs.get(input_name)
+        target.inputs[input_name] = (source, output_name)
+        if self._hasCycle():
+            if previous is None:
+                del target.inputs[input_name]
+            else:
+                target.inputs[input_name] = previous
+            raise ValueError(f"Connecting {source.name} to {target.name} would create a cycle")
+        target.input_meshes.pop(input_name, None)
+
+    def disconnect(self, target, input_name=kOfx.MeshMainInput):
+        target.inputs.pop(input_name, None)
+
+    def setInputMesh(self, node, input_name, mesh):
+        """Feed an external mesh to an input that is not connected to a node"""
+        node.inputs.pop(input_name, None)
+        node.input_meshes[input_name] = mesh
+
+    def _hasCycle(self):
+        try:
+            self.topologicalOrder()
+            return False
+        except ValueError:
+            return True
+
+    def topologicalOrder(self, targets=None):
+        """
+        Nodes sorted such that each node comes after its upstream nodes,
+        restricted to the ancestors of targets if provided.
+        """
+        order = []
+        state = {}  # node id -> 1 while visiting, 2 when done
+        def visit(node):
+            s = state.get(id(node))
+            if s == 2:
+                return
+            if s == 1:
+                raise ValueError(f"Effect graph has a cycle through {node.name}")
+            state[id(node)] = 1
+            for upstream in node.upstream():
+                visit(upstream)
+            state[id(node)] = 2
+            order.append(node)
+        for node in (self.nodes if targets is None else targets):
+            visit(node)
+        return order
+
+    def evaluate(self, target=None, time=None):
+        """
+        Cook the nodes needed to get the output of target (or of all nodes
+        if None) and return its output mesh. Nodes whose parameters and inputs
+        did not change since their last cook are not cooked again.
+        """
+        targets = None if target is None else [target]
+        for node in self.topologicalOrder(targets):
+            self._evaluateNode(node, time)
+        if target is not None:
+            return target.outputs[kOfx.MeshMainOutput]
+
+    def _evaluateNode(self, node, time):
+        key = node.stateKey(time)
+        if key == node.cache_key:
+            return False
+        node.cook(time)
+        node.cache_key = key
+        return True
+
+    def evaluateParallel(self, target=None, time=None, max_workers=None):
+        """
+        Same as evaluate(), but nodes whose upstream nodes are ready get cooked
+        concurrently on a thread pool (plugins run without holding the GIL).
+        Input meshes shared by several branches are handed to all of them
+        without copy, so they must be treated as read-only by plugins.
+        Return a report with the wall time, the timings of each node, the
+        critical path (longest chain of dependent cooks), the utilization of
+        the max_workers workers and the peak number of concurrent cooks.
+        """
+        order = self.topologicalOrder(None if target is None else [target])
+        nodes = { id(node): node for node in order }
+        downstream = { id(node): [] for node in order }
+        waiting = {}
+        for node in order:
+            upstream_ids = { id(u) for u in node.upstream() }
+            waiting[id(node)] = len(upstream_ids)
+            for u in upstream_ids:
+                downstream[u].append(node)
+
+        timings = {}
+        lock = threading.Lock()
+        def run(node):
+            start = _time.perf_counter()
+            cooked = self._evaluateNode(node, time)
+            end = _time.perf_counter()
+            with lock:
+                timings[id(node)] = (start, end, threading.current_thread().name, cooked)
+
+        start = _time.perf_counter()
+        if max_workers is None:
+            max_workers = min(32, (os.cpu_count() or 1) + 4)  # ThreadPoolExecutor's default
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            running = { pool.submit(run, node): node for node in order if waiting[id(node)] == 0 }
+            peak_running = len(running)
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = running.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        for f in running:
+                            f.cancel()
+                        raise error
+                    for d in downstream[id(node)]:
+                        waiting[id(d)] -= 1
+                        if waiting[id(d)] == 0:
+                            running[pool.submit(run, d)] = d
+                peak_running = max(peak_running, len(running))
+        wall_time = _time.perf_counter() - start
+
+        durations = { i: t[1] - t[0] for i, t in timings.items() }
+        # Critical path: longest duration-weighted chain, in topological order
+        path_length = {}
+        path_previous = {}
+        for node in order:
+            best = None
+            for u in node.upstream():
+                if best is None or path_length[id(u)] > path_length[id(best)]:
+                    best = u
+            path_length[id(node)] = durations[id(node)] + (path_length[id(best)] if best is not None else 0.0)
+            path_previous[id(node)] = best
+        critical_path = []
+        if order:
+            node = max(order, key=lambda n: path_length[id(n)])
+            critical_length = path_length[id(node)]
+            while node is not None:
+                critical_path.append(node)
+                node = path_previous[id(node)]
+            critical_path.reverse()
+        else:
+            critical_length = 0.0
+
+        busy_time = sum(durations.values())
+        return {
+            "output": target.outputs[kOfx.MeshMainOutput] if target is not None else None,
+            "wall_time": wall_time,
+            "busy_time": busy_time,
+            "workers": max_workers,
+            "utilization": busy_time / (wall_time * max_workers) if wall_time > 0 else 0.0,
+            "peak_concurrency": min(max_workers, peak_running),
+            "critical_path": [node.name for node in critical_path],
+            "critical_path_time": critical_length,
+            "nodes": [
+                {
+                    "name": nodes[i].name,
+                    "start": t[0] - start,
+                    "duration": t[1] - t[0],
+                    "thread": t[2],
+                    "cooked": t[3],
+                }
+                for i, t in sorted(timings.items(), key=lambda kv: kv[1][0])
+            ],
+        }
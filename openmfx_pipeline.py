@@ -0,0 +1,281 @@
+"""
+Pipelined processing of mesh sequences (e.g. simulation caches) through a
+single warm effect instance.
+
+Frames go through four stages, each running on its own worker thread and
+connected by bounded queues, so that reading the next frames from disk and
+writing the previous results overlap with cooking:
+
+    read -> bind input -> cook -> write output
+
+Input meshes are recycled once their frame has been written, so that frames
+of constant topology do not reallocate their buffers.
+
+    from openmfx_pipeline import MeshSequencePipeline, read_npz, write_npz
+
+    pipeline = MeshSequencePipeline(
+        runner, instance,
+        read_frame=lambda i: read_npz(f"cache/in.{i:04d}.npz"),
+        write_frame=lambda i, mesh: write_npz(f"cache/out.{i:04d}.npz", mesh),
+    )
+    stats = pipeline.run(range(1, 241))
+"""
+
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from openmfx import OfxMeshInternal
+from openmfx import constants as kOfx
+
+class MeshFrame:
+    """
+    Raw data of a frame, as returned by the read function of a pipeline:
+    point positions (N x 3 floats), corner points (M ints) and face sizes
+    (F ints).
+    """
+    def __init__(self, points, corners, face_sizes):
+        self.points = np.asarray(points, dtype=np.float32).reshape(-1, 3)
+        self.corners = np.asarray(corners, dtype=np.int32).reshape(-1)
+        self.face_sizes = np.asarray(face_sizes, dtype=np.int32).reshape(-1)
+
+    @property
+    def counts(self):
+        return len(self.points), len(self.corners), len(self.face_sizes)
+
+
+def read_npz(filename):
+    """Read a frame saved by write_npz (see MeshFrame for the content)"""
+    with np.load(filename) as data:
+        return MeshFrame(data["points"], data["corners"], data["face_sizes"])
+
+def write_npz(filename, mesh):
+    """Write the position and connectivity of an OfxMeshInternal to a .npz file"""
+    np.savez(
+        filename,
+        points=mesh.as_array(kOfx.MeshAttribPoint, kOfx.MeshAttribPointPosition),
+        corners=mesh.as_array(kOfx.MeshAttribCorner, kOfx.MeshAttribCornerPoint),
+        face_sizes=mesh.as_array(kOfx.MeshAttribFace, kOfx.MeshAttribFaceSize),
+    )
+
+def read_obj(filename):
+    """Read the positions and polygons of a Wavefront .obj file"""
+    points = []
+    corners = []
+    face_sizes = []
+    with open(filename) as f:
+        for line in f:
+            tokens = line.split()
+            if not tokens:
+                continue
+            if tokens[0] == "v":
+                points.append(tokens[1:4])
+            elif tokens[0] == "f":
+                # Indices are 1-based, negative ones are relative to the end
+                for token in tokens[1:]:
+                    index = int(token.split("/")[0])
+                    corners.append(index - 1 if index > 0 else len(points) + index)
+                face_sizes.append(len(tokens) - 1)
+    return MeshFrame(np.array(points, dtype=np.float32), corners, face_sizes)
+
+def write_obj(filename, mesh):
+    """Write the positions and polygons of an OfxMeshInternal to a .obj file"""
+    points = mesh.as_array(kOfx.MeshAttribPoint, kOfx.MeshAttribPointPosition)
+    corners = mesh.as_array(kOfx.MeshAttribCorner, kOfx.MeshAttribCornerPoint)
+    face_sizes = mesh.as_array(kOfx.MeshAttribFace, kOfx.MeshAttribFaceSize)
+    with open(filename, "w") as f:
+        np.savetxt(f, points, fmt="v %.9g %.9g %.9g")
+        offsets = np.concatenate([[0], np.cumsum(face_sizes)])
+        indices = (corners + 1).astype(str)
+        f.writelines(
+            "f " + " ".join(indices[offsets[i]:offsets[i + 1]]) + "\n"
+            for i in range(len(face_sizes))
+        )
+
+mesh_readers = { ".npz": read_npz, ".obj": read_obj }
+mesh_writers = { ".npz": write_npz, ".obj": write_obj }
+
+def read_mesh(filename):
+    """Read a MeshFrame from any file format of mesh_readers"""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in mesh_readers:
+        raise ValueError(f"Unsupported mesh file format: '{filename}'")
+    return mesh_readers[ext](filename)
+
+def write_mesh(filename, mesh):
+    """Write an OfxMeshInternal to any file format of mesh_writers"""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in mesh_writers:
+        raise ValueError(f"Unsupported mesh file format: '{filename}'")
+    mesh_writers[ext](filename, mesh)
+
+def bind_frame(frame, mesh=None):
+    """
+    Fill an input mesh with the data of a frame. The given mesh is reused if
+    its element counts match the frame's, otherwise a new mesh is allocated.
+    """
+    point_count, corner_count, face_count = frame.counts
+    if mesh is None or (mesh.point_count, mesh.corner_count, mesh.face_count) != frame.counts:
+        mesh = OfxMeshInternal()
+        mesh.point_count = point_count
+        mesh.corner_count = corner_count
+        mesh.face_count = face_count
+        mesh.allocate()
+    mesh.as_array(kOfx.MeshAttribPoint, kOfx.MeshAttribPointPosition)[:] = frame.points
+    mesh.as_array(kOfx.MeshAttribCorner, kOfx.MeshAttribCornerPoint)[:] = frame.corners
+    mesh.as_array(kOfx.MeshAttribFace, kOfx.MeshAttribFaceSize)[:] = frame.face_sizes
+    mesh.touch()
+    return mesh
+
+
+class PipelineStopped(Exception):
+    pass
+
+
+class MeshSequencePipeline:
+    """
+    Drives the cook of a sequence of frames through one effect instance
+    (see OfxEffectRunner.createInstance).
+    read_frame(item) must return a MeshFrame and write_frame(item, mesh) is
+    called with the output mesh of each frame, where items are the elements of
+    the iterable given to run(). Frames are written in order.
+    """
+    def __init__(self, runner, instance, read_frame, write_frame, queue_size=4, input_name=kOfx.MeshMainInput):
+        self.runner = runner
+        self.instance = instance
+        self.read_frame = read_frame
+        self.write_frame = write_frame
+        self.queue_size = queue_size
+        self.input_name = input_name
+
+    def run(self, items):
+        """
+        Process all items and return statistics: number of frames, wall time
+        and busy time of each stage.
+        """
+        self._stop = threading.Event()
+        self._error = None
+        self._busy = { "read": 0.0, "bind": 0.0, "cook": 0.0, "write": 0.0 }
+        self._frame_count = 0
+
+        read_queue = queue.Queue(self.queue_size)
+        bind_queue = queue.Queue(self.queue_size)
+        write_queue = queue.Queue(self.queue_size)
+        # Input meshes that can be reused, once their frame has been written
+        pool = queue.Queue()
+
+        stages = [
+            threading.Thread(target=self._read_stage, args=(items, read_queue), name="read"),
+            threading.Thread(target=self._bind_stage, args=(read_queue, bind_queue, pool), name="bind"),
+            threading.Thread(target=self._cook_stage, args=(bind_queue, write_queue), name="cook"),
+            threading.Thread(target=self._write_stage, args=(write_queue, pool), name="write"),
+        ]
+        start = time.perf_counter()
+        for thread in stages:
+            thread.start()
+        for thread in stages:
+            thread.join()
+        wall_time = time.perf_counter() - start
+
+        if self._error is not None:
+            raise self._error
+        return {
+            "frames": self._frame_count,
+            "wall_time": wall_time,
+            "busy_time": self._busy,
+        }
+
+    # Queue operations that give up when another stage failed
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+        raise PipelineStopped()
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        raise PipelineStopped()
+
+    def _stage(self, body):
+        try:
+            body()
+        except PipelineStopped:
+            pass
+        except Exception as e:
+            if self._error is None:
+                self._error = e
+            self._stop.set()
+
+    def _timed(self, name, f, *args):
+        start = time.perf_counter()
+        result = f(*args)
+        self._busy[name] += time.perf_counter() - start
+        return result
+
+    def _read_stage(self, items, output_queue):
+        def body():
+            for index, item in enumerate(items):
+                frame = self._timed("read", self.read_frame, item)
+                self._put(output_queue, (index, item, frame))
+            self._put(output_queue, None)
+        self._stage(body)
+
+    def _bind_stage(self, input_queue, output_queue, pool):
+        def body():
+            while True:
+                job = self._get(input_queue)
+                if job is None:
+                    break
+                index, item, frame = job
+                try:
+                    mesh = pool.get_nowait()
+                except queue.Empty:
+                    mesh = None
+                mesh = self._timed("bind", bind_frame, frame, mesh)
+                self._put(output_queue, (index, item, mesh))
+            self._put(output_queue, None)
+        self._stage(body)
+
+    def _cook_stage(self, input_queue, output_queue):
+        py_instance = self.instance.internal
+        mesh_input = py_instance.inputs[self.input_name]
+        output = py_instance.inputs[kOfx.MeshMainOutput]
+        def cook(mesh):
+            mesh_input.mesh = mesh
+            output.mesh = OfxMeshInternal()
+            self.runner.cook(self.instance)
+            return output.mesh
+        def body():
+            while True:
+                job = self._get(input_queue)
+                if job is None:
+                    break
+                index, item, mesh = job
+                output_mesh = self._timed("cook", cook, mesh)
+                self._put(output_queue, (index, item, mesh, output_mesh))
+            self._put(output_queue, None)
+        self._stage(body)
+
+    def _write_stage(self, input_queue, pool):
+        def body():
+            while True:
+                job = self._get(input_queue)
+                if job is None:
+                    break
+                index, item, input_mesh, output_mesh = job
+                self._timed("write", self.write_frame, item, output_mesh)
+                self._frame_count += 1
+                # The output may point to input buffers, so the input is only
+                # recycled once the output has been written.
+                pool.put(input_mesh)
+        self._stage(body)
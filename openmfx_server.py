@@ -0,0 +1,438 @@
+"""
+Cook server keeping plugin libraries loaded and pools of effect instances
+warm, so that jobs only pay for the cook itself rather than for starting a
+host and running the load, describe and instance creation actions.
+
+Requests are sent over a Unix domain socket as length-prefixed JSON messages.
+Meshes are not serialized into messages but passed as memfd file
+descriptors (Linux only) holding point positions, corner points and face
+sizes one after the other, that both sides map in memory.
+
+Requests that set the "packed" flag and share the same effect, parameters
+and time are batched together into a single cook (see openmfx_batch), which
+is only valid for effects that are local per point or per face.
+
+    python openmfx_server.py --socket /tmp/openmfx.sock --instances 4
+
+    from openmfx_server import CookClient
+    with CookClient("/tmp/openmfx.sock") as client:
+        frame = client.cook("plugins.ofx", "Translate", frame, params={ "translation": [0, 0, 1] })
+        print(client.metrics())
+"""
+
+import argparse
+import json
+import mmap
+import os
+import queue
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+
+from openmfx import OfxHost, OfxPluginLibrary, OfxEffectRunner, OfxMeshInternal, OfxCallStats, process_memory
+from openmfx import constants as kOfx
+from openmfx_batch import cook_packed
+from openmfx_chunked import make_chunk
+from openmfx_pipeline import MeshFrame
+
+header = struct.Struct("!I")
+max_fds = 4
+
+def send_message(sock, message, fds=()):
+    """Send a JSON message, together with file descriptors if any"""
+    data = json.dumps(message).encode()
+    payload = header.pack(len(data)) + data
+    if fds:
+        sent = socket.send_fds(sock, [payload], list(fds))
+        payload = payload[sent:]
+    if payload:
+        sock.sendall(payload)
+
+def recv_message(sock):
+    """
+    Receive a message sent by send_message and return it with the list of
+    received file descriptors, or (None, []) if the connection was closed.
+    """
+    data, fds, _, _ = socket.recv_fds(sock, 1 << 16, max_fds)
+    if not data:
+        return None, []
+    while len(data) < header.size:
+        chunk = sock.recv(header.size - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed in the middle of a message")
+        data += chunk
+    length, = header.unpack_from(data)
+    data = data[header.size:]
+    while len(data) < length:
+        chunk = sock.recv(length - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed in the middle of a message")
+        data += chunk
+    return json.loads(data), fds
+
+
+# Meshes in memfds
+
+def mesh_layout(counts):
+    """Byte offsets of points, corners and face sizes, and total size"""
+    point_count, corner_count, face_count = counts
+    points_end = point_count * 12
+    corners_end = points_end + corner_count * 4
+    return points_end, corners_end, corners_end + face_count * 4
+
+def write_mesh_fd(points, corners, face_sizes):
+    """Return a new memfd containing the given arrays"""
+    counts = (len(points), len(corners), len(face_sizes))
+    points_end, corners_end, size = mesh_layout(counts)
+    fd = os.memfd_create("openmfx-mesh")
+    os.ftruncate(fd, size)
+    if size > 0:
+        with mmap.mmap(fd, size) as buffer:
+            buffer[:points_end] = np.ascontiguousarray(points, dtype=np.float32).tobytes()
+            buffer[points_end:corners_end] = np.ascontiguousarray(corners, dtype=np.int32).tobytes()
+            buffer[corners_end:size] = np.ascontiguousarray(face_sizes, dtype=np.int32).tobytes()
+    return fd
+
+def map_mesh_fd(fd, counts):
+    """
+    Map a mesh memfd and return (buffer, points, corners, face_sizes) where
+    arrays are views on the buffer, which must be kept alive while used.
+    """
+    points_end, corners_end, size = mesh_layout(counts)
+    if size == 0:
+        empty = np.empty(0, dtype=np.int32)
+        return None, np.empty((0, 3), dtype=np.float32), empty, empty
+    buffer = mmap.mmap(fd, size)
+    points = np.frombuffer(buffer, dtype=np.float32, count=counts[0] * 3).reshape(-1, 3)
+    corners = np.frombuffer(buffer, dtype=np.int32, count=counts[1], offset=points_end)
+    face_sizes = np.frombuffer(buffer, dtype=np.int32, count=counts[2], offset=corners_end)
+    return buffer, points, corners, face_sizes
+
+
+class CookRequest:
+    def __init__(self, message, mesh):
+        self.message = message
+        self.mesh = mesh
+        self.params = message.get("params", {})
+        self.time = message.get("time")
+        self.packed = message.get("packed", False)
+        self.batch_key = json.dumps([self.params, self.time], sort_keys=True)
+        self.received = time.perf_counter_ns()
+        self.done = threading.Event()
+        self.output = None
+        self.error = None
+
+
+class RequestQueue(queue.Queue):
+    """Queue of cook requests, to which requests can be given back in front"""
+    def put_front(self, requests):
+        """Put requests back at the head of the queue, in the given order"""
+        if not requests:
+            return
+        with self.not_empty:
+            self.queue.extendleft(reversed(requests))
+            self.unfinished_tasks += len(requests)
+            self.not_empty.notify(len(requests))
+
+
+class EffectPool:
+    """
+    A loaded effect and a set of warm instances, each of which is owned by a
+    worker thread that takes requests from a shared queue.
+    """
+    def __init__(self, server, library, plugin, identifier, instance_count):
+        self.server = server
+        self.identifier = identifier
+        self.runner = OfxEffectRunner(server.host, plugin)
+        self.runner.load()
+        self.runner.describe()
+        self.library = library
+        self.queue = RequestQueue()
+        self.workers = []
+        for i in range(instance_count):
+            instance = self.runner.createInstance()
+            worker = threading.Thread(target=self._work, args=(instance,), name=f"{identifier}-{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, request):
+        self.queue.put(request)
+
+    def _take_batch(self, first):
+        """
+        Gather pending packed requests compatible with the first one. Other
+        requests met meanwhile are given back at the head of the queue, in
+        their order of arrival.
+        """
+        batch = [first]
+        if not first.packed:
+            return batch
+        deadline = time.perf_counter() + self.server.batch_window
+        skipped = []
+        while len(batch) < self.server.max_batch:
+            try:
+                request = self.queue.get(timeout=max(deadline - time.perf_counter(), 0))
+            except queue.Empty:
+                break
+            if request.packed and request.batch_key == first.batch_key:
+                batch.append(request)
+            else:
+                skipped.append(request)
+        self.queue.put_front(skipped)
+        return batch
+
+    def _work(self, instance):
+        py_instance = instance.internal
+        metrics = self.server.metrics
+        while True:
+            batch = self._take_batch(self.queue.get())
+            start = time.perf_counter_ns()
+            for request in batch:
+                metrics["queue_wait"].record(start - request.received)
+            first = batch[0]
+            try:
+                # Parameters not given by this request must not keep the values
+                # of a previous request cooked by the same instance.
+                for param in py_instance.params.values():
+                    param.resetToDefault()
+                for name, value in first.params.items():
+                    if isinstance(value, str):
+                        value = value.encode()
+                    py_instance.params[name.encode()].value = list(value) if isinstance(value, (list, tuple)) else [value]
+                if len(batch) > 1:
+                    outputs = cook_packed(self.runner, instance, [r.mesh for r in batch], time=first.time)
+                else:
+                    py_instance.inputs[kOfx.MeshMainInput].mesh = first.mesh
+                    output = py_instance.inputs[kOfx.MeshMainOutput]
+                    output.mesh = OfxMeshInternal()
+                    self.runner.cook(instance, first.time)
+                    outputs = [output.mesh]
+                for request, mesh in zip(batch, outputs):
+                    request.output = mesh
+            except Exception as e:
+                for request in batch:
+                    request.error = f"{type(e).__name__}: {e}"
+            finally:
+                py_instance.inputs[kOfx.MeshMainInput].mesh = None
+                py_instance.inputs[kOfx.MeshMainOutput].mesh = None
+            metrics["cook"].record(time.perf_counter_ns() - start)
+            metrics["batch_size"].record(len(batch))
+            for request in batch:
+                request.done.set()
+
+
+class CookServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Daemon answering cook requests (see CookRequestHandler for the protocol).
+    Effect pools are created on the first request that uses them.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path, instance_count=2, max_batch=64, batch_window=0.002):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, CookRequestHandler)
+        self.socket_path = socket_path
+        self.host = OfxHost()
+        self.instance_count = instance_count
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.libraries = {}
+        self.pools = {}
+        self._pools_lock = threading.Lock()
+        self.metrics = {
+            "queue_wait": OfxCallStats("queue_wait"),
+            "cook": OfxCallStats("cook"),
+            "total": OfxCallStats("total"),
+            "batch_size": OfxCallStats("batch_size"),
+        }
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def pool(self, library_path, identifier):
+        key = (os.path.realpath(library_path), identifier)
+        with self._pools_lock:
+            pool = self.pools.get(key)
+            if pool is None:
+                library = self.libraries.get(key[0])
+                if library is None:
+                    library = self.libraries[key[0]] = OfxPluginLibrary(library_path)
+                plugins = [library.OfxGetPlugin(i) for i in range(library.OfxGetNumberOfPlugins())]
+                matches = [p for p in plugins if p.pluginIdentifier.decode() == identifier]
+                if not matches:
+                    raise KeyError(f"No plugin '{identifier}' in library '{library_path}'")
+                pool = self.pools[key] = EffectPool(self, library, matches[0], identifier, self.instance_count)
+        return pool
+
+    def queue_depth(self):
+        return { identifier: pool.queue.qsize() for (_, identifier), pool in self.pools.items() }
+
+    def metrics_report(self):
+        return {
+            "queue_depth": self.queue_depth(),
+            "pools": len(self.pools),
+            "memory": process_memory.as_dict(),
+            **{ name: stats.as_dict() for name, stats in self.metrics.items() },
+        }
+
+
+class CookRequestHandler(socketserver.BaseRequestHandler):
+    """
+    Each connection sends messages {"op": ...} and gets a reply to each:
+     - "cook": with "library", "plugin", "counts" (points, corners, faces) and
+       optionally "params", "time" and "packed", together with the input mesh
+       memfd. Replies with the output "counts" and the output memfd.
+     - "metrics": replies with queue depths and latency statistics.
+    Replies have a "status", either "ok" or "error" (with an "error" message).
+    """
+    def handle(self):
+        sock = self.request
+        while True:
+            try:
+                message, fds = recv_message(sock)
+            except ConnectionError:
+                return
+            if message is None:
+                return
+            try:
+                reply, reply_fds = self.dispatch(message, fds)
+            except Exception as e:
+                reply, reply_fds = { "status": "error", "error": f"{type(e).__name__}: {e}" }, []
+            finally:
+                for fd in fds:
+                    os.close(fd)
+            try:
+                send_message(sock, reply, reply_fds)
+            finally:
+                for fd in reply_fds:
+                    os.close(fd)
+
+    def dispatch(self, message, fds):
+        op = message.get("op")
+        if op == "metrics":
+            return { "status": "ok", "metrics": self.server.metrics_report() }, []
+        if op != "cook":
+            raise ValueError(f"Unknown operation '{op}'")
+
+        if len(fds) != 1:
+            raise ValueError("A cook request must come with exactly one mesh file descriptor")
+        pool = self.server.pool(message["library"], message["plugin"])
+        buffer, points, corners, face_sizes = map_mesh_fd(fds[0], message["counts"])
+        try:
+            request = CookRequest(message, make_chunk(points, corners, face_sizes))
+            pool.submit(request)
+            request.done.wait()
+            if request.error is not None:
+                return { "status": "error", "error": request.error }, []
+            mesh = request.output
+            fd = write_mesh_fd(
+                mesh.as_array(kOfx.MeshAttribPoint, kOfx.MeshAttribPointPosition),
+                mesh.as_array(kOfx.MeshAttribCorner, kOfx.MeshAttribCornerPoint),
+                mesh.as_array(kOfx.MeshAttribFace, kOfx.MeshAttribFaceSize),
+            )
+            self.server.metrics["total"].record(time.perf_counter_ns() - request.received)
+            return { "status": "ok", "counts": [mesh.point_count, mesh.corner_count, mesh.face_count] }, [fd]
+        finally:
+            del points, corners, face_sizes
+            if buffer is not None:
+                buffer.close()
+
+
+class CookError(Exception):
+    pass
+
+
+class CookClient:
+    """Client of a CookServer, that keeps one connection open"""
+    def __init__(self, socket_path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.sock.close()
+
+    def _request(self, message, fds=()):
+        send_message(self.sock, message, fds)
+        reply, reply_fds = recv_message(self.sock)
+        if reply is None:
+            raise ConnectionError("Server closed the connection")
+        if reply["status"] != "ok":
+            for fd in reply_fds:
+                os.close(fd)
+            raise CookError(reply.get("error"))
+        return reply, reply_fds
+
+    def cook(self, library, plugin, frame, params=None, time=None, packed=False):
+        """
+        Cook a MeshFrame (see openmfx_pipeline) with the given plugin and
+        parameters (a dict of name -> value or list of components), and return
+        the output as a MeshFrame.
+        """
+        fd = write_mesh_fd(frame.points, frame.corners, frame.face_sizes)
+        try:
+            reply, reply_fds = self._request({
+                "op": "cook",
+                "library": os.path.realpath(library),
+                "plugin": plugin,
+                "counts": list(frame.counts),
+                "params": params or {},
+                "time": time,
+                "packed": packed,
+            }, [fd])
+        finally:
+            os.close(fd)
+        try:
+            buffer, points, corners, face_sizes = map_mesh_fd(reply_fds[0], reply["counts"])
+            output = MeshFrame(points.copy(), corners.copy(), face_sizes.copy())
+            del points, corners, face_sizes
+            if buffer is not None:
+                buffer.close()
+            return output
+        finally:
+            for fd in reply_fds:
+                os.close(fd)
+
+    def metrics(self):
+        return self._request({ "op": "metrics" })[0]["metrics"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve cook requests with warm OpenMfx effect instances")
+    parser.add_argument("--socket", default="/tmp/openmfx.sock", help="Path of the Unix domain socket")
+    parser.add_argument("--instances", type=int, default=2, help="Number of warm instances per effect")
+    parser.add_argument("--max-batch", type=int, default=64, help="Maximum number of packed requests cooked at once")
+    parser.add_argument("--batch-window", type=float, default=2.0, help="Time (in ms) to wait for compatible packed requests")
+    parser.add_argument("--memory-budget", type=float, metavar="MB", help="Fail mesh allocations beyond this total size of mesh buffers")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Do not print host logs")
+    args = parser.parse_args()
+
+    if args.memory_budget is not None:
+        process_memory.budget = int(args.memory_budget * 1024 * 1024)
+
+    if args.quiet:
+        sys.stdout = open(os.devnull, "w")
+    server = CookServer(args.socket, args.instances, args.max_batch, args.batch_window / 1000)
+    print(f"Listening on {args.socket}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""
+Validation of meshes exchanged with plugins, to catch malformed inputs or
+outputs before they get dereferenced (and crash the host).
+
+All checks are vectorized array operations: a mesh is scanned in a handful
+of passes over its buffers, and offending elements are only looked for once
+a check failed, so that validation stays cheap enough to be left on.
+
+    from openmfx_validate import validate_mesh
+
+    report = validate_mesh(mesh)
+    if not report.ok:
+        print(report)
+
+Checks are:
+ - element counts are non-negative and attribute buffers are set and large
+   enough for their element count, component count and stride;
+ - face sizes are non-negative and sum up to the corner count;
+ - corner points are in [0, point_count);
+ - float attributes contain no NaN nor infinity (an error for point
+   positions, a warning for other attributes);
+ - degenerate faces (less than 3 corners, or twice the same point in a row)
+   are counted as warnings, and so are faces of zero area if geometry
+   checks are enabled.
+"""
+
+from ctypes import sizeof
+
+import numpy as np
+
+from openmfx import attribute_ctypes
+from openmfx import constants as kOfx
+
+class MeshDiagnostic:
+    """
+    A problem found in a mesh: severity is "error" or "warning", code is a
+    short identifier (e.g. "corner_point_range"), count the number of
+    offending elements and indices the first few of them.
+    """
+    def __init__(self, severity, code, message, attachment=None, attribute=None, count=1, indices=None):
+        self.severity = severity
+        self.code = code
+        self.message = message
+        self.attachment = attachment
+        self.attribute = attribute
+        self.count = count
+        self.indices = indices if indices is not None else []
+
+    def __repr__(self):
+        return f"<MeshDiagnostic {self.severity} {self.code}: {self.message}>"
+
+    def __str__(self):
+        return f"[{self.severity}] {self.code}: {self.message}"
+
+    def as_dict(self):
+        return {
+            "severity": self.severity,
+            "code": self.code,
+            "message": self.message,
+            "attachment": self.attachment.decode() if self.attachment is not None else None,
+            "attribute": self.attribute.decode() if self.attribute is not None else None,
+            "count": self.count,
+            "indices": self.indices,
+        }
+
+
+class MeshValidationError(ValueError):
+    """Raised by MeshValidationReport.check() when a mesh has errors"""
+    def __init__(self, report):
+        self.report = report
+        super().__init__(str(report))
+
+
+class MeshValidationReport:
+    """Diagnostics of a mesh, see validate_mesh()"""
+    def __init__(self, counts):
+        self.counts = counts
+        self.diagnostics = []
+
+    def __repr__(self):
+        return f"<MeshValidationReport {len(self.errors)} errors, {len(self.warnings)} warnings>"
+
+    def __str__(self):
+        point_count, corner_count, face_count = self.counts
+        lines = [f"Mesh with {point_count} points, {corner_count} corners and {face_count} faces: {len(self.errors)} errors, {len(self.warnings)} warnings"]
+        lines += [f"  {diagnostic}" for diagnostic in self.diagnostics]
+        return "\n".join(lines)
+
+    @property
+    def errors(self):
+        return [d for d in self.diagnostics if d.severity == "error"]
+
+    @property
+    def warnings(self):
+        return [d for d in self.diagnostics if d.severity == "warning"]
+
+    @property
+    def ok(self):
+        """True iff there is no error (there may be warnings)"""
+        return not self.errors
+
+    def add(self, severity, code, message, **kwargs):
+        self.diagnostics.append(MeshDiagnostic(severity, code, message, **kwargs))
+
+    def check(self):
+        """Raise a MeshValidationError if there is any error"""
+        if not self.ok:
+            raise MeshValidationError(self)
+        return self
+
+    def as_dict(self):
+        return {
+            "counts": list(self.counts),
+            "ok": self.ok,
+            "diagnostics": [d.as_dict() for d in self.diagnostics],
+        }
+
+
+def first_indices(mask, sample):
+    """Indices of the first sample True values of a boolean array"""
+    return np.flatnonzero(mask)[:sample].tolist()
+
+def check_attribute(report, mesh, attachment, attr):
+    """
+    Check that the buffer of an attribute is usable, and return its numpy
+    view or None if it is not.
+    """
+    item_count = mesh.itemCount(attachment)
+    name = attr.name.decode()
+    context = { "attachment": attachment, "attribute": attr.name }
+    component_type = attribute_ctypes.get(attr.attribute_type)
+    if component_type is None:
+        report.add("error", "attribute_type", f"Attribute '{name}' has unknown type {attr.attribute_type!r}", **context)
+        return None
+    if not isinstance(attr.component_count, int) or attr.component_count < 1:
+        report.add("error", "component_count", f"Attribute '{name}' has invalid component count {attr.component_count!r}", **context)
+        return None
+    if item_count == 0:
+        return None
+    if not attr.address:
+        report.add("error", "missing_data", f"Attribute '{name}' has no data for {item_count} elements", **context)
+        return None
+    itemsize = sizeof(component_type) * attr.component_count
+    if attr.stride < itemsize:
+        report.add("error", "stride", f"Attribute '{name}' has stride {attr.stride} smaller than its item size {itemsize}", **context)
+        return None
+    if attr.py_data is not None:
+        required = attr.stride * (item_count - 1) + itemsize
+        if sizeof(attr.py_data) < required:
+            report.add("error", "buffer_size", f"Attribute '{name}' buffer has {sizeof(attr.py_data)} bytes but {item_count} elements need {required}", **context)
+            return None
+    return attr.as_array(item_count)
+
+def validate_mesh(mesh, check_geometry=False, sample=5):
+    """
+    Check an OfxMeshInternal and return a MeshValidationReport. Up to sample
+    offending indices are given with each diagnostic. Zero area faces are
+    only looked for if check_geometry is True, as it is the most expensive
+    check.
+    """
+    counts = (mesh.point_count, mesh.corner_count, mesh.face_count)
+    report = MeshValidationReport(counts)
+    for attachment, count in zip((kOfx.MeshAttribPoint, kOfx.MeshAttribCorner, kOfx.MeshAttribFace), counts):
+        if not isinstance(count, (int, np.integer)) or count < 0:
+            report.add("error", "element_count", f"Invalid {attachment.decode()} count {count!r}", attachment=attachment)
+    if not report.ok:
+        return report
+
+    arrays = {}
+    for attachment, attributes in mesh.attributes.items():
+        for name, attr in attributes.items():
+            array = check_attribute(report, mesh, attachment, attr)
+            if array is not None:
+                arrays[(attachment, name)] = array
+
+    point_count, corner_count, face_count = counts
+    positions = arrays.get((kOfx.MeshAttribPoint, kOfx.MeshAttribPointPosition))
+    corner_points = arrays.get((kOfx.MeshAttribCorner, kOfx.MeshAttribCornerPoint))
+    face_sizes = arrays.get((kOfx.MeshAttribFace, kOfx.MeshAttribFaceSize))
+
+    # Topology
+    faces_ok = False
+    if face_sizes is not None:
+        if face_sizes.min() < 0:
+            negative = face_sizes < 0
+            report.add("error", "face_size", f"{np.count_nonzero(negative)} faces have a negative size",
+                       attachment=kOfx.MeshAttribFace, attribute=kOfx.MeshAttribFaceSize,
+                       count=int(np.count_nonzero(negative)), indices=first_indices(negative, sample))
+        else:
+            total = int(face_sizes.sum(dtype=np.int64))
+            if total != corner_count:
+                report.add("error", "face_size_sum", f"Face sizes sum up to {total} but mesh has {corner_count} corners",
+                           attachment=kOfx.MeshAttribFace, attribute=kOfx.MeshAttribFaceSize)
+            else:
+                faces_ok = True
+    elif face_count == 0 and corner_count > 0:
+        report.add("error", "face_size_sum", f"Mesh has {corner_count} corners but no face", attachment=kOfx.MeshAttribFace)
+
+    corners_ok = False
+    if corner_points is not None:
+        if corner_points.min() < 0 or corner_points.max() >= point_count:
+            invalid = (corner_points < 0) | (corner_points >= point_count)
+            count = int(np.count_nonzero(invalid))
+            report.add("error", "corner_point_range", f"{count} corners point outside of [0, {point_count})",
+                       attachment=kOfx.MeshAttribCorner, attribute=kOfx.MeshAttribCornerPoint,
+                       count=count, indices=first_indices(invalid, sample))
+        else:
+            corners_ok = True
+
+    # Values
+    for (attachment, name), array in arrays.items():
+        # A single reduction tells whether all values are finite (or the sum
+        # overflowed, which is then sorted out by the elementwise pass).
+        if array.dtype.kind != "f" or np.isfinite(array.sum()):
+            continue
+        invalid = ~np.isfinite(array)
+        if invalid.ndim > 1:
+            invalid = invalid.any(axis=1)
+        count = int(np.count_nonzero(invalid))
+        if count == 0:
+            continue
+        is_position = (attachment, name) == (kOfx.MeshAttribPoint, kOfx.MeshAttribPointPosition)
+        report.add("error" if is_position else "warning", "non_finite",
+                   f"{count} elements of attribute '{name.decode()}' are NaN or infinite",
+                   attachment=attachment, attribute=name, count=count, indices=first_indices(invalid, sample))
+
+    # Degenerate faces
+    if faces_ok and face_count > 0:
+        small = face_sizes < 3
+        count = int(np.count_nonzero(small))
+        if count > 0:
+            report.add("warning", "degenerate_face_size", f"{count} faces have less than 3 corners",
+                       attachment=kOfx.MeshAttribFace, count=count, indices=first_indices(small, sample))
+        if corners_ok and corner_count > 0:
+            repeated = repeated_point_faces(corner_points, face_sizes)
+            count = int(np.count_nonzero(repeated))
+            if count > 0:
+                report.add("warning", "repeated_point", f"{count} faces use the same point twice in a row",
+                           attachment=kOfx.MeshAttribFace, count=count, indices=first_indices(repeated, sample))
+
+            if check_geometry and positions is not None and not small.all():
+                zero = zero_area_faces(positions, corner_points, face_sizes) & ~small
+                count = int(np.count_nonzero(zero))
+                if count > 0:
+                    report.add("warning", "zero_area", f"{count} faces have a zero area",
+                               attachment=kOfx.MeshAttribFace, count=count, indices=first_indices(zero, sample))
+    return report
+
+def face_starts(face_sizes):
+    """Index of the first corner of each face"""
+    starts = np.zeros(len(face_sizes), dtype=np.int64)
+    np.cumsum(face_sizes[:-1], out=starts[1:])
+    return starts
+
+def repeated_point_faces(corner_points, face_sizes):
+    """
+    Boolean mask of faces that have two consecutive corners (including the
+    last and the first one) using the same point.
+    """
+    size = int(face_sizes[0])
+    if size > 0 and face_sizes.min() == face_sizes.max():
+        # All faces have the same size (e.g. triangles or quads), so corners
+        # can be seen as a 2D array with a row per face.
+        rows = corner_points.reshape(-1, size)
+        repeated = rows[:, 0] == rows[:, -1]
+        if size == 1:
+            repeated[:] = False
+        for i in range(size - 1):
+            repeated |= rows[:, i] == rows[:, i + 1]
+        return repeated
+    starts = face_starts(face_sizes)
+    same_as_next = np.empty(len(corner_points), dtype=bool)
+    same_as_next[:-1] = corner_points[1:] == corner_points[:-1]
+    nonempty = face_sizes > 0
+    ends = (starts + face_sizes - 1)[nonempty]
+    same_as_next[ends] = corner_points[ends] == corner_points[starts[nonempty]]
+    same_as_next[ends[face_sizes[nonempty] == 1]] = False
+    repeated = np.zeros(len(face_sizes), dtype=bool)
+    if same_as_next.any():
+        repeated[np.repeat(np.arange(len(face_sizes)), face_sizes)[same_as_next]] = True
+    return repeated
+
+def zero_area_faces(positions, corner_points, face_sizes, epsilon=1e-12):
+    """
+    Boolean mask of faces whose area is (nearly) zero, computed with Newell's
+    method: the sum over edges of the cross products of their end points is
+    twice the area vector of the face. Points are taken relative to the first
+    corner of their face and the area is compared to the squared extent of
+    the face itself, so that the test does not depend on where the face is
+    nor on the size of the rest of the mesh.
+    """
+    starts = face_starts(face_sizes)
+    points = positions[corner_points].astype(np.float64)
+    next_corner = np.arange(1, len(corner_points) + 1)
+    nonempty = face_sizes > 0
+    next_corner[(starts + face_sizes - 1)[nonempty]] = starts[nonempty]
+    # Non-finite positions are reported on their own, faces using them just
+    # do not count as zero area.
+    with np.errstate(invalid="ignore", over="ignore"):
+        points -= np.repeat(points[starts[nonempty]], face_sizes[nonempty], axis=0)
+        crosses = np.cross(points, points[next_corner])
+        area_vectors = np.zeros((len(face_sizes), 3))
+        area_vectors[nonempty] = np.add.reduceat(crosses, starts[nonempty], axis=0)
+        # Squared distance from the first corner to the farthest one
+        extents = np.zeros(len(face_sizes))
+        extents[nonempty] = np.maximum.reduceat(np.einsum("ij,ij->i", points, points), starts[nonempty])
+        return np.sqrt(np.einsum("ij,ij->i", area_vectors, area_vectors)) <= epsilon * extents
+
+def validate_inputs(py_instance, check_geometry=False):
+    """
+    Validate the static meshes of all inputs of an effect instance (but the
+    main output) and return a dict input name -> MeshValidationReport.
+    """
+    reports = {}
+    for name, mesh_input in py_instance.inputs.items():
+        if name == kOfx.MeshMainOutput:
+            continue
+        meshes = [mesh for _, mesh in mesh_input.time_samples] or [mesh_input.mesh]
+        for mesh in meshes:
+            report = validate_mesh(mesh, check_geometry)
+            if name not in reports or not report.ok:
+                reports[name] = report
+    return reports
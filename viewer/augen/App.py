@@ -41,6 +41,14 @@ class App:
         self.ctx = moderngl.create_context(require=460)
 
         self.impl = ImguiRenderer(self.window, attach_callbacks=False)
+
+        # When true, the loop sleeps until an event occurs rather than drawing
+        # frames continuously, unless is_animating() returns true.
+        self.redraw_on_demand = True
+        # Number of frames still to draw before going idle. ImGui needs a few
+        # frames after an input to settle.
+        self._pending_frames = 0
+        self.idle_frames = 3
         
         glfw.set_key_callback(self.window, self._on_key)
         glfw.set_cursor_pos_callback(self.window, self._on_mouse_move)
@@ -48,6 +56,7 @@ class App:
         glfw.set_window_size_callback(self.window, self._on_resize)
         glfw.set_char_callback(self.window, self._on_char)
         glfw.set_scroll_callback(self.window, self._on_scroll)
+        glfw.set_window_refresh_callback(self.window, self._on_refresh)
 
         self.init()
 
@@ -56,7 +65,14 @@ class App:
 
         # Loop until the user closes the window
         while not glfw.window_should_close(self.window):
-            glfw.poll_events()
+            idle = self.redraw_on_demand and self._pending_frames == 0 and not self.is_animating()
+            if idle:
+                glfw.wait_events()
+                # Do not count the time spent sleeping as frame time
+                previous_time = glfw.get_time()
+            else:
+                glfw.poll_events()
+            self._pending_frames = max(self._pending_frames - 1, 0)
             self.impl.process_inputs()
 
             current_time = glfw.get_time()
@@ -75,6 +91,15 @@ class App:
         self.impl.shutdown()
         glfw.terminate()
 
+    def request_redraw(self):
+        """Make sure that the next few frames get drawn"""
+        self._pending_frames = self.idle_frames
+        glfw.post_empty_event()
+
+    def is_animating(self):
+        """Override to return true while frames must be drawn continuously"""
+        return False
+
     def should_close(self):
         glfw.set_window_should_close(self.window, True)
 
@@ -96,7 +121,11 @@ class App:
     def ui(self):
         pass
 
+    def _on_refresh(self, window):
+        self.request_redraw()
+
     def _on_key(self, window, key, scancode, action, mods):
+        self.request_redraw()
         self.impl.keyboard_callback(window, key, scancode, action, mods)
         self.on_key(key, scancode, action, mods)
 
@@ -104,6 +133,7 @@ class App:
         pass
 
     def _on_char(self, window, codepoint):
+        self.request_redraw()
         self.impl.char_callback(window, codepoint)
         self.on_char(codepoint)
 
@@ -111,6 +141,7 @@ class App:
         pass
 
     def _on_mouse_move(self, window, x, y):
+        self.request_redraw()
         self.impl.mouse_callback(window, x, y)
         self.on_mouse_move(x, y)
 
@@ -118,6 +149,7 @@ class App:
         pass
 
     def _on_mouse_button(self, window, button, action, mods):
+        self.request_redraw()
         if not imgui.get_io().want_capture_mouse:
             self.on_mouse_button(button, action, mods)
 
@@ -125,6 +157,7 @@ class App:
         pass
 
     def _on_scroll(self, window, xoffset, yoffset):
+        self.request_redraw()
         self.impl.scroll_callback(window, xoffset, yoffset)
         self.on_scroll(xoffset, yoffset)
 
@@ -132,6 +165,7 @@ class App:
         pass
 
     def _on_resize(self, window, width, height):
+        self.request_redraw()
         self.impl.resize_callback(window, width, height)
         self.on_resize(width, height)
 
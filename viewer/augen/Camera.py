@@ -21,10 +21,17 @@
 # in the Software.
 
 import numpy as np
-from scipy.spatial.transform import Rotation
 
 from .utils import perspective
 
+def rotation_x(angle):
+    c, s = np.cos(angle), np.sin(angle)
+    return np.array([[1, 0, 0], [0, c, -s], [0, s, c]])
+
+def rotation_y(angle):
+    c, s = np.cos(angle), np.sin(angle)
+    return np.array([[c, 0, s], [0, 1, 0], [-s, 0, c]])
+
 class Camera:
     def __init__(self, width, height):
         self.sensitivity = 0.01
@@ -32,7 +39,7 @@ class Camera:
         self.momentum = 0.93
 
         self._zoom = 2
-        self.rot = Rotation.identity()
+        self.rot = np.eye(3)
         self.previous_mouse_pos = None
         self.angular_velocity = None
         self.rot_around_vertical = 0
@@ -49,12 +56,10 @@ class Camera:
         if self.previous_mouse_pos is None and self.angular_velocity is not None:
             self._damping()
 
-        self.rot = Rotation.identity()
-        self.rot *= Rotation.from_rotvec(self.rot_around_horizontal * np.array([1,0,0]))
-        self.rot *= Rotation.from_rotvec(self.rot_around_vertical * np.array([0,1,0]))
+        self.rot = rotation_x(self.rot_around_horizontal) @ rotation_y(self.rot_around_vertical)
 
         viewMatrix = np.eye(4)
-        viewMatrix[:3,:3] = self.rot.as_matrix()
+        viewMatrix[:3,:3] = self.rot
         viewMatrix[0:3,3] = 0, 0, -self._zoom
         self.viewMatrix = viewMatrix
 
@@ -64,6 +69,10 @@ class Camera:
         if "uViewMatrix" in program:
             program["uViewMatrix"].write(self.viewMatrix.T.astype('f4').tobytes())
 
+    def is_moving(self):
+        """True while the camera is being dragged or is still damping"""
+        return self.previous_mouse_pos is not None or self.angular_velocity is not None
+
     def start_rotation(self, x, y):
         self.previous_mouse_pos = x, y
 
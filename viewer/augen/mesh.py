@@ -20,15 +20,62 @@
 # from, out of or in connection with the software or the use or other dealings
 # in the Software.
 
+import hashlib
 import numpy as np
 from moderngl import TRIANGLES
 
+def triangulate(face_sizes, corner_points):
+    """Fan-triangulate polygons given by their sizes and the point index of
+    each of their corners. Return a (T, 3) array of point indices.
+    Faces with less than 3 corners are skipped."""
+    face_sizes = np.asarray(face_sizes, dtype=np.int64)
+    corner_points = np.asarray(corner_points)
+    face_starts = np.zeros(len(face_sizes), dtype=np.int64)
+    np.cumsum(face_sizes[:-1], out=face_starts[1:])
+    triangle_counts = np.maximum(face_sizes - 2, 0)
+    triangle_faces = np.repeat(np.arange(len(face_sizes)), triangle_counts)
+    triangle_offsets = np.zeros(len(face_sizes), dtype=np.int64)
+    np.cumsum(triangle_counts[:-1], out=triangle_offsets[1:])
+    # Index of each triangle within its face, starting at 1
+    i = np.arange(len(triangle_faces)) - triangle_offsets[triangle_faces] + 1
+    first = face_starts[triangle_faces]
+    corners = np.stack([first, first + i, first + i + 1], axis=1)
+    return corner_points[corners]
+
+
 class Mesh:
-    """Simply contains an array of triangles and an array of normals.
-    Could be enhanced, for instance with an element buffer"""
-    def __init__(self, P, N):
+    """Contains an array of vertices P and an array of normals N. If indices
+    is None, each consecutive triple of vertices is a triangle, otherwise
+    indices is a (T, 3) array of vertex indices (an element buffer)."""
+    def __init__(self, P, N, indices=None):
         self.P = P
         self.N = N
+        self.indices = indices
+
+    @classmethod
+    def from_faces(cls, points, face_sizes, corner_points, smooth=True):
+        """Build a mesh from polygons. With smooth normals, points are shared
+        by triangles through indices and get area-weighted normals, otherwise
+        vertices are duplicated per triangle to get flat normals."""
+        points = np.array(points, dtype=np.float32).reshape(-1, 3)
+        triangles = triangulate(face_sizes, corner_points)
+        A, B, C = (points[triangles[:, k]] for k in range(3))
+        face_normals = np.cross(B - A, C - A)
+        if smooth:
+            N = np.zeros_like(points)
+            for k in range(3):
+                np.add.at(N, triangles[:, k], face_normals)
+            return cls(points, normalized(N), triangles.astype(np.uint32))
+        else:
+            P = np.stack([A, B, C], axis=1).reshape(-1, 3)
+            N = np.repeat(normalized(face_normals), 3, axis=0)
+            return cls(P, N)
+
+
+def normalized(V):
+    """Normalize rows of V, leaving null vectors as is"""
+    norms = np.linalg.norm(V, axis=1, keepdims=True)
+    return V / np.where(norms > 0, norms, 1)
 
 
 class ObjMesh(Mesh):
@@ -36,6 +83,7 @@ class ObjMesh(Mesh):
     Only load the first mesh of the file if there are more than one."""
     def __init__(self, filepath):
         import pywavefront
+        self.filepath = filepath
         print(f"Loading mesh from {filepath}...")
         scene = pywavefront.Wavefront(filepath)
         for name, material in scene.materials.items():
@@ -43,29 +91,90 @@ class ObjMesh(Mesh):
             data = np.array(material.vertices).reshape(-1, 6)
             self.P = data[:,3:]
             self.N = data[:,:3]
+            self.indices = None
             break
         print(f"(Object has {len(self.P)//3} points)")
 
 
 class RenderedMesh:
     """The equivalent of a Mesh, but stored in OpenGL buffers (on the GPU)
-    ready to be rendered."""
+    ready to be rendered. Use update() to display another mesh, which reuses
+    the same buffers rather than allocating new ones."""
+    streams = ("P", "N", "indices")
+
     def __init__(self, ctx, mesh, program):
+        self.ctx = ctx
+        self.program = program
+        self.mesh = None
+        self.digests = {}
+        self.element_count = 0
+        self.vboP = self._create_buffer()
+        self.vboN = self._create_buffer()
+        self.ibo = self._create_buffer()
+        self.vao = None
+        self.indexed = None
+        self.update(mesh)
+
+    def _create_buffer(self):
+        return self.ctx.buffer(reserve=4, dynamic=True)
+
+    def _ensure_vertex_array(self, indexed):
+        if self.vao is not None and self.indexed == indexed:
+            return
+        if self.vao is not None:
+            self.vao.release()
+        content = [
+            (self.vboP, "3f", "in_vert"),
+            (self.vboN, "3f", "in_normal"),
+        ]
+        if indexed:
+            self.vao = self.ctx.vertex_array(self.program, content, index_buffer=self.ibo, index_element_size=4)
+        else:
+            self.vao = self.ctx.vertex_array(self.program, content)
+        self.indexed = indexed
+
+    def update(self, mesh, streams=None):
+        """Display a new mesh. Only the streams listed (among "P", "N" and
+        "indices") are uploaded, by default those whose content differs from
+        what was last uploaded (compared by digest, since cooked meshes are
+        rebuilt into new arrays each time). Buffers are written in place when
+        large enough, otherwise their storage is orphaned and grown
+        geometrically, so that repeated updates do not reallocate."""
+        check_digests = streams is None
+        if streams is None:
+            streams = self.streams
+        buffers = { "P": self.vboP, "N": self.vboN, "indices": self.ibo }
+        for name in streams:
+            array = getattr(mesh, name)
+            if array is None:
+                self.digests.pop(name, None)
+                continue
+            dtype = 'u4' if name == "indices" else 'f4'
+            data = np.ascontiguousarray(array, dtype=dtype)
+            digest = hashlib.blake2b(data, digest_size=16).digest()
+            if check_digests and self.digests.get(name) == digest:
+                continue
+            self._upload(buffers[name], data)
+            self.digests[name] = digest
+        indexed = mesh.indices is not None
+        self._ensure_vertex_array(indexed)
         self.mesh = mesh
-        self.vboP = ctx.buffer(mesh.P.astype('f4').tobytes())
-        self.vboN = ctx.buffer(mesh.N.astype('f4').tobytes())
-        self.vao = ctx.vertex_array(
-            program,
-            [
-                (self.vboP, "3f", "in_vert"),
-                (self.vboN, "3f", "in_normal"),
-            ]
-        )
+        self.element_count = np.size(mesh.indices) if indexed else len(mesh.P)
+
+    def _upload(self, buffer, data):
+        size = data.nbytes
+        if size > buffer.size:
+            buffer.orphan(max(size, 2 * buffer.size))
+        if size > 0:
+            buffer.write(data)
 
     def release(self):
         self.vboP.release()
         self.vboN.release()
-        self.vao.release()
+        self.ibo.release()
+        if self.vao is not None:
+            self.vao.release()
 
     def render(self, ctx):
-        self.vao.render(TRIANGLES)
+        if self.element_count > 0:
+            self.vao.render(TRIANGLES, vertices=self.element_count)
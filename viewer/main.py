@@ -34,30 +34,31 @@ import sys
 from os.path import realpath, dirname
 sys.path.append(dirname(dirname(realpath(__file__))))
 
-from openmfx import OfxHost, OfxPluginLibrary, OfxMeshEffectInternal, OfxMeshEffect, OfxMeshInternal
+from openmfx import OfxHost, OfxPluginLibrary, OfxMeshEffectInternal, OfxMeshEffect, OfxMeshInternal, cook_effect
 from openmfx import constants as kOfx
+from openmfx_validate import validate_mesh
 
-import ctypes
 from ctypes import byref
 from copy import deepcopy
-
-default_param_value = {
-    kOfx.ParamTypeInteger: 0,
-    kOfx.ParamTypeDouble: 0.0,
-    kOfx.ParamTypeBoolean: False,
-    kOfx.ParamTypeChoice: 0,
-    kOfx.ParamTypeRGBA: (0.0, 0.0, 0.0, 1.0),
-    kOfx.ParamTypeRGB: (0.0, 0.0, 0.0),
-    kOfx.ParamTypeDouble2D: (0.0, 0.0),
-    kOfx.ParamTypeInteger2D: (0, 0),
-    kOfx.ParamTypeDouble3D: (0.0, 0.0, 0.0),
-    kOfx.ParamTypeInteger3D: (0, 0, 0),
-    kOfx.ParamTypeString: "",
-    kOfx.ParamTypeCustom: 0,
-    kOfx.ParamTypeGroup: 0,
-    kOfx.ParamTypePage: 0,
-    kOfx.ParamTypePushButton: 0,
-}
+import os
+
+def build_input_mesh(P):
+    """Build an OfxMeshInternal from a triangle soup (three consecutive
+    vertices per triangle), welding vertices that have the same position so
+    that triangles share their points."""
+    P = np.asarray(P, dtype=np.float32).reshape(-1, 3)
+    points, corner_points = np.unique(P, axis=0, return_inverse=True)
+
+    mesh = OfxMeshInternal()
+    mesh.point_count = len(points)
+    mesh.corner_count = len(P)
+    mesh.face_count = len(P) // 3
+    mesh.allocate()
+    mesh.as_array(kOfx.MeshAttribPoint, kOfx.MeshAttribPointPosition)[:] = points
+    mesh.as_array(kOfx.MeshAttribCorner, kOfx.MeshAttribCornerPoint)[:] = corner_points.reshape(-1)
+    mesh.as_array(kOfx.MeshAttribFace, kOfx.MeshAttribFaceSize)[:] = 3
+    mesh.touch()
+    return mesh
 
 class MyApp(App):
     def init(self):
@@ -85,6 +86,7 @@ class MyApp(App):
         # OpenMfx
         self.host = OfxHost()
         self.lib = None
+        self.plugin_identifiers = []  # cached for the UI, updated when the library changes
         self.current_plugin_index = -1
         self.plugin = None
         self.plugin_loaded = False
@@ -92,6 +94,8 @@ class MyApp(App):
         self.instance = None
         self.parameter_changed = False
         self.input_mesh = None
+        self.input_mesh_cache = {}  # (source file, modification time) -> OfxMeshInternal
+        self.smooth_normals = True
 
     def update(self, time, delta_time):
         # Update damping effect (and internal matrices)
@@ -100,6 +104,10 @@ class MyApp(App):
         if self.parameter_changed:
             self.cook()
 
+    def is_animating(self):
+        # Pending cooks are run at next update
+        return self.camera.is_moving() or self.parameter_changed
+
     def render(self):
         ctx = self.ctx
         self.camera.set_uniforms(self.program)
@@ -174,6 +182,10 @@ class MyApp(App):
         if self.lib is None:
             return
 
+        imgui.same_line()
+        if imgui.button("Reload"):
+            self.reload_plugin_library()
+
         imgui.same_line()
         if imgui.button("Unload"):
             self.unload_plugin_library()
@@ -181,14 +193,8 @@ class MyApp(App):
         if self.lib is None:
             return
 
-        n = self.lib.OfxGetNumberOfPlugins()
-        imgui.text(f"Found {n} plugins:")
-        all_idents = []
-        for i in range(n):
-            plugin = self.lib.OfxGetPlugin(i)
-            ident = plugin.pluginIdentifier.decode()
-            #imgui.bullet_text(f"{ident}")
-            all_idents.append(ident)
+        all_idents = self.plugin_identifiers
+        imgui.text(f"Found {len(all_idents)} plugins:")
 
         clicked, new_current_plugin_index = imgui.listbox(
             "", self.current_plugin_index, all_idents, len(all_idents) + 1
@@ -252,12 +258,12 @@ class MyApp(App):
                 changed, param.value[0] = imgui.drag_int(label, param.value[0])
             elif param.type == kOfx.ParamTypeDouble:
                 #imgui.slider_float(param.name, param.value, min_value, max_value)
-                changed, param.value = imgui.drag_float(label, param.value)
+                changed, param.value = imgui.drag_float(label, param.value[0])
             elif param.type == kOfx.ParamTypeBoolean:
-                changed, param.value = imgui.checkbox(label, param.value)
+                changed, param.value = imgui.checkbox(label, param.value[0])
             elif param.type == kOfx.ParamTypeChoice:
                 options = ["foo", "bar"]
-                clicked, param.value = imgui.combo(label, param.value, options)
+                changed, param.value = imgui.combo(label, param.value[0], options)
             elif param.type == kOfx.ParamTypeRGBA:
                 changed, param.value = imgui.color_edit4(label, *param.value)
             elif param.type == kOfx.ParamTypeRGB:
@@ -271,7 +277,7 @@ class MyApp(App):
             elif param.type == kOfx.ParamTypeInteger3D:
                 changed, param.value = imgui.drag_int3(label, *param.value)
             elif param.type == kOfx.ParamTypeString:
-                changed, param.value = imgui.input_text(label, param.value, 1024)
+                changed, param.value = imgui.input_text(label, param.value[0].decode(), 1024)
             elif param.type == kOfx.ParamTypeCustom:
                 imgui.bullet_text(f"{label} ({param.type.decode()[12:]})")
             elif param.type == kOfx.ParamTypeGroup:
@@ -282,36 +288,61 @@ class MyApp(App):
                 changed = imgui.button(label)
             self.parameter_changed = self.parameter_changed or changed
 
+        imgui.separator()
+        changed, self.smooth_normals = imgui.checkbox("Smooth normals", self.smooth_normals)
+        self.parameter_changed = self.parameter_changed or changed
+
     def unload_plugin_library(self):
         self.unload_plugin()
         if self.lib is not None:
             self.lib.close()
             self.lib = None
+            self.plugin_identifiers = []
             self.unload_plugin()
             self.plugin = None
 
     def load_plugin_library(self):
         self.unload_plugin_library()
-        self.lib = OfxPluginLibrary(self.plugin_library_path)
+        self.lib = OfxPluginLibrary(self.plugin_library_path, hot_reload=True)
+        self.current_plugin_index = -1
+        self.update_plugin_identifiers()
+
+    def update_plugin_identifiers(self):
+        self.plugin_identifiers = [
+            self.lib.OfxGetPlugin(i).pluginIdentifier.decode()
+            for i in range(self.lib.OfxGetNumberOfPlugins())
+        ]
+
+    def reload_plugin_library(self):
+        """Load the new build of the library if it changed on disk"""
+        if self.lib is None or not self.lib.has_changed():
+            return
+        plugin_index = self.current_plugin_index
+        self.unload_plugin()
+        self.plugin = None
         self.current_plugin_index = -1
+        self.lib.reload()
+        self.update_plugin_identifiers()
+        if 0 <= plugin_index < self.lib.OfxGetNumberOfPlugins():
+            self.set_current_plugin(plugin_index)
 
     def unload_plugin(self):
         self.destroy_instance()
         if self.plugin_loaded:
-            status = self.plugin.mainEntry(kOfx.ActionLoad, None, None, None)
+            status = self.host.mainEntry(self.plugin, kOfx.ActionUnload, None, None, None)
         self.plugin_loaded = False
         self.descriptor = None
 
     def load_plugin(self):
         if self.plugin is None:
             return
-        status = self.plugin.mainEntry(kOfx.ActionLoad, None, None, None)
+        status = self.host.mainEntry(self.plugin, kOfx.ActionLoad, None, None, None)
         self.plugin_loaded = status == kOfx.StatOK
 
     def describe_plugin(self):
         py_descriptor = OfxMeshEffectInternal()
         self.descriptor = OfxMeshEffect(py_descriptor)
-        status = self.plugin.mainEntry(kOfx.ActionDescribe, byref(self.descriptor), None, None)
+        status = self.host.mainEntry(self.plugin, kOfx.ActionDescribe, byref(self.descriptor), None, None)
         if status != kOfx.StatOK:
             print(f"Could not describe effect: {status}")
             self.descriptor = None
@@ -319,7 +350,7 @@ class MyApp(App):
     def destroy_instance(self):
         if self.instance is None:
             return
-        status = self.plugin.mainEntry(kOfx.ActionDestroyInstance, byref(self.instance), None, None)
+        status = self.host.mainEntry(self.plugin, kOfx.ActionDestroyInstance, byref(self.instance), None, None)
         print(f"OfxActionCreateInstance status = {status}")
         self.instance = None
 
@@ -331,13 +362,10 @@ class MyApp(App):
         py_instance = deepcopy(py_descriptor)
 
         for param in py_instance.params.values():
-            if kOfx.ParamPropDefault in param.properties:
-                param.value = deepcopy(param.properties[kOfx.ParamPropDefault])
-            else:
-                param.value = deepcopy(default_param_value[param.type])
+            param.resetToDefault()
 
         self.instance = OfxMeshEffect(py_instance)
-        status = self.plugin.mainEntry(kOfx.ActionCreateInstance, byref(self.instance), None, None)
+        status = self.host.mainEntry(self.plugin, kOfx.ActionCreateInstance, byref(self.instance), None, None)
         if status != kOfx.StatOK:
             print(f"Could not create effect instance: {status}")
             self.instance = None
@@ -358,53 +386,35 @@ class MyApp(App):
         py_instance = self.instance.internal
         py_instance.inputs[kOfx.MeshMainInput].mesh = self.input_mesh
 
-        status = self.plugin.mainEntry(kOfx.MeshEffectActionCook, byref(self.instance), None, None)
+        status = cook_effect(self.plugin, self.instance, host=self.host)
         print(f"OfxActionCook status = {status}")
 
         output_mesh = py_instance.inputs[kOfx.MeshMainOutput].mesh
         py_instance.inputs[kOfx.MeshMainOutput].mesh = OfxMeshInternal()
 
-        # TODO: optimize this
         print(f"Output mesh: {output_mesh.point_count} points, {output_mesh.corner_count} corners and {output_mesh.face_count} faces")
-        P = np.empty((output_mesh.corner_count, 3), dtype=float)
-        N = np.empty((output_mesh.corner_count, 3), dtype=float)
-        point_attr = output_mesh.attributes[kOfx.MeshAttribPoint][kOfx.MeshAttribPointPosition]
-        corner_attr = output_mesh.attributes[kOfx.MeshAttribCorner][kOfx.MeshAttribCornerPoint]
-        point_attr_data = ctypes.cast(point_attr.data, ctypes.POINTER(ctypes.c_float * 3))
-        corner_attr_data = ctypes.cast(corner_attr.data, ctypes.POINTER(ctypes.c_int))
-        assert(output_mesh.corner_count >= 3 * output_mesh.face_count)
-        for f in range(output_mesh.face_count):
-            for c in range(3):
-                index = corner_attr_data[3 * f + c]
-                P[3 * f + c] = point_attr_data[index]
-            A = P[3 * f + 0]
-            AB = P[3 * f + 1] - A
-            AC = P[3 * f + 2] - A
-            normal = np.cross(AB, AC)
-            normal = normal / np.linalg.norm(normal)
-            for c in range(3):
-                N[3 * f + c] = normal
-        viz_mesh = Mesh(P, N)
-        self.rendered_mesh = RenderedMesh(self.ctx, viz_mesh, self.program)
+        report = validate_mesh(output_mesh)
+        if not report.ok:
+            print(f"Invalid output mesh, not displayed:\n{report}")
+            return
+        viz_mesh = Mesh.from_faces(
+            output_mesh.as_array(kOfx.MeshAttribPoint, kOfx.MeshAttribPointPosition),
+            output_mesh.as_array(kOfx.MeshAttribFace, kOfx.MeshAttribFaceSize),
+            output_mesh.as_array(kOfx.MeshAttribCorner, kOfx.MeshAttribCornerPoint),
+            smooth=self.smooth_normals,
+        )
+        self.rendered_mesh.update(viz_mesh)
 
     def ensure_input_mesh(self):
         if self.input_mesh is not None:
             return
-        mesh = OfxMeshInternal()
-        mesh.point_count = len(self.mesh.P)
-        mesh.corner_count = mesh.point_count
-        mesh.face_count = mesh.point_count // 3
-        mesh.allocate()
-        # TODO: optimize this
-        attr = mesh.attributes[kOfx.MeshAttribPoint][kOfx.MeshAttribPointPosition]
-        attr.py_data[:] = [tuple(x for x in xyz) for xyz in self.mesh.P]
-
-        attr = mesh.attributes[kOfx.MeshAttribCorner][kOfx.MeshAttribCornerPoint]
-        attr.py_data[:] = np.arange(mesh.corner_count, dtype=int).tolist()
-
-        attr = mesh.attributes[kOfx.MeshAttribFace][kOfx.MeshAttribFaceSize]
-        attr.py_data[:] = (np.ones(mesh.face_count, dtype=int) * 3).tolist()
-
+        filepath = os.path.realpath(self.mesh.filepath)
+        key = (filepath, os.path.getmtime(filepath))
+        mesh = self.input_mesh_cache.get(key)
+        if mesh is None:
+            mesh = build_input_mesh(self.mesh.P)
+            print(f"Input mesh: {mesh.point_count} points, {mesh.face_count} faces")
+            self.input_mesh_cache[key] = mesh
         self.input_mesh = mesh
 
 def main():